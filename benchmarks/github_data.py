@@ -0,0 +1,70 @@
+"""
+Synthetic GitHub API data for benchmarks
+"""
+
+
+def user(login):
+    return {
+        'login': login,
+        'id': 1234567,
+        'node_id': 'MDQ6VXNlcjEyMzQ1Njc=',
+        'avatar_url': f'https://avatars.githubusercontent.com/u/{login}?v=4',
+        'html_url': f'https://github.com/{login}',
+        'type': 'User',
+        'site_admin': False,
+    }
+
+
+def repo(name):
+    return {
+        'id': 7654321,
+        'name': name,
+        'full_name': f'owner/{name}',
+        'owner': user('owner'),
+        'private': False,
+        'html_url': f'https://github.com/owner/{name}',
+        'description': 'Repository used for benchmarking ' * 4,
+        'fork': False,
+        'url': f'https://api.github.com/repos/owner/{name}',
+        **{f'{key}_url': f'https://api.github.com/repos/owner/{name}/{key}'
+           for key in ('forks', 'keys', 'collaborators', 'teams', 'hooks',
+                       'issue_events', 'events', 'assignees', 'branches',
+                       'tags', 'blobs', 'git_tags', 'git_refs', 'trees',
+                       'statuses', 'languages', 'stargazers', 'contributors',
+                       'subscribers', 'subscription', 'commits', 'comments',
+                       'issue_comment', 'contents', 'compare', 'merges',
+                       'archive', 'downloads', 'issues', 'pulls',
+                       'milestones', 'notifications', 'labels', 'releases',
+                       'deployments')},
+        'stargazers_count': 42,
+        'open_issues_count': 7,
+        'default_branch': 'master',
+    }
+
+
+def pull_request(number):
+    return {
+        'url': f'https://api.github.com/repos/owner/repo/pulls/{number}',
+        'id': 100000 + number,
+        'html_url': f'https://github.com/owner/repo/pull/{number}',
+        'number': number,
+        'state': 'open',
+        'title': f'Pull request number {number}',
+        'user': user('contributor'),
+        'body': 'Description of the change. ' * 20,
+        'labels': [{'id': i, 'name': f'label{i}', 'color': 'ededed',
+                    'default': False} for i in range(3)],
+        'created_at': '2018-10-01T12:00:00Z',
+        'updated_at': '2018-10-02T12:00:00Z',
+        'head': {'label': 'contributor:branch', 'ref': 'branch',
+                 'sha': 'a' * 40, 'user': user('contributor'),
+                 'repo': repo('repo')},
+        'base': {'label': 'owner:master', 'ref': 'master',
+                 'sha': 'b' * 40, 'user': user('owner'),
+                 'repo': repo('repo')},
+        'author_association': 'CONTRIBUTOR',
+    }
+
+
+def pull_requests_page(start=0, size=100):
+    return [pull_request(n) for n in range(start, start + size)]
@@ -0,0 +1,39 @@
+"""
+Benchmark import time of filabel CLI and web application
+
+    $ python benchmarks/importtime.py [MODULE ...]
+"""
+import subprocess
+import sys
+
+
+def importtime(module):
+    """
+    Import module in fresh interpreter with -X importtime, returns
+    dict of module name to (self, cumulative) import time in seconds
+    """
+    cp = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+    times = {}
+    for line in cp.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+    return times
+
+
+def main(modules=('filabel', 'filabel.web')):
+    for module in modules:
+        times = importtime(module)
+        total = times[module][1]
+        print(f'{module}: {total * 1000:.1f} ms, {len(times)} modules')
+        slowest = sorted(times.items(), key=lambda i: i[1][0], reverse=True)
+        for name, (own, _) in slowest[:10]:
+            print(f'  {own * 1000:7.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ('filabel', 'filabel.web'))
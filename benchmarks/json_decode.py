@@ -0,0 +1,34 @@
+"""
+Benchmark JSON decoders on a page of 100 pull requests
+
+    $ python benchmarks/json_decode.py
+"""
+import json
+import timeit
+
+from filabel.utils import json_decoder
+
+from github_data import pull_requests_page
+
+
+def main(number=50):
+    page = json.dumps(pull_requests_page()).encode('utf-8')
+    print(f'Page of 100 PRs: {len(page) / 1024:.0f} KiB')
+    results = {}
+    for name in ('json', 'orjson'):
+        try:
+            loads = json_decoder(name)
+        except ValueError:
+            print(f'{name:>8}: not installed')
+            continue
+        assert loads(page) == json.loads(page)
+        best = min(timeit.repeat(lambda: loads(page), number=number,
+                                 repeat=5)) / number
+        results[name] = best
+        print(f'{name:>8}: {best * 1000:.2f} ms per page')
+    if len(results) == 2:
+        print(f' speedup: {results["json"] / results["orjson"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
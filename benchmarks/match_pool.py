@@ -0,0 +1,39 @@
+"""
+Benchmark matching files of huge PRs in-process and in worker processes
+
+    $ python benchmarks/match_pool.py [PROCESSES]
+"""
+import sys
+import time
+
+from filabel.matching import MatchPool, Matcher
+
+
+def labels(number=200):
+    return {f'label{n}': [f'component{n}/*', f'*/module{n}/*.py',
+                          f'docs/component{n}/*']
+            for n in range(number)}
+
+
+def filenames(number=20000):
+    return [f'component{n % 700}/module{n % 900}/file{n}.py'
+            for n in range(number)]
+
+
+def main(processes=4):
+    matcher = Matcher(labels())
+    files = filenames()
+    start = time.perf_counter()
+    expected = matcher.count(files)
+    print(f'in-process: {time.perf_counter() - start:.2f} s')
+
+    pool = MatchPool(matcher, processes)
+    pool.count(matcher, files)  # start workers
+    start = time.perf_counter()
+    assert pool.count(matcher, files) == expected
+    print(f'{processes} processes: {time.perf_counter() - start:.2f} s')
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""
+Benchmark memory held by listing of pull requests, full JSON objects
+versus compact PullRequest records
+
+    $ python benchmarks/pr_records.py [NUMBER_OF_PRS]
+"""
+import json
+import sys
+import tracemalloc
+
+from filabel.logic import PullRequest
+from filabel.utils import json_loads
+
+from github_data import pull_requests_page
+
+
+def pages(number):
+    for start in range(0, number, 100):
+        yield json.dumps(pull_requests_page(start)).encode('utf-8')
+
+
+def full_objects(pages):
+    prs = []
+    for page in pages:
+        prs += json_loads(page)
+    return prs
+
+
+def records(pages):
+    return [PullRequest.from_json(d) for page in pages
+            for d in json_loads(page)]
+
+
+def measure(function, raw_pages):
+    tracemalloc.start()
+    result = function(raw_pages)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak
+
+
+def main(number=4000):
+    raw_pages = list(pages(number))
+    print(f'{number} PRs in {len(raw_pages)} pages')
+    for function in (full_objects, records):
+        retained, peak = measure(function, raw_pages)
+        print(f'{function.__name__:>12}: '
+              f'retained {retained / 2**20:7.1f} MiB, '
+              f'peak {peak / 2**20:7.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,5 +1,15 @@
 from filabel.cli import cli
-from filabel.web import create_app
 from filabel.logic import GitHub, Filabel
 
-__all__ = ['cli', 'create_app', 'GitHub', 'Filabel']
+__all__ = ['cli', 'create_app', 'create_asgi_app', 'GitHub', 'Filabel']
+
+
+def __getattr__(name):
+    # Flask app is imported only when needed, CLI does not need Flask
+    if name == 'create_app':
+        from filabel.web import create_app
+        return create_app
+    if name == 'create_asgi_app':
+        from filabel.asgi import create_asgi_app
+        return create_asgi_app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
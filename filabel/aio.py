@@ -0,0 +1,485 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import time
+
+from filabel.events import REQUEST_END, REQUEST_START, endpoint_template
+from filabel.events import events as default_events
+from filabel.logic import GitHub, PullRequest
+from filabel.tokens import TokenPool
+from filabel.utils import DeadlineExceeded
+from filabel.utils import json_loads as default_json_loads
+
+#: Deadline of current task (see AsyncGitHub.deadline)
+_deadline = contextvars.ContextVar('filabel_deadline', default=None)
+
+
+async def run_blocking(function, *args):
+    """
+    Run blocking function in thread pool, so it does not stall
+    the event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None, function, *args
+    )
+
+
+class AsyncGitHub:
+    """
+    GitHub API client for asyncio, requests of many concurrent tasks
+    share one connection pool (needs httpx)
+    """
+    API = GitHub.API
+
+    def __init__(self, token, json_loads=None, timeout=None, events=None,
+                 max_connections=100):
+        """
+        token: GitHub token or list of tokens to be used in turns
+        json_loads: optional function decoding JSON responses
+        timeout: optional timeout of every request in seconds
+        events: optional Events to emit request events to
+                (default: filabel.events.events)
+        max_connections: maximal number of connections to GitHub
+        """
+        self.tokens = TokenPool([token] if isinstance(token, str) else token)
+        self.token = self.tokens.tokens[0]
+        #: Token pools by rate limit resource, the core one is self.tokens
+        self.pools = {'core': self.tokens}
+        #: Rate limit resources reported by GitHub for endpoints
+        self.resources = {}
+        self.json_loads = json_loads or default_json_loads
+        self.timeout = timeout
+        self.events = default_events if events is None else events
+        self.max_connections = max_connections
+        #: Requests left in current core rate limit window of the best token
+        #: (None until known)
+        self.rate_remaining = None
+        #: Time (epoch) the rate limit window resets
+        self.rate_reset = None
+        #: Time (epoch) of last successful and failed request
+        self.last_success = None
+        self.last_failure = None
+        self.requests = 0
+        self._client = None
+
+    @property
+    def client(self):
+        """
+        HTTP client, created on first request (in the event loop)
+        """
+        if self._client is None:
+            import httpx  # only the async web service needs httpx
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': 'filabel'},
+                limits=httpx.Limits(max_connections=self.max_connections),
+            )
+        return self._client
+
+    async def aclose(self):
+        """
+        Close connections of the client
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @contextlib.contextmanager
+    def deadline(self, deadline):
+        """
+        Limit requests made by current task in this context by deadline,
+        timeouts of requests never exceed the remaining time
+
+        deadline: Deadline or None for no limit
+        """
+        token = _deadline.set(deadline)
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Send request with timeout respecting deadline of current task
+        """
+        timeout = self.timeout
+        deadline = _deadline.get()
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f'No time left for {method} {url}')
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if self.events.active:
+            return await self._instrumented_request(method, url, kwargs)
+        return await self._send(method, url, kwargs)
+
+    async def _send(self, method, url, kwargs):
+        """
+        Send request authorized by token with the most requests left,
+        request refused for rate limit is retried with another token
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        pool = self._pool(self._resource(url))
+        for _ in range(len(self.tokens)):
+            token = pool.choose()
+            headers['Authorization'] = 'token ' + token
+            try:
+                r = await self.client.request(method, url, headers=headers,
+                                              **kwargs)
+            except Exception:
+                self.last_failure = time.time()
+                raise
+            self.requests += 1
+            throttled = self._track(r, url, token)
+            # the response may have told the resource of the endpoint
+            pool = self._pool(self._resource(url))
+            if not throttled or not pool.available():
+                break
+        return r
+
+    async def _instrumented_request(self, method, url, kwargs):
+        """
+        Send request emitting request events
+        """
+        endpoint = endpoint_template(url)
+        self.events.emit(REQUEST_START, method=method,
+                         endpoint=endpoint, url=url)
+        start = time.perf_counter()
+        try:
+            r = await self._send(method, url, kwargs)
+        except Exception as e:
+            self.events.emit(REQUEST_END, method=method,
+                             endpoint=endpoint, url=url, status=None, bytes=0,
+                             duration=time.perf_counter() - start, error=e)
+            raise
+        self.events.emit(REQUEST_END, method=method, endpoint=endpoint,
+                         url=url, status=r.status_code, bytes=len(r.content),
+                         duration=time.perf_counter() - start, error=None)
+        return r
+
+    # responses of httpx and requests have the same interface
+    _track = GitHub._track
+    _resource = GitHub._resource
+    _pool = GitHub._pool
+
+    async def _json_get(self, url, params=None):
+        r = await self._request('GET', url, params=params)
+        r.raise_for_status()
+        return self.json_loads(r.content)
+
+    async def _paginated_json_get(self, url, params=None):
+        items = []
+        while url is not None:
+            r = await self._request('GET', url, params=params)
+            r.raise_for_status()
+            items += self.json_loads(r.content)
+            url = r.links.get('next', {}).get('url')
+            params = None  # already included in next URL
+        return items
+
+    async def user(self):
+        """
+        Get current user authenticated by token
+        """
+        return await self._json_get(f'{self.API}/user')
+
+    async def pr_files(self, owner, repo, number):
+        """
+        Get files of one Pull Request
+
+        owner: GtiHub user or org
+        repo: repo name
+        number: PR number/id
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/pulls/{number}/files'
+        return await self._paginated_json_get(url, {'per_page': 100})
+
+    async def compare(self, owner, repo, base, head):
+        """
+        Compare two commits (GitHub lists at most 300 changed files)
+
+        owner: GtiHub user or org
+        repo: repo name
+        base: base commit SHA
+        head: head commit SHA
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/compare/{base}...{head}'
+        return await self._json_get(url)
+
+    async def contents(self, owner, repo, path, etag=None):
+        """
+        Get file from default branch of repo using conditional request,
+        returns tuple (status, etag, json) where json is None unless
+        status is 200 (304 when not modified, 404 when not found)
+
+        owner: GtiHub user or org
+        repo: repo name
+        path: path of the file in repo
+        etag: optional ETag of previously fetched file
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/contents/{path}'
+        headers = {'If-None-Match': etag} if etag else {}
+        r = await self._request('GET', url, headers=headers)
+        if r.status_code in (304, 404):
+            return r.status_code, etag, None
+        r.raise_for_status()
+        return r.status_code, r.headers.get('ETag'), self.json_loads(r.content)
+
+    async def reset_labels(self, owner, repo, number, labels):
+        """
+        Set's labels for Pull Request. Replaces all existing lables.
+
+        owner: GtiHub user or org
+        repo: repo name
+        lables: all lables this PR will have
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/issues/{number}'
+        r = await self._request('PATCH', url, json={'labels': labels})
+        r.raise_for_status()
+        return self.json_loads(r.content)['labels']
+
+    def stats(self):
+        """
+        Statistics of the client in this process (same keys
+        as SessionManager.stats)
+        """
+        pool = getattr(getattr(self._client, '_transport', None), '_pool',
+                       None)
+        return {
+            'pid': os.getpid(),
+            'sessions': int(self._client is not None),
+            'sessions_created': int(self._client is not None),
+            'requests': self.requests,
+            'connections': len(getattr(pool, 'connections', ())),
+            'pools': [],
+        }
+
+
+class AsyncFilabel:
+    """
+    Labels PRs of webhooks by Filabel configuration and caches,
+    talking to GitHub by AsyncGitHub
+    """
+    def __init__(self, filabel, github):
+        """
+        filabel: Filabel providing configuration, matcher and caches
+        github: AsyncGitHub for the requests
+        """
+        self.filabel = filabel
+        self.github = github
+
+    async def _blocking(self, function, *args):
+        """
+        Run blocking function in thread pool
+        """
+        return await run_blocking(function, *args)
+
+    async def matcher_for(self, owner, repo):
+        """
+        Matcher to be used for given repo
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        """
+        configs = self.filabel.repo_configs
+        if configs is None:
+            return self.filabel.matcher
+        cached, stale = configs.check(owner, repo)
+        if stale:
+            try:
+                response = await self.github.contents(
+                    owner, repo, configs.path, cached and cached.etag
+                )
+            except Exception:
+                response = None
+            cached = configs.update(owner, repo, cached, response)
+        return (cached and cached.matcher) or self.filabel.matcher
+
+    async def _new_pr_files(self, pr, files, matcher):
+        # matching is CPU bound (or waits for the match pool)
+        return await self._blocking(self.filabel._new_pr_files, pr, files,
+                                    matcher)
+
+    async def _fetch_pr_files(self, owner, repo, pr, matcher):
+        """
+        Fetch all files of PR
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        matcher: Matcher used for counting labels
+        """
+        files = None
+        if self.filabel.git_mirrors is not None:
+            files = await self._blocking(self.filabel._git_pr_files,
+                                         owner, repo, pr)
+        if files is None:
+            files = await self.github.pr_files(owner, repo, pr.number)
+        return await self._new_pr_files(pr, files, matcher)
+
+    async def _pr_matching_labels(self, owner, repo, pr, matcher,
+                                  before=None):
+        """
+        Find matching labels of PR, using and updating file cache
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        matcher: Matcher used for matching
+        before: optional SHA of PR head before synchronization
+        """
+        if self.filabel.file_cache is None:
+            pr_files = await self._fetch_pr_files(owner, repo, pr, matcher)
+            return pr_files.labels(matcher)
+
+        filabel = self.filabel
+        pr_files, updatable = filabel._cached_pr_files(owner, repo, pr, before)
+        if updatable is not None:
+            try:
+                comparison = await self.github.compare(
+                    owner, repo, updatable.head_sha, pr.head_sha
+                )
+                pr_files = await self._blocking(
+                    filabel._apply_comparison,
+                    updatable, comparison, pr.head_sha, matcher
+                )
+            except Exception:
+                pr_files = None
+        if pr_files is None:
+            pr_files = await self._fetch_pr_files(owner, repo, pr, matcher)
+        filabel._cache_pr_files(owner, repo, pr, pr_files)
+        return pr_files.labels(matcher)
+
+    async def plan_pr(self, owner, repo, pr, before=None):
+        """
+        Compute label changes of single given PR without applying them
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record (or PR as dict from GitHub API)
+        before: optional SHA of PR head before synchronization
+        """
+        if not isinstance(pr, PullRequest):
+            pr = PullRequest.from_json(pr)
+        matcher = await self.matcher_for(owner, repo)
+        start = time.perf_counter()
+        matching = await self._pr_matching_labels(owner, repo, pr, matcher,
+                                                  before)
+        return self.filabel._plan(owner, repo, pr, matcher, matching, start)
+
+    async def apply_plan(self, plan):
+        """
+        Apply planned label changes, returns the changes
+        or None if labels were not set as planned
+
+        plan: LabelPlan to be applied
+        """
+        owner, repo = plan.reposlug.split('/')
+        start = time.perf_counter()
+        new_labels = None
+        try:
+            new_labels = await self.github.reset_labels(
+                owner, repo, plan.number, list(plan.future)
+            )
+        finally:
+            result = self.filabel._written(plan, new_labels, start)
+        return result
+
+    async def run_pr(self, owner, repo, pr, before=None, deadline=None):
+        """
+        Manage labels for single given PR
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record (or PR as dict from GitHub API)
+        before: optional SHA of PR head before synchronization
+        deadline: optional Deadline limiting requests to GitHub
+        """
+        filabel = self.filabel
+        number = pr.number if isinstance(pr, PullRequest) else pr['number']
+        filabel._emit_pr_start(owner, repo, number)
+        result = None
+        with self.github.deadline(deadline):
+            start = time.monotonic()
+            try:
+                result = await self.apply_plan(
+                    await self.plan_pr(owner, repo, pr, before)
+                )
+            finally:
+                duration = time.monotonic() - start
+                filabel._emit_pr_end(owner, repo, number, duration, result)
+            filabel._record_pr_duration(duration)
+            return result
+
+
+class AsyncCachedGitHubUser:
+    """
+    GitHub user authenticated by token, fetched by background task
+    and cached for given time to live
+    """
+    def __init__(self, github, ttl=600, retry=30):
+        """
+        github: AsyncGitHub to fetch the user with
+        ttl: seconds after which the cached user is refreshed
+        retry: seconds after which a failed fetch is retried
+        """
+        self.github = github
+        self.ttl = ttl
+        self.retry = retry
+        self.user = None
+        self.error = None
+        self.fetched_at = None
+        self._next_fetch = 0
+        self._task = None
+
+    @property
+    def pending(self):
+        """
+        If there is a fetch running in the background
+        """
+        return self._task is not None
+
+    async def _fetch(self):
+        try:
+            user = await self.github.user()
+        except Exception as e:
+            self.error = e
+            self._next_fetch = time.monotonic() + self.retry
+        else:
+            self.user = user
+            self.error = None
+            self.fetched_at = time.time()
+            self._next_fetch = time.monotonic() + self.ttl
+        finally:
+            self._task = None
+
+    def refresh(self, force=False):
+        """
+        Start background fetch of the user if cache is stale
+        (needs running event loop)
+
+        force: fetch even if the cached user is still fresh
+        """
+        if self._task is not None:
+            return
+        if not force and time.monotonic() < self._next_fetch:
+            return
+        self._task = asyncio.ensure_future(self._fetch())
+
+    async def get(self, wait=None):
+        """
+        Get cached user (or None if not fetched yet), never waits
+        longer than given wait time
+
+        wait: seconds to wait for pending fetch if no user is cached
+        """
+        self.refresh()
+        task = self._task
+        if self.user is None and wait and task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), wait)
+            except asyncio.TimeoutError:
+                pass
+        return self.user
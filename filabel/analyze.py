@@ -0,0 +1,280 @@
+import configparser
+import fnmatch
+import os
+import re
+import time
+
+from filabel.matching import Matcher
+
+#: Kinds of glob tokens
+LITERAL, ANY, STAR, SET = range(4)
+
+
+def glob_tokens(pattern):
+    """
+    Split glob pattern to tokens the same way fnmatch translates it,
+    tokens are tuples (kind, value) where value is the character
+    of LITERAL or tuple (negated, characters) of SET
+
+    pattern: glob pattern as string
+    """
+    tokens = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            if not tokens or tokens[-1][0] != STAR:
+                tokens.append((STAR, None))
+        elif c == '?':
+            tokens.append((ANY, None))
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                tokens.append((LITERAL, '['))
+                continue
+            body = pattern[i:j]
+            i = j + 1
+            negated = body.startswith('!')
+            if negated:
+                body = body[1:]
+            tokens.append((SET, (negated, _set_chars(body))))
+        else:
+            tokens.append((LITERAL, c))
+    return tokens
+
+
+def _set_chars(body):
+    """
+    Characters of glob set body (None if it has ranges too wide
+    to be listed)
+    """
+    chars = set()
+    i = 0
+    while i < len(body):
+        if i + 2 < len(body) and body[i + 1] == '-':
+            lo, hi = ord(body[i]), ord(body[i + 2])
+            if hi - lo > 256:
+                return None
+            chars.update(chr(c) for c in range(lo, hi + 1))
+            i += 3
+        else:
+            chars.add(body[i])
+            i += 1
+    return frozenset(chars)
+
+
+def _token_includes(outer, inner):
+    """
+    If single-character token outer matches every character
+    matched by single-character token inner
+    """
+    kind, value = outer
+    if kind == ANY:
+        return True
+    inner_kind, inner_value = inner
+    if kind == LITERAL:
+        return inner_kind == LITERAL and inner_value == value
+    negated, chars = value
+    if chars is None:
+        return False
+    if inner_kind == LITERAL:
+        return (inner_value in chars) != negated
+    if inner_kind == SET:
+        inner_negated, inner_chars = inner_value
+        if inner_chars is None:
+            return False
+        if not negated and not inner_negated:
+            return inner_chars <= chars
+        if negated and inner_negated:
+            return chars <= inner_chars
+        if negated:
+            return not inner_chars & chars
+    return False
+
+
+def glob_includes(outer, inner):
+    """
+    If every filename matched by inner glob is also matched by outer
+    glob (a sufficient check, some rare inclusions are not found)
+
+    outer: tokens of glob pattern
+    inner: tokens of glob pattern
+    """
+    n, m = len(outer), len(inner)
+    # reachable[j]: outer[:i] can cover inner[:j]
+    reachable = [True] + [False] * m
+    for i in range(n):
+        token = outer[i]
+        following = [False] * (m + 1)
+        if token[0] == STAR:
+            # star covers any sequence of inner tokens, stars included
+            seen = False
+            for j in range(m + 1):
+                seen = seen or reachable[j]
+                following[j] = seen
+        else:
+            for j in range(m):
+                if reachable[j] and inner[j][0] != STAR and \
+                        _token_includes(token, inner[j]):
+                    following[j + 1] = True
+        reachable = following
+        if not any(reachable):
+            return False
+    return reachable[m]
+
+
+def _literal_prefix(tokens):
+    prefix = []
+    for kind, value in tokens:
+        if kind != LITERAL:
+            break
+        prefix.append(value)
+    return ''.join(prefix)
+
+
+class LabelsAnalysis:
+    """
+    Redundancies and cost of labels configuration
+    """
+    def __init__(self, labels, samples=()):
+        """
+        labels: Configuration of labels with globs
+        samples: lists of filenames (e.g. files of PRs) patterns are
+                 checked against
+        """
+        self.labels = labels
+        self.samples = [list(s) for s in samples]
+        #: (label, pattern) pairs listed more than once
+        self.duplicates = []
+        #: (label, pattern, broader pattern) triples
+        self.subsumed = []
+        #: (label, pattern) pairs matching no sampled filename
+        self.unmatched = []
+        self.minimized = {}
+        self._analyze()
+
+    def _analyze(self):
+        for label, patterns in self.labels.items():
+            unique = []
+            seen = set()
+            for pattern in patterns:
+                key = os.path.normcase(pattern)
+                if key in seen:
+                    self.duplicates.append((label, pattern))
+                else:
+                    seen.add(key)
+                    unique.append(pattern)
+            kept = []
+            for pattern, broader in zip(unique, self._broader(unique)):
+                if broader is None:
+                    kept.append(pattern)
+                else:
+                    self.subsumed.append((label, pattern, broader))
+            self.minimized[label] = kept
+        if self.samples:
+            filenames = {os.path.normcase(f) for s in self.samples for f in s}
+            for label, patterns in self.minimized.items():
+                for pattern in patterns:
+                    match = re.compile(
+                        fnmatch.translate(os.path.normcase(pattern))
+                    ).match
+                    if not any(match(f) for f in filenames):
+                        self.unmatched.append((label, pattern))
+
+    @staticmethod
+    def _broader(patterns):
+        """
+        For each pattern find other pattern matching all its filenames
+        (None if there is none), of equivalent patterns the first
+        one is kept
+        """
+        tokens = [glob_tokens(os.path.normcase(p)) for p in patterns]
+        prefixes = [_literal_prefix(t) for t in tokens]
+        by_prefix = {}
+        for i, prefix in enumerate(prefixes):
+            by_prefix.setdefault(prefix, []).append(i)
+        result = []
+        for i, prefix in enumerate(prefixes):
+            broader = None
+            # broader pattern has to start with a prefix of this prefix,
+            # the most similar ones are tried first
+            for length in range(len(prefix), -1, -1):
+                for j in by_prefix.get(prefix[:length], ()):
+                    if j == i or not glob_includes(tokens[j], tokens[i]):
+                        continue
+                    if j > i and glob_includes(tokens[i], tokens[j]):
+                        continue  # equivalent, the later one goes
+                    broader = patterns[j]
+                    break
+                if broader is not None:
+                    break
+            result.append(broader)
+        return result
+
+    @property
+    def patterns(self):
+        """
+        Number of patterns in configuration
+        """
+        return sum(len(p) for p in self.labels.values())
+
+    @property
+    def minimized_patterns(self):
+        """
+        Number of patterns in minimized configuration
+        """
+        return sum(len(p) for p in self.minimized.values())
+
+    @property
+    def filenames(self):
+        """
+        Sampled filenames, or filenames made up from patterns if there
+        are no samples
+        """
+        if self.samples:
+            return [f for s in self.samples for f in s]
+        return [
+            re.sub(r'\[[^]]*\]|[*?]', 'x', p)
+            for patterns in self.labels.values() for p in patterns
+        ]
+
+    def cost(self, labels, filenames, repeat=3):
+        """
+        Seconds matching single filename takes (best of repeats)
+
+        labels: Configuration of labels with globs
+        filenames: list of filenames to be matched
+        repeat: number of measurements
+        """
+        matcher = Matcher(labels)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for filename in filenames:
+                matcher.file_labels(filename)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best / len(filenames) if filenames else 0.0
+
+
+def write_labels(labels, file):
+    """
+    Write labels configuration in format read by parse_labels
+
+    labels: Configuration of labels with globs
+    file: text file opened for writing
+    """
+    cfg = configparser.ConfigParser(interpolation=None)
+    cfg['labels'] = {
+        # parse_labels interpolates values, so % has to be escaped
+        label: ''.join('\n' + p.replace('%', '%%') for p in patterns)
+        for label, patterns in labels.items()
+    }
+    cfg.write(file)
@@ -0,0 +1,319 @@
+import json
+import logging
+import mimetypes
+import os
+
+import jinja2
+import requests.structures
+
+from filabel.aio import (AsyncCachedGitHubUser, AsyncFilabel, AsyncGitHub,
+                         run_blocking)
+from filabel.web import (HTTPError, Webhook, backpressure_for,
+                         github_user_link_filter, load_config,
+                         timestamp_filter)
+
+STATIC = os.path.join(os.path.dirname(__file__), 'static')
+
+
+class Request:
+    """
+    HTTP request received by ASGI application
+    """
+    def __init__(self, scope, receive):
+        """
+        scope: ASGI connection scope
+        receive: ASGI receive callable
+        """
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = requests.structures.CaseInsensitiveDict(
+            (k.decode('latin-1'), v.decode('latin-1'))
+            for k, v in scope['headers']
+        )
+        client = scope.get('client')
+        self.remote_addr = client[0] if client else None
+
+    @property
+    def url(self):
+        """
+        Full URL of the request
+        """
+        scheme = self.scope.get('scheme', 'http')
+        host = self.headers.get('Host', 'localhost')
+        return f'{scheme}://{host}{self.scope.get("root_path", "")}{self.path}'
+
+    @property
+    def content_length(self):
+        """
+        Declared length of body (None if not declared)
+        """
+        length = self.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+    async def body(self, limit):
+        """
+        Read whole body, raises HTTPError if it is longer than limit
+
+        limit: maximal length of body in bytes
+        """
+        chunks = []
+        size = 0
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, 'Client disconnected')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                raise HTTPError(413, 'Payload too large')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+
+async def process_webhook_pr(app, webhook, payload):
+    """
+    Process webhook event "pull_request"
+
+    app: AsyncApp processing the webhook
+    webhook: Webhook of the delivery
+    payload: event payload
+    """
+    args = webhook.pull_request(payload)
+    if args is None:
+        return webhook.pr_skipped()
+    try:
+        await app.config['async_filabel'].run_pr(*args)
+    except Exception as e:
+        raise webhook.pr_failed(e)
+    return webhook.pr_processed()
+
+
+async def process_webhook_ping(app, webhook, payload):
+    """
+    Process webhook event "ping"
+
+    app: AsyncApp processing the webhook
+    webhook: Webhook of the delivery
+    payload: event payload
+    """
+    return webhook.ping(payload)
+
+
+webhook_processors = {
+    'pull_request': process_webhook_pr,
+    'ping': process_webhook_ping
+}
+
+
+class AsyncApp:
+    """
+    ASGI application of Filabel with the same routes and behavior
+    as the Flask one, many webhooks are processed concurrently
+    by one process
+    """
+    def __init__(self):
+        self.logger = logging.getLogger('filabel.asgi')
+        self.config = {}
+        cfg = load_config(self.config, self.logger)
+        filabel = self.config['filabel']
+        github = AsyncGitHub(
+            self.config['github_token'],
+            json_loads=self.config['json_loads'],
+            max_connections=cfg.getint('web', 'max_connections',
+                                       fallback=100),
+        )
+        self.config['async_filabel'] = AsyncFilabel(filabel, github)
+        self.config['github_user'] = AsyncCachedGitHubUser(
+            github,
+            ttl=cfg.getint('web', 'user_ttl', fallback=600),
+            retry=cfg.getint('web', 'user_retry', fallback=30),
+        )
+        self.config['backpressure'] = backpressure_for(cfg, github)
+        self.templates = jinja2.Environment(
+            loader=jinja2.PackageLoader('filabel', 'templates'),
+            autoescape=True,
+        )
+        self.templates.filters['github_user_link'] = github_user_link_filter
+        self.templates.filters['timestamp'] = timestamp_filter
+        self.routes = {
+            ('GET', '/'): self.index,
+            ('POST', '/'): self.webhook_listener,
+            ('GET', '/healthz'): self.healthz,
+            ('GET', '/readyz'): self.readyz,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self.config['labels_reloader'].ensure_running()
+        request = Request(scope, receive)
+        try:
+            body, status, headers = await self.dispatch(request)
+        except HTTPError as e:
+            body, status, headers = e.message, e.code, {}
+        except Exception:
+            self.logger.exception(f'Error handling {request.path}')
+            body, status, headers = 'Internal server error', 500, {}
+        if isinstance(body, str):
+            headers.setdefault('Content-Type', 'text/plain; charset=utf-8')
+            body = body.encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers.items()],
+        })
+        await send({'type': 'http.response.body',
+                    'body': b'' if request.method == 'HEAD' else body})
+
+    async def lifespan(self, receive, send):
+        """
+        Handle ASGI lifespan protocol: start GitHub user lookup
+        on startup and close connections on shutdown
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.config['github_user'].refresh()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.config['async_filabel'].github.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispatch(self, request):
+        """
+        Pass request to its route, returns tuple (body, status, headers)
+        """
+        method = 'GET' if request.method == 'HEAD' else request.method
+        route = self.routes.get((method, request.path))
+        if route is not None:
+            return await route(request)
+        if method == 'GET' and request.path.startswith('/static/'):
+            return self.static(request.path[len('/static/'):])
+        if any(path == request.path for _, path in self.routes):
+            raise HTTPError(405, 'Method not allowed')
+        raise HTTPError(404, 'Not found')
+
+    def url_for(self, endpoint, filename):
+        """
+        URL of static file (template global as in Flask)
+        """
+        return f'/static/{filename}'
+
+    def static(self, filename):
+        """
+        Static file of the info page
+        """
+        if filename not in os.listdir(STATIC):
+            raise HTTPError(404, 'Not found')
+        content_type = mimetypes.guess_type(filename)[0]
+        with open(os.path.join(STATIC, filename), 'rb') as f:
+            return f.read(), 200, {
+                'Content-Type': content_type or 'application/octet-stream'
+            }
+
+    async def index(self, request):
+        """
+        Landing info page
+        """
+        github_user = self.config['github_user']
+        user = await github_user.get(wait=self.config['github_user_wait'])
+        if user is None and github_user.error is not None:
+            self.logger.error(
+                f'Could not get GitHub user: {github_user.error}'
+            )
+        filabel = self.config['filabel']
+        deliveries = self.config['deliveries']
+        html = self.templates.get_template('infopage.html').render(
+            url_for=self.url_for,
+            request=request,
+            labels=filabel.labels,
+            reloader=self.config['labels_reloader'],
+            digest=filabel.matcher.digest,
+            user=user,
+            http=self.config['async_filabel'].github.stats(),
+            deliveries=deliveries.stats() if deliveries else None,
+            load=self.config['backpressure'].stats(),
+        )
+        return html, 200, {'Content-Type': 'text/html; charset=utf-8'}
+
+    async def webhook_listener(self, request):
+        """
+        Webhook listener endpoint
+        """
+        backpressure = self.config['backpressure']
+        if not backpressure.enter():
+            self.logger.warning(
+                f'Webhook refused: {", ".join(backpressure.overload())}'
+            )
+            return 'Service overloaded, retry later', 503, {
+                'Retry-After': str(backpressure.wait_time())
+            }
+        try:
+            body, status = await self.handle_webhook(request)
+            return body, status, {}
+        finally:
+            backpressure.exit()
+
+    async def handle_webhook(self, request):
+        """
+        Verify webhook delivery and pass it to its event processor
+        """
+        webhook = Webhook(self.config, request.headers, request.remote_addr,
+                          self.logger)
+        webhook.check_length(request.content_length)
+        data = await request.body(self.config['MAX_CONTENT_LENGTH'])
+        webhook.verify(data)
+
+        recorder = self.config['recorder']
+        if recorder is not None:
+            await run_blocking(recorder.record, request.headers, data)
+
+        webhook.check_event()
+        deliveries = self.config['deliveries']
+        if webhook.delivery is not None and \
+                not await run_blocking(deliveries.claim, webhook.delivery):
+            return webhook.duplicate()
+
+        payload = webhook.payload(data)
+        try:
+            return await webhook_processors[webhook.event](self, webhook,
+                                                           payload)
+        except Exception as e:
+            if webhook.release(e):
+                # let redelivery try again
+                await run_blocking(deliveries.release, webhook.delivery)
+            raise
+
+    async def healthz(self, request):
+        """
+        Liveness endpoint
+        """
+        return 'OK', 200, {}
+
+    async def readyz(self, request):
+        """
+        Readiness endpoint, 503 when webhooks would be refused
+        """
+        backpressure = self.config['backpressure']
+        stats = backpressure.stats()
+        headers = {'Content-Type': 'application/json'}
+        if stats['ready']:
+            return json.dumps(stats), 200, headers
+        headers['Retry-After'] = str(backpressure.wait_time())
+        return json.dumps(stats), 503, headers
+
+
+def create_asgi_app(*args, **kwargs):
+    """
+    Prepare Filabel ASGI application listening to GitHub webhooks
+    (e.g. for "uvicorn --factory filabel:create_asgi_app")
+    """
+    return AsyncApp()
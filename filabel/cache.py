@@ -0,0 +1,125 @@
+import collections
+import threading
+
+
+class LRUCache:
+    """
+    Thread-safe mapping keeping only given number of recently used items
+    """
+    def __init__(self, maxsize=1024):
+        """
+        maxsize: maximal number of items kept
+        """
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get item and mark it as recently used
+
+        key: key of the item
+        default: value returned if key is not cached
+        """
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                return default
+            return self._items[key]
+
+    def put(self, key, value):
+        """
+        Store item, least recently used item is dropped if cache is full
+
+        key: key of the item
+        value: item to be stored
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove item from cache and return it
+
+        key: key of the item
+        default: value returned if key is not cached
+        """
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class PRFiles:
+    """
+    Changed files of a PR with counts of files matching each label
+    """
+    __slots__ = ('head_sha', 'base_sha', 'files', 'digest', 'label_counts')
+
+    def __init__(self, head_sha, matcher, base_sha=None):
+        """
+        head_sha: SHA of PR head commit the files belong to
+        matcher: Matcher used for counting labels
+        base_sha: SHA of PR base commit the files were listed against
+        """
+        self.head_sha = head_sha
+        self.base_sha = base_sha
+        self.files = {}
+        self.digest = matcher.digest
+        self.label_counts = collections.Counter()
+
+    def copy(self, head_sha, matcher):
+        """
+        Copy of the files for another head commit (of the same base),
+        cached entries are never modified so concurrent webhooks see
+        consistent data
+
+        head_sha: SHA of PR head commit the copy will belong to
+        matcher: Matcher used for counting labels
+        """
+        other = PRFiles(head_sha, matcher, self.base_sha)
+        other.files = dict(self.files)
+        if self.digest == matcher.digest:
+            other.label_counts = collections.Counter(self.label_counts)
+        else:
+            other.label_counts = matcher.count(other.files)
+        return other
+
+    def add(self, filename, status, matcher):
+        """
+        Add or update changed file
+
+        filename: name of the file
+        status: status of file change from GitHub API (added, removed, ...)
+        matcher: Matcher used for counting labels
+        """
+        if filename not in self.files:
+            self.label_counts.update(matcher.file_labels(filename))
+        self.files[filename] = status
+
+    def discard(self, filename, matcher):
+        """
+        Remove file if present
+
+        filename: name of the file
+        matcher: Matcher used for counting labels
+        """
+        if self.files.pop(filename, None) is not None:
+            self.label_counts.subtract(matcher.file_labels(filename))
+
+    def labels(self, matcher):
+        """
+        Labels matching the files, counted again from cached files
+        if matcher changed since the counts were computed
+
+        matcher: Matcher used for counting labels
+        """
+        counts = self.label_counts
+        if self.digest != matcher.digest:
+            counts = matcher.count(self.files)
+        return {l for l, count in counts.items() if count > 0}
@@ -1,8 +1,22 @@
+import collections
 import configparser
+import datetime
+import itertools
+import json
+import os
+import re
+import sys
 import click
 
-from filabel.logic import Filabel, Change
-from filabel.utils import parse_labels
+from filabel.cache import LRUCache
+from filabel.logic import Filabel, Change, Report
+from filabel.matching import MatchPool
+from filabel.plan import PlanWriter, apply_plans, read_plans
+from filabel.utils import Deadline, Shard, parse_labels, parse_tokens
+
+# Modules of options and subcommands (git mirrors, ledger, watching,
+# replay, analysis) are imported when used, so the plain CLI starts
+# without subprocess, sqlite3, gzip etc.
 
 
 def stylize_label_change(change_type, label):
@@ -27,7 +41,9 @@ def print_report(report):
     """
     click.secho(f'REPO', nl=False, bold=True)
     click.secho(f' {report.repo} - ', nl=False)
-    if report.ok:
+    if report.skipped:
+        click.secho('SKIPPED (no time left)', fg='yellow', bold=True)
+    elif report.ok:
         click.secho('OK', fg='green', bold=True)
         for pr_link, result in report.prs.items():
             click.secho(f'  PR', nl=False, bold=True)
@@ -38,10 +54,114 @@ def print_report(report):
                 click.secho('OK', fg='green', bold=True)
                 for label, t in result:
                     click.echo(f'    {stylize_label_change(t, label)}')
+        for pr_link in report.unchanged_prs:
+            click.secho(f'  PR', nl=False, bold=True)
+            click.secho(f' {pr_link} - ', nl=False)
+            click.secho('UNCHANGED', fg='green', bold=True)
+        for pr_link in report.skipped_prs:
+            click.secho(f'  PR', nl=False, bold=True)
+            click.secho(f' {pr_link} - ', nl=False)
+            click.secho('SKIPPED (no time left)', fg='yellow', bold=True)
     else:
         click.secho('FAIL', fg='red', bold=True)
 
 
+class ReportOutput:
+    """
+    Prints reports and optionally writes them to file as JSON lines
+    """
+    def __init__(self, file=None):
+        """
+        file: optional text file opened for writing
+        """
+        self.file = file
+        self.ok = True
+
+    def __call__(self, report):
+        """
+        Output single report
+
+        report: Report to be printed (and written)
+        """
+        self.ok = self.ok and report.ok and not report.skipped and \
+            not report.skipped_prs and None not in report.prs.values()
+        print_report(report)
+        if self.file is not None:
+            self.file.write(json.dumps(report.to_dict(),
+                                       separators=(',', ':')))
+            self.file.write('\n')
+            self.file.flush()
+
+
+def read_reports(file):
+    """
+    Read reports written by ReportOutput. A generator.
+
+    file: text file opened for reading
+    """
+    for line in file:
+        if line.strip():
+            yield Report.from_dict(json.loads(line))
+
+
+def _pr_number(url):
+    match = re.search(r'(\d+)$', url)
+    return int(match.group(1)) if match else 0
+
+
+def merge_reports(reports):
+    """
+    Merge reports of shards, PRs of repo split to several shards
+    are ordered by number (newest first) as GitHub lists them
+
+    reports: iterable of Reports
+    """
+    merged = collections.OrderedDict()
+    split = set()
+    for report in reports:
+        if report.repo not in merged:
+            merged[report.repo] = report
+            continue
+        split.add(report.repo)
+        merged[report.repo].ok = merged[report.repo].ok and report.ok
+        merged[report.repo].skipped = \
+            merged[report.repo].skipped or report.skipped
+        merged[report.repo].prs.update(report.prs)
+        merged[report.repo].skipped_prs += report.skipped_prs
+        merged[report.repo].unchanged_prs += report.unchanged_prs
+    for repo in split:
+        prs = merged[repo].prs
+        merged[repo].prs = collections.OrderedDict(
+            sorted(prs.items(), key=lambda i: _pr_number(i[0]), reverse=True)
+        )
+    return list(merged.values())
+
+
+def parse_shard(ctx, param, value):
+    """
+    Click callback for parsing shard option
+    """
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def parse_git_mirrors(ctx, param, value):
+    """
+    Click callback for parsing git mirror options
+    """
+    mirrors = {}
+    for item in value:
+        reposlug, sep, path = item.partition('=')
+        if not sep or not path or len(reposlug.split('/')) != 2:
+            raise click.BadParameter(f'{item} is not in form owner/repo=PATH')
+        mirrors[reposlug] = path
+    return mirrors
+
+
 def get_token(config_auth):
     """
     Extract token from auth config and do the checks
@@ -54,7 +174,7 @@ def get_token(config_auth):
     try:
         cfg_auth = configparser.ConfigParser()
         cfg_auth.read_file(config_auth)
-        return cfg_auth.get('github', 'token')
+        return parse_tokens(cfg_auth.get('github', 'token'))
     except Exception:
         click.secho('Auth configuration not usable!', err=True)
         exit(1)
@@ -90,7 +210,177 @@ def check_reposlugs(reposlugs):
             exit(1)
 
 
-@click.command('filabel')
+def iter_reposlugs(reposlugs, repos_from, org, github, state):
+    """
+    Iterate over reposlugs from arguments, file and organization,
+    file and organization are read lazily
+
+    reposlugs: List of reposlugs (i.e. "owner/repo")
+    repos_from: File with reposlug on each line or None
+    org: Name of GitHub organization or None
+    github: GitHub client for listing repos of organization
+    state: State of PRs to be labeled (repos without open PRs are
+           skipped when only open PRs are labeled)
+    """
+    yield from reposlugs
+    if repos_from is not None:
+        for line in repos_from:
+            reposlug = line.strip()
+            if not reposlug or reposlug.startswith('#'):
+                continue
+            if len(reposlug.split('/')) != 2:
+                click.secho(f'Reposlug {reposlug} not valid!', err=True)
+                continue
+            yield reposlug
+    if org is not None:
+        try:
+            for repo in github.org_repos(org):
+                if repo.get('archived'):
+                    continue
+                if state == 'open' and not repo.get('open_issues_count'):
+                    continue  # no open issues means no open PRs
+                yield repo['full_name']
+        except Exception:
+            click.secho(f'Organization {org} not usable!', err=True)
+            exit(1)
+
+
+#: Search index lags behind, next search overlaps previous one by this
+SEARCH_LAG = datetime.timedelta(minutes=5)
+
+
+def read_cursor(cursor):
+    """
+    Read time of last search from cursor file (None if there is none)
+
+    cursor: Path to cursor file
+    """
+    if cursor is None or not os.path.exists(cursor):
+        return None
+    try:
+        with open(cursor) as f:
+            return datetime.datetime.fromisoformat(f.read().strip())
+    except ValueError:
+        click.secho(f'Cursor {cursor} not usable!', err=True)
+        exit(1)
+
+
+def write_cursor(cursor, time):
+    """
+    Write time of search to cursor file
+
+    cursor: Path to cursor file
+    time: Time of the search start
+    """
+    with open(cursor, 'w') as f:
+        f.write((time - SEARCH_LAG).isoformat() + '\n')
+
+
+def run_search(fl, reposlugs, repos_from, org, cursor, output,
+               plans=None, shard=None, shard_prs=False, deadline=None):
+    """
+    Label PRs updated since last search found by GitHub search API
+
+    fl: Filabel to be used
+    reposlugs: List of reposlugs (i.e. "owner/repo")
+    repos_from: File with reposlug on each line or None
+    org: Name of GitHub organization or None
+    cursor: Path to file with time of last search or None
+    output: ReportOutput for reports
+    plans: optional list to collect plans to instead of applying them
+    shard: optional Shard selecting repos (or PRs) to be managed
+    shard_prs: if PRs should be selected by shard instead of repos
+    deadline: optional Deadline, PRs are not started after it
+    """
+    started = datetime.datetime.now(datetime.timezone.utc)
+    since = read_cursor(cursor)
+    targets = itertools.chain(
+        (f'repo:{r}' for r in iter_reposlugs(
+            reposlugs, repos_from, None, fl.github, fl.state)),
+        [f'org:{org}'] if org is not None else []
+    )
+    found = collections.OrderedDict()
+    try:
+        for reposlug, pr in fl.discover(targets, since):
+            key = pr.number if shard_prs else reposlug
+            if shard is None or key in shard:
+                found.setdefault(reposlug, []).append(pr)
+    except Exception:
+        click.secho('Search of PRs not usable!', err=True)
+        exit(1)
+
+    for reposlug, prs in found.items():
+        output(fl.run_prs(reposlug, prs, plans, deadline))
+    for query in fl.incomplete_searches:
+        click.secho(f'Search incomplete (not all PRs found): {query}',
+                    err=True)
+    if fl.incomplete_searches:
+        output.ok = False  # PRs missing from results are searched again
+    if cursor is not None and output.ok:
+        write_cursor(cursor, started)
+
+
+def run_watch(fl, reposlugs, repos_from, org, output, interval, shard=None):
+    """
+    Keep labeling PRs of repos whenever they change, until SIGTERM
+
+    fl: Filabel to be used
+    reposlugs: List of reposlugs (i.e. "owner/repo")
+    repos_from: File with reposlug on each line or None
+    org: Name of GitHub organization or None
+    output: ReportOutput for reports
+    interval: shortest seconds between polls of repo
+    shard: optional Shard selecting repos to be managed
+    """
+    from filabel.watch import Watcher
+    fl.file_cache = LRUCache()
+    fl.write_unchanged = False  # own label writes would look like changes
+    repos = [
+        repo for repo in iter_reposlugs(reposlugs, repos_from, org,
+                                        fl.github, fl.state)
+        if shard is None or repo in shard
+    ]
+    Watcher(fl, repos, output, interval).run()
+
+
+class FilabelCommand(click.Command):
+    """
+    Command accepting also subcommands as the first argument
+    (names of subcommands are not valid reposlugs)
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subcommands = collections.OrderedDict()
+
+    def subcommand(self, command):
+        """
+        Register subcommand, usable as decorator
+
+        command: click command to be registered
+        """
+        self.subcommands[command.name] = command
+        return command
+
+    def main(self, args=None, prog_name=None, **kwargs):
+        args = sys.argv[1:] if args is None else list(args)
+        if args and args[0] in self.subcommands:
+            prog_name = f'{prog_name or self.name} {args[0]}'
+            return self.subcommands[args[0]].main(
+                args[1:], prog_name=prog_name, **kwargs
+            )
+        return super().main(args, prog_name, **kwargs)
+
+    def format_epilog(self, ctx, formatter):
+        if self.subcommands:
+            with formatter.section('Commands'):
+                formatter.write_dl([
+                    (name, command.get_short_help_str())
+                    for name, command in self.subcommands.items()
+                ])
+        super().format_epilog(ctx, formatter)
+
+
+@click.command('filabel', cls=FilabelCommand)
 @click.argument('reposlugs', nargs=-1)
 @click.option('-s', '--state', type=click.Choice(['open', 'closed', 'all']),
               default='open', show_default=True, help='Filter pulls by state.')
@@ -103,15 +393,274 @@ def check_reposlugs(reposlugs):
               help='File with authorization configuration.')
 @click.option('-l', '--config-labels', type=click.File('r'),
               help='File with labels configuration.')
-def cli(reposlugs, state, delete_old, base, config_auth, config_labels):
+@click.option('-o', '--org', type=str, metavar='NAME',
+              help='Label PRs in all repos of organization '
+                   '(archived ones are skipped).')
+@click.option('-f', '--repos-from', type=click.File('r'), metavar='FILE',
+              help='Read reposlugs from file, one per line (- for stdin).')
+@click.option('--search', is_flag=True,
+              help='Find updated PRs by search API instead of listing '
+                   'PRs of every repo.')
+@click.option('--cursor', type=click.Path(dir_okay=False), metavar='FILE',
+              help='File with time of last search, PRs updated since then '
+                   'are searched (updated after successful run).')
+@click.option('--plan', type=click.File('w'), metavar='FILE',
+              help='Only write planned label changes to file.')
+@click.option('--apply', 'apply_', type=click.File('r'), metavar='FILE',
+              help='Only apply label changes planned in file.')
+@click.option('--apply-workers', type=click.IntRange(min=1), default=4,
+              show_default=True, help='Number of parallel label writes.')
+@click.option('--apply-rate', type=click.FloatRange(min=0), default=5,
+              show_default=True,
+              help='Maximal label writes per second (0 for no limit).')
+@click.option('--repo-config', type=str, metavar='PATH',
+              help='Path of labels configuration in repo overriding '
+                   'the supplied one (e.g. .github/filabel.cfg).')
+@click.option('--match-processes', type=click.IntRange(min=0), default=0,
+              show_default=True, metavar='N',
+              help='Match files of huge PRs in N processes.')
+@click.option('--match-min-files', type=click.IntRange(min=1),
+              default=MatchPool.MIN_FILES, show_default=True, metavar='N',
+              help='Smallest number of files of PR matched in processes.')
+@click.option('--shard', type=str, metavar='I/N', callback=parse_shard,
+              help='Process only I-th of N parts of repos (or PRs when '
+                   'single repo is given).')
+@click.option('--report', 'report_file', type=click.File('w'),
+              metavar='FILE', help='Also write reports to file.')
+@click.option('--deadline', type=click.FloatRange(min=0), metavar='SECONDS',
+              help='Do not start PRs that cannot be finished in time.')
+@click.option('--git-mirror', type=str, multiple=True, metavar='SLUG=PATH',
+              callback=parse_git_mirrors,
+              help='List files of PRs of repo by git in local clone.')
+@click.option('--git-mirrors', type=click.Path(file_okay=False),
+              metavar='DIR',
+              help='List files of PRs by git in local clones found '
+                   'as DIR/owner/repo(.git).')
+@click.option('--ledger', type=click.Path(dir_okay=False), metavar='FILE',
+              help='Record written labels to SQLite file and skip PRs '
+                   'unchanged since.')
+@click.option('--watch', type=click.FloatRange(min=1), metavar='INTERVAL',
+              help='Keep running and label PRs of repos whenever they '
+                   'change, polling at most every INTERVAL seconds '
+                   '(less often for quiet repos).')
+def cli(reposlugs, state, delete_old, base, config_auth, config_labels,
+        org, repos_from, search, cursor, plan, apply_, apply_workers,
+        apply_rate, repo_config, match_processes, match_min_files, shard,
+        report_file,
+        deadline, git_mirror, git_mirrors, ledger, watch):
     """
     CLI tool for filename-pattern-based labeling of GitHub PRs
     """
+    if plan is not None and apply_ is not None:
+        raise click.UsageError('--plan cannot be combined with --apply')
+    if cursor is not None and not search:
+        raise click.UsageError('--cursor requires --search')
+    deadline = None if deadline is None else Deadline(deadline)
     token = get_token(config_auth)
+    output = ReportOutput(report_file)
+    if apply_ is not None:
+        fl = Filabel(token, {})
+        for report in apply_plans(fl, read_plans(apply_),
+                                  apply_workers, apply_rate, deadline):
+            output(report)
+        return
+
+    if watch is not None and (search or plan is not None or
+                              deadline is not None):
+        raise click.UsageError(
+            '--watch cannot be combined with --search, --plan or --deadline'
+        )
     labels = get_labels(config_labels)
     check_reposlugs(reposlugs)
 
-    fl = Filabel(token, labels, state, base, delete_old)
-    for repo in reposlugs:
-        report = fl.run_repo(repo)
-        print_report(report)
+    mirrors = None
+    if git_mirror or git_mirrors:
+        from filabel.gitmirror import GitMirrors
+        # PR lists do not include numbers of files, use mirrors for all
+        mirrors = GitMirrors(git_mirror, git_mirrors, threshold=0)
+    if ledger is not None:
+        from filabel.ledger import Ledger
+        ledger = Ledger(ledger)
+    fl = Filabel(token, labels, state, base, delete_old,
+                 repo_config=repo_config, match_processes=match_processes,
+                 match_min_files=match_min_files, git_mirrors=mirrors,
+                 ledger=ledger)
+    if watch is not None:
+        run_watch(fl, reposlugs, repos_from, org, output, watch, shard)
+        return
+    plans = None if plan is None else PlanWriter(plan)
+    shard_prs = len(reposlugs) == 1 and repos_from is None and org is None
+    if search:
+        run_search(fl, reposlugs, repos_from, org, cursor, output,
+                   plans, shard, shard_prs, deadline)
+        return
+
+    for repo in iter_reposlugs(reposlugs, repos_from, org,
+                               fl.github, state):
+        if shard_prs:
+            output(fl.run_repo(repo, plans, shard, deadline))
+        elif shard is None or repo in shard:
+            output(fl.run_repo(repo, plans, deadline=deadline))
+
+
+@cli.subcommand
+@click.command('merge-reports', short_help='Merge reports of shards.')
+@click.argument('reports', nargs=-1, required=True, type=click.File('r'))
+@click.option('--report', 'report_file', type=click.File('w'),
+              metavar='FILE', help='Also write merged report to file.')
+def merge_reports_cli(reports, report_file):
+    """
+    Merge reports written by shards (filabel --shard I/N --report FILE)
+    """
+    output = ReportOutput(report_file)
+    for report in merge_reports(itertools.chain.from_iterable(
+            read_reports(f) for f in reports)):
+        output(report)
+
+
+@cli.subcommand
+@click.command('relabel', short_help='Apply change of labels configuration.')
+@click.argument('reposlugs', nargs=-1)
+@click.option('--old', 'old_labels', type=click.File('r'), required=True,
+              metavar='FILE', help='File with previous labels configuration.')
+@click.option('-l', '--config-labels', type=click.File('r'),
+              help='File with (new) labels configuration.')
+@click.option('-a', '--config-auth', type=click.File('r'),
+              help='File with authorization configuration.')
+@click.option('--ledger', type=click.Path(exists=True, dir_okay=False),
+              required=True, metavar='FILE',
+              help='Ledger written by previous runs (filabel --ledger).')
+@click.option('-s', '--state', type=click.Choice(['open', 'closed', 'all']),
+              default='open', show_default=True, help='Filter pulls by state.')
+@click.option('-d/-D', '--delete-old/--no-delete-old', default=True,
+              show_default=True,
+              help='Delete labels that do not match anymore.')
+@click.option('-b', '--base', type=str, metavar='BRANCH',
+              help='Filter pulls by base (PR target) branch name.')
+@click.option('--report', 'report_file', type=click.File('w'),
+              metavar='FILE', help='Also write reports to file.')
+def relabel_cli(reposlugs, old_labels, config_labels, config_auth, ledger,
+                state, delete_old, base, report_file):
+    """
+    Relabel PRs after change of labels configuration, PRs recorded in
+    ledger are matched against changed labels only (using recorded
+    files) and written only if their labels differ; repos recorded
+    in ledger are relabeled unless reposlugs are given
+    """
+    from filabel.ledger import Ledger
+    token = get_token(config_auth)
+    old = get_labels(old_labels)
+    labels = get_labels(config_labels)
+    check_reposlugs(reposlugs)
+    fl = Filabel(token, labels, state, base, delete_old,
+                 ledger=Ledger(ledger))
+    fl.write_unchanged = False
+    output = ReportOutput(report_file)
+    for reposlug in reposlugs or fl.ledger.repos():
+        owner, repo = reposlug.split('/')
+        try:
+            prs = fl.github.pull_requests(owner, repo, state, base)
+        except Exception:
+            report = Report(reposlug)
+            report.ok = False
+            output(report)
+            continue
+        output(fl.relabel_prs(reposlug, prs, old))
+
+
+@cli.subcommand
+@click.command('replay', short_help='Replay recorded webhook deliveries.')
+@click.argument('recording', type=click.Path(exists=True, dir_okay=False))
+@click.option('-u', '--url', type=str,
+              help='URL of running webhook listener (default: replay to '
+                   'app created in-process from FILABEL_CONFIG).')
+@click.option('-r', '--rate', type=click.FloatRange(min=0), default=0,
+              help='Deliveries per second (0 for as fast as possible).')
+@click.option('-c', '--concurrency', type=click.IntRange(min=1), default=1,
+              show_default=True, help='Number of deliveries in flight.')
+@click.option('-n', '--repeat', type=click.IntRange(min=1), default=1,
+              show_default=True, help='Replay the recording N times.')
+@click.option('--github-latency', type=click.FloatRange(min=0),
+              default=0.05, show_default=True, metavar='SECONDS',
+              help='Latency of stubbed GitHub API of in-process replay.')
+@click.option('--live-github', is_flag=True,
+              help='In-process replay talks to real GitHub API (PRs are '
+                   'labeled and rate limit is spent).')
+@click.option('--keep-delivery-ids', is_flag=True,
+              help='Replay delivery IDs as recorded (by default they are '
+                   'made unique, so deliveries are not skipped as '
+                   'duplicates).')
+def replay_cli(recording, url, rate, concurrency, repeat, github_latency,
+               live_github, keep_delivery_ids):
+    """
+    Replay webhook deliveries recorded by web app ([web] record = FILE)
+    and report latency percentiles, throughput and errors; in-process
+    replay uses stubbed GitHub API unless told otherwise
+    """
+    from filabel.replay import (StubGitHubAdapter, app_sender, http_sender,
+                                repeat_deliveries, replay)
+    if url is None:
+        from filabel.web import create_app
+        adapter = None if live_github else StubGitHubAdapter(github_latency)
+        send = app_sender(create_app(None, github_adapter=adapter))
+    else:
+        send = http_sender(url)
+    deliveries = repeat_deliveries(recording, repeat, keep_delivery_ids)
+    summary = replay(deliveries, send, rate, concurrency).summary()
+    click.echo(f'Deliveries: {summary["deliveries"]} '
+               f'in {summary["duration"]:.2f} s '
+               f'({summary["throughput"]:.1f}/s)')
+    for p in ('p50', 'p95', 'p99'):
+        click.echo(f'Latency {p}: {summary[p] * 1000:.1f} ms')
+    statuses = ', '.join(f'{status}: {count}' for status, count in sorted(
+        summary['statuses'].items(), key=lambda i: str(i[0])))
+    click.echo(f'Statuses: {statuses}')
+    click.secho(f'Errors: {summary["errors"]}',
+                fg='red' if summary['errors'] else 'green')
+
+
+@cli.subcommand
+@click.group('config', short_help='Inspect labels configuration.')
+def config_cli():
+    """
+    Tools for labels configuration
+    """
+
+
+@config_cli.command('analyze', short_help='Find redundant patterns.')
+@click.option('-l', '--config-labels', type=click.File('r'),
+              help='File with labels configuration.')
+@click.option('--sample', type=click.File('r'), multiple=True,
+              metavar='FILE',
+              help='File with filenames (one per line, e.g. from '
+                   'git ls-files) patterns are checked against.')
+@click.option('-w', '--write', type=click.File('w'), metavar='FILE',
+              help='Write minimized equivalent configuration to file.')
+def config_analyze_cli(config_labels, sample, write):
+    """
+    Report duplicate, subsumed and never-matching patterns of labels
+    configuration and estimate the cost of matching
+    """
+    from filabel.analyze import LabelsAnalysis, write_labels
+    labels = get_labels(config_labels)
+    samples = [filter(None, f.read().splitlines()) for f in sample]
+    analysis = LabelsAnalysis(labels, samples)
+    for label, pattern in analysis.duplicates:
+        click.secho('DUPLICATE', fg='yellow', bold=True, nl=False)
+        click.echo(f' {label}: {pattern}')
+    for label, pattern, broader in analysis.subsumed:
+        click.secho('SUBSUMED', fg='yellow', bold=True, nl=False)
+        click.echo(f' {label}: {pattern} (by {broader})')
+    for label, pattern in analysis.unmatched:
+        click.secho('UNMATCHED', fg='magenta', bold=True, nl=False)
+        click.echo(f' {label}: {pattern}')
+
+    filenames = analysis.filenames
+    cost = analysis.cost(labels, filenames)
+    minimized_cost = analysis.cost(analysis.minimized, filenames)
+    click.echo(f'Patterns: {analysis.patterns} '
+               f'({analysis.minimized_patterns} minimized)')
+    click.echo(f'Cost per file: {cost * 1e6:.2f} us '
+               f'({minimized_cost * 1e6:.2f} us minimized)')
+    if write is not None:
+        write_labels(analysis.minimized, write)
@@ -0,0 +1,115 @@
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+
+class DeliveryStore:
+    """
+    Remembers webhook deliveries (by X-GitHub-Delivery) for given time,
+    so redelivered webhooks are not processed again; kept in memory
+    or in SQLite database shared by worker processes
+    """
+    def __init__(self, ttl=3 * 24 * 3600, maxsize=100000, path=None,
+                 clock=time.time):
+        """
+        ttl: seconds a delivery is remembered (GitHub redelivers
+             deliveries up to 3 days old)
+        maxsize: maximal number of deliveries kept in memory
+        path: optional path of SQLite database (used instead of memory)
+        clock: function returning current time
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = path
+        self.clock = clock
+        self.processed = 0
+        self.duplicates = 0
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    @property
+    def db(self):
+        """
+        SQLite connection of this process (used under lock)
+        """
+        if self._pid != os.getpid():
+            # connections must not be shared with forked processes
+            self._db = sqlite3.connect(self.path, timeout=10,
+                                       check_same_thread=False,
+                                       isolation_level=None)
+            self._db.execute('CREATE TABLE IF NOT EXISTS deliveries '
+                             '(id TEXT PRIMARY KEY, expires REAL)')
+            self._pid = os.getpid()
+        return self._db
+
+    def _claim_db(self, delivery, now):
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM deliveries WHERE expires < ?', (now,))
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO deliveries VALUES (?, ?)',
+                (delivery, now + self.ttl)
+            )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def _claim_memory(self, delivery, now):
+        while self._seen:
+            oldest, expires = next(iter(self._seen.items()))
+            if expires >= now and len(self._seen) < self.maxsize:
+                break
+            del self._seen[oldest]
+        if delivery in self._seen:
+            return False
+        self._seen[delivery] = now + self.ttl
+        return True
+
+    def claim(self, delivery):
+        """
+        Mark delivery as seen, returns False if it was seen already
+        (i.e. it is a duplicate to be skipped)
+
+        delivery: ID of delivery (X-GitHub-Delivery header)
+        """
+        now = self.clock()
+        with self._lock:
+            if self.path is None:
+                claimed = self._claim_memory(delivery, now)
+            else:
+                claimed = self._claim_db(delivery, now)
+            if claimed:
+                self.processed += 1
+            else:
+                self.duplicates += 1
+        return claimed
+
+    def release(self, delivery):
+        """
+        Forget delivery, e.g. when its processing failed and
+        redelivery should be processed
+
+        delivery: ID of delivery (X-GitHub-Delivery header)
+        """
+        with self._lock:
+            if self.path is None:
+                released = self._seen.pop(delivery, None) is not None
+            else:
+                released = self.db.execute(
+                    'DELETE FROM deliveries WHERE id = ?', (delivery,)
+                ).rowcount == 1
+            if released:
+                self.processed -= 1
+
+    def stats(self):
+        """
+        Counts of deliveries seen by this process
+        """
+        return {'processed': self.processed, 'duplicates': self.duplicates}
@@ -0,0 +1,97 @@
+import re
+import threading
+
+#: Request to GitHub API is sent (method, endpoint, url)
+REQUEST_START = 'request_start'
+#: Response from GitHub API arrived or request failed (method, endpoint,
+#: url, status, bytes, duration, error)
+REQUEST_END = 'request_end'
+#: Labeling of PR started (reposlug, number)
+PR_START = 'pr_start'
+#: Labeling of PR finished (reposlug, number, duration, ok)
+PR_END = 'pr_end'
+#: Matching labels of PR computed (reposlug, number, labels, duration)
+MATCH_DONE = 'match_done'
+#: Labels of PR written (reposlug, number, labels, duration, ok)
+LABEL_WRITE = 'label_write'
+
+#: Patterns replacing variable parts of GitHub API URLs
+_ENDPOINT_PATTERNS = [
+    (re.compile(r'^https?://[^/]+'), ''),
+    (re.compile(r'\?.*$'), ''),
+    (re.compile(r'^/repos/[^/]+/[^/]+'), '/repos/{owner}/{repo}'),
+    (re.compile(r'^/orgs/[^/]+'), '/orgs/{org}'),
+    (re.compile(r'/(pulls|issues)/\d+'), r'/\1/{number}'),
+    (re.compile(r'/compare/.+$'), '/compare/{basehead}'),
+    (re.compile(r'/contents/.+$'), '/contents/{path}'),
+]
+
+
+def endpoint_template(url):
+    """
+    GitHub API endpoint of URL with variable parts replaced,
+    e.g. "/repos/{owner}/{repo}/pulls/{number}/files"
+
+    url: URL of request to GitHub API
+    """
+    for pattern, replacement in _ENDPOINT_PATTERNS:
+        url = pattern.sub(replacement, url)
+    return url
+
+
+class Events:
+    """
+    Subscribers of instrumentation events, emitting costs only
+    a check of the active attribute when there are none
+    """
+    def __init__(self):
+        #: If there is any subscriber (checked before computing events)
+        self.active = False
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, callback):
+        """
+        Call callback(name, **fields) on every event of given name
+
+        name: name of event (e.g. REQUEST_END) or None for all events
+        callback: function called from thread the event happened in
+        """
+        with self._lock:
+            callbacks = self._subscribers.get(name, ())
+            self._subscribers[name] = callbacks + (callback,)
+            self.active = True
+
+    def unsubscribe(self, name, callback):
+        """
+        Stop calling callback subscribed for given event name
+
+        name: name of event or None for all events
+        callback: function previously subscribed
+        """
+        with self._lock:
+            callbacks = tuple(c for c in self._subscribers.get(name, ())
+                              if c != callback)
+            if callbacks:
+                self._subscribers[name] = callbacks
+            else:
+                self._subscribers.pop(name, None)
+            self.active = bool(self._subscribers)
+
+    def emit(self, name, **fields):
+        """
+        Call subscribers of event
+
+        name: name of event
+        fields: data of event
+        """
+        subscribers = self._subscribers
+        for callback in subscribers.get(name, ()) + subscribers.get(None, ()):
+            try:
+                callback(name, **fields)
+            except Exception:
+                pass  # instrumentation must not break labeling
+
+
+#: Events of GitHub and Filabel instances not given their own
+events = Events()
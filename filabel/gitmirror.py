@@ -0,0 +1,145 @@
+import os
+import re
+import subprocess
+import sys
+
+#: Statuses of git diff --name-status as used by GitHub API
+STATUSES = {
+    'A': 'added',
+    'C': 'copied',
+    'D': 'removed',
+    'M': 'modified',
+    'R': 'renamed',
+    'T': 'changed',
+}
+
+#: Full commit SHA, anything else from webhook payloads is not given to git
+_SHA = re.compile(r'[0-9a-f]{40}')
+
+
+class GitError(Exception):
+    """
+    Git command failed
+    """
+
+
+class GitMirrors:
+    """
+    Local clones (or bare mirrors) of repositories used for listing
+    changed files of PRs by git instead of GitHub API
+    """
+    def __init__(self, mirrors=None, root=None, threshold=1000, timeout=60,
+                 git='git'):
+        """
+        mirrors: dict of "owner/repo" -> path, listed repos always use git
+        root: optional directory with mirrors as "owner/repo.git" or
+              "owner/repo", those are used for PRs with many files
+        threshold: smallest number of changed files of PR for which
+                   mirror from root is used (0 to use it for all PRs)
+        timeout: seconds to wait for single git command
+        git: git executable
+        """
+        self.mirrors = {k.lower(): v for k, v in (mirrors or {}).items()}
+        self.root = root
+        self.threshold = threshold
+        self.timeout = timeout
+        self.git = git
+
+    def path(self, owner, repo, changed_files=None):
+        """
+        Path of mirror to be used for PR of given repo (or None if the
+        files should be listed by GitHub API)
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        changed_files: number of changed files of PR (if known)
+        """
+        path = self.mirrors.get(f'{owner}/{repo}'.lower())
+        if path is not None:
+            return path
+        if self.root is None:
+            return None
+        if self.threshold and (changed_files is None or
+                               changed_files < self.threshold):
+            return None
+        for name in (f'{repo}.git', repo):
+            path = os.path.join(self.root, owner, name)
+            if os.path.isdir(path):
+                return path
+        return None
+
+    def _git(self, path, *args):
+        try:
+            r = subprocess.run(
+                [self.git, '-C', path, *args], stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, timeout=self.timeout, check=True,
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            raise GitError(str(e)) from e
+        return r.stdout
+
+    def fetch(self, path, *refs):
+        """
+        Fetch given commits or refs from origin
+
+        path: path of the mirror
+        refs: commit SHAs or refspecs
+        """
+        self._git(path, 'fetch', '--quiet', '--end-of-options', 'origin',
+                  *refs)
+
+    def diff(self, path, base_sha, head_sha):
+        """
+        Changed files between merge base of given commits and head,
+        i.e. files of PR, as dict of filename -> status (as GitHub
+        API statuses); renamed files are listed by their new names
+
+        path: path of the mirror
+        base_sha: SHA of PR base commit
+        head_sha: SHA of PR head commit
+        """
+        self._check_shas(base_sha, head_sha)
+        out = self._git(
+            path, 'diff', '--name-status', '-z', '--find-renames',
+            '--no-ext-diff', '--end-of-options', f'{base_sha}...{head_sha}',
+            '--',
+        )
+        files = {}
+        fields = iter(out.decode('utf-8', 'surrogateescape').split('\0'))
+        for status in fields:
+            if not status:
+                continue
+            filename = next(fields)
+            if status[0] in 'RC':
+                filename = next(fields)  # new name follows the old one
+            files[sys.intern(filename)] = STATUSES.get(status[0], 'changed')
+        return files
+
+    @staticmethod
+    def _check_shas(*shas):
+        """
+        Raise GitError unless all given values are full commit SHAs
+        """
+        for sha in shas:
+            if not isinstance(sha, str) or not _SHA.fullmatch(sha):
+                raise GitError(f'Not a commit SHA: {sha!r}')
+
+    def pr_files(self, path, number, base_sha, head_sha):
+        """
+        Changed files of PR, commits missing in the mirror are fetched
+        from origin first
+
+        path: path of the mirror
+        number: PR number
+        base_sha: SHA of PR base commit
+        head_sha: SHA of PR head commit
+        """
+        self._check_shas(base_sha, head_sha)
+        if not isinstance(number, int) or isinstance(number, bool):
+            raise GitError(f'Not a PR number: {number!r}')
+        try:
+            return self.diff(path, base_sha, head_sha)
+        except GitError:
+            self.fetch(path, base_sha,
+                       f'+refs/pull/{number}/head:refs/pull/{number}/head')
+            return self.diff(path, base_sha, head_sha)
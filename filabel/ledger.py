@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+class Ledger:
+    """
+    Local record of labels last written to PRs together with what they
+    were computed from (head and base commits, labels configuration),
+    PRs with none of those changed need not be labeled again
+    """
+    def __init__(self, path):
+        """
+        path: path of SQLite database
+        """
+        self.path = path
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        """
+        SQLite connection of this process (used under lock)
+        """
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=10,
+                                       check_same_thread=False,
+                                       isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS prs (repo TEXT, number INTEGER, '
+                'head TEXT, base TEXT, config TEXT, labels TEXT, '
+                'PRIMARY KEY (repo, number))'
+            )
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS files (repo TEXT, '
+                'number INTEGER, head TEXT, base TEXT, files TEXT, '
+                'PRIMARY KEY (repo, number))'
+            )
+            self._pid = os.getpid()
+        return self._db
+
+    def get(self, reposlug, number):
+        """
+        Recorded entry of PR as tuple (head, base, config, labels)
+        or None if there is none
+
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        number: PR number
+        """
+        with self._lock:
+            row = self.db.execute(
+                'SELECT head, base, config, labels FROM prs '
+                'WHERE repo = ? AND number = ?', (reposlug.lower(), number)
+            ).fetchone()
+        if row is None:
+            return None
+        head, base, config, labels = row
+        return head, base, config, set(json.loads(labels))
+
+    def unchanged(self, reposlug, pr, config):
+        """
+        If labeling PR would give the recorded result: its commits and
+        configuration are the same and it still has the written labels
+
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        pr: PullRequest record
+        config: hash of labels configuration (see Filabel.config_hash)
+        """
+        if pr.head_sha is None or pr.base_sha is None:
+            return False
+        return self.get(reposlug, pr.number) == \
+            (pr.head_sha, pr.base_sha, config, set(pr.labels))
+
+    def files(self, reposlug, pr):
+        """
+        Recorded filenames of PR (None if not recorded for its commits)
+
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        pr: PullRequest record
+        """
+        with self._lock:
+            row = self.db.execute(
+                'SELECT files FROM files WHERE repo = ? AND number = ? '
+                'AND head = ? AND base = ?',
+                (reposlug.lower(), pr.number, pr.head_sha, pr.base_sha)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def repos(self):
+        """
+        Reposlugs of all repos with recorded PRs
+        """
+        with self._lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT DISTINCT repo FROM prs ORDER BY repo'
+            )]
+
+    def record(self, reposlug, pr, config, labels, files=None):
+        """
+        Record labels written to PR
+
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        pr: PullRequest record
+        config: hash of labels configuration (see Filabel.config_hash)
+        labels: labels the PR has now
+        files: optional filenames of PR (kept for relabeling when
+               configuration changes)
+        """
+        if pr.head_sha is None or pr.base_sha is None:
+            return
+        key = (reposlug.lower(), pr.number)
+        with self._lock:
+            self.db.execute('BEGIN')
+            self.db.execute(
+                'INSERT OR REPLACE INTO prs VALUES (?, ?, ?, ?, ?, ?)',
+                key + (pr.head_sha, pr.base_sha, config,
+                       json.dumps(sorted(labels)))
+            )
+            if files is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                    key + (pr.head_sha, pr.base_sha,
+                           json.dumps(list(files)))
+                )
+            self.db.execute('COMMIT')
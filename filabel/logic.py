@@ -1,7 +1,22 @@
+import contextlib
+import datetime
 import enum
-import fnmatch
 import itertools
-import requests
+import sys
+import threading
+import time
+import urllib.parse
+
+from filabel.cache import LRUCache, PRFiles
+from filabel.events import (LABEL_WRITE, MATCH_DONE, PR_END, PR_START,
+                            REQUEST_END, REQUEST_START, endpoint_template)
+from filabel.events import events as default_events
+from filabel.matching import MatchPool, Matcher, changed_labels
+from filabel.repoconfig import RepoConfigs
+from filabel.session import SessionManager
+from filabel.tokens import TokenPool
+from filabel.utils import DeadlineExceeded
+from filabel.utils import json_loads as default_json_loads
 
 
 class GitHub:
@@ -11,37 +26,265 @@ class GitHub:
     """
     API = 'https://api.github.com'
 
-    def __init__(self, token, session=None):
+    def __init__(self, token, session=None, sessions=None, json_loads=None,
+                 timeout=None, events=None):
         """
-        token: GitHub token
-        session: optional requests session
+        token: GitHub token or list of tokens to be used in turns
+        session: optional requests session (shared by all threads)
+        sessions: optional SessionManager providing per-thread sessions
+        json_loads: optional function decoding JSON responses
+        timeout: optional timeout of every request in seconds
+        events: optional Events to emit request events to
+                (default: filabel.events.events)
+        """
+        self.tokens = TokenPool([token] if isinstance(token, str) else token)
+        self.token = self.tokens.tokens[0]
+        #: Token pools by rate limit resource, the core one is self.tokens
+        self.pools = {'core': self.tokens}
+        #: Rate limit resources reported by GitHub for endpoints
+        self.resources = {}
+        self.json_loads = json_loads or default_json_loads
+        self.timeout = timeout
+        self.events = default_events if events is None else events
+        #: Requests left in current core rate limit window of the best token
+        #: (None until known)
+        self.rate_remaining = None
+        #: Time (epoch) the rate limit window resets
+        self.rate_reset = None
+        #: Time (epoch) of last successful and failed request
+        self.last_success = None
+        self.last_failure = None
+        self._local = threading.local()
+        self._session = session
+        if session is not None:
+            self._setup_session(session)
+        self.sessions = sessions or SessionManager()
+        if self.sessions.setup is None:
+            self.sessions.setup = self._setup_session
+
+    @property
+    def session(self):
         """
-        self.token = token
-        self.session = session or requests.Session()
-        self.session.headers = {'User-Agent': 'filabel'}
-        self.session.auth = self._token_auth
+        Requests session to be used by current thread
+        """
+        if self._session is not None:
+            return self._session
+        return self.sessions.session
+
+    def _setup_session(self, session):
+        """
+        Configure new session for communication with GitHub
+        """
+        session.headers = {'User-Agent': 'filabel'}
+        session.auth = self._token_auth
 
     def _token_auth(self, req):
         """
         This alters all our outgoing requests
         """
-        req.headers['Authorization'] = 'token ' + self.token
+        if 'Authorization' not in req.headers:
+            req.headers['Authorization'] = 'token ' + self.token
         return req
 
+    @contextlib.contextmanager
+    def deadline(self, deadline):
+        """
+        Limit requests made by current thread in this context by deadline,
+        timeouts of requests never exceed the remaining time
+
+        deadline: Deadline or None for no limit
+        """
+        previous = getattr(self._local, 'deadline', None)
+        self._local.deadline = deadline
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    def _request(self, method, url, **kwargs):
+        """
+        Send request with timeout respecting deadline of current thread
+        """
+        timeout = self.timeout
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f'No time left for {method} {url}')
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if self.events.active:
+            return self._instrumented_request(method, url, timeout, kwargs)
+        return self._send(method, url, timeout, kwargs)
+
+    def _send(self, method, url, timeout, kwargs):
+        """
+        Send request authorized by token with the most requests left,
+        request refused for rate limit is retried with another token
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        pool = self._pool(self._resource(url))
+        for _ in range(len(self.tokens)):
+            token = pool.choose()
+            headers['Authorization'] = 'token ' + token
+            try:
+                r = self.session.request(method, url, timeout=timeout,
+                                         headers=headers, **kwargs)
+            except Exception:
+                self.last_failure = time.time()
+                raise
+            throttled = self._track(r, url, token)
+            # the response may have told the resource of the endpoint
+            pool = self._pool(self._resource(url))
+            if not throttled or not pool.available():
+                break
+        return r
+
+    def _instrumented_request(self, method, url, timeout, kwargs):
+        """
+        Send request emitting request events
+        """
+        endpoint = endpoint_template(url)
+        self.events.emit(REQUEST_START, method=method,
+                         endpoint=endpoint, url=url)
+        start = time.perf_counter()
+        try:
+            r = self._send(method, url, timeout, kwargs)
+        except Exception as e:
+            self.events.emit(REQUEST_END, method=method,
+                             endpoint=endpoint, url=url, status=None, bytes=0,
+                             duration=time.perf_counter() - start, error=e)
+            raise
+        self.events.emit(REQUEST_END, method=method, endpoint=endpoint,
+                         url=url, status=r.status_code, bytes=len(r.content),
+                         duration=time.perf_counter() - start, error=None)
+        return r
+
+    def _resource(self, url):
+        """
+        Rate limit resource GitHub counts request to url against, as
+        reported by GitHub for the endpoint if any request was made
+        """
+        resource = self.resources.get(endpoint_template(url))
+        if resource is not None:
+            return resource
+        path = urllib.parse.urlsplit(url).path
+        if path.startswith('/search/'):
+            return 'search'
+        if path == '/graphql':
+            return 'graphql'
+        return 'core'
+
+    def _pool(self, resource):
+        """
+        Token pool tracking rate limit of given resource
+
+        resource: rate limit resource (core, search, ...)
+        """
+        pool = self.pools.get(resource)
+        if pool is None:
+            pool = self.pools.setdefault(resource, TokenPool(
+                self.tokens.tokens, clock=self.tokens.clock
+            ))
+        return pool
+
+    def _track(self, r, url, token):
+        """
+        Remember rate limit and outcome of response, returns True
+        if the token was throttled for the resource of the request
+
+        r: response
+        url: URL of the request
+        token: token the request was authorized by
+        """
+        now = time.time()
+        reported = r.headers.get('X-RateLimit-Resource')
+        if reported is not None and reported != self._resource(url):
+            self.resources[endpoint_template(url)] = reported
+        resource = self._resource(url)
+        pool = self._pool(resource)
+        remaining = r.headers.get('X-RateLimit-Remaining')
+        reset = r.headers.get('X-RateLimit-Reset')
+        reset = int(reset) if reset is not None else None
+        if remaining is not None:
+            pool.update(token, int(remaining), reset)
+        throttled = r.status_code in (403, 429) and (
+            remaining == '0' or 'Retry-After' in r.headers
+        )
+        if throttled:
+            retry_after = r.headers.get('Retry-After')
+            pool.throttle(
+                token, now + int(retry_after) if retry_after else reset or now
+            )
+        if resource == 'core' and (remaining is not None or throttled):
+            self.rate_remaining, self.rate_reset = self.tokens.headroom()
+        if r.status_code < 500 and r.status_code not in (401, 403, 429):
+            self.last_success = now
+        else:
+            self.last_failure = now
+        return throttled
+
     def _paginated_json_get(self, url, params=None):
-        r = self.session.get(url, params=params)
+        r = self._request('GET', url, params=params)
         r.raise_for_status()
-        json = r.json()
+        json = self.json_loads(r.content)
         if 'next' in r.links and 'url' in r.links['next']:
             json += self._paginated_json_get(r.links['next']['url'], params)
         return json
 
+    def _paginated_json_iter(self, url, params=None, key=None):
+        """
+        Iterate over items of paginated list, next page is requested
+        only after all items of previous one were consumed
+
+        key: optional key of the list if pages are objects
+        """
+        while url is not None:
+            r = self._request('GET', url, params=params)
+            r.raise_for_status()
+            page = self.json_loads(r.content)
+            yield from page if key is None else page[key]
+            url = r.links.get('next', {}).get('url')
+            params = None  # already included in next URL
+
     def user(self):
         """
         Get current user authenticated by token
         """
         return self._paginated_json_get(f'{self.API}/user')
 
+    def org_repos(self, org):
+        """
+        Get all repos of organization. A generator.
+
+        org: GitHub organization
+        """
+        url = f'{self.API}/orgs/{org}/repos'
+        return self._paginated_json_iter(url, {'per_page': 100})
+
+    def search_pull_requests(self, qualifiers):
+        """
+        Search Pull Requests (as issues) sorted by last update, returns
+        tuple (total_count, incomplete_results, items) where items is
+        a generator of found PRs. Search API provides at most 1000
+        results of a query (see Filabel.discover).
+
+        qualifiers: list of search qualifiers (e.g. "org:cvut")
+        """
+        params = {
+            'q': ' '.join(['is:pr'] + list(qualifiers)),
+            'sort': 'updated',
+            'order': 'desc',
+            'per_page': 100,
+        }
+        r = self._request('GET', f'{self.API}/search/issues', params=params)
+        r.raise_for_status()
+        page = self.json_loads(r.content)
+        rest = self._paginated_json_iter(
+            r.links.get('next', {}).get('url'), key='items'
+        )
+        return (page['total_count'], page['incomplete_results'],
+                itertools.chain(page['items'], rest))
+
     def pull_requests(self, owner, repo, state='open', base=None):
         """
         Get all Pull Requests of a repo
@@ -51,11 +294,37 @@ class GitHub:
         state: open, closed, all
         base: optional branch the PRs are open for
         """
-        params = {'state': state}
+        params = {'state': state, 'per_page': 100}
+        if base is not None:
+            params['base'] = base
+        url = f'{self.API}/repos/{owner}/{repo}/pulls'
+        return [PullRequest.from_json(d)
+                for d in self._paginated_json_iter(url, params)]
+
+    def pulls_etag(self, owner, repo, state='open', base=None, etag=None):
+        """
+        Probe if PRs of repo changed using conditional request for
+        the most recently updated PR, returns tuple (status, etag)
+        where status is 304 when nothing changed since given etag
+        (such requests do not count against rate limit)
+
+        owner: GtiHub user or org
+        repo: repo name
+        state: open, closed, all
+        base: optional branch the PRs are open for
+        etag: optional ETag of previous probe
+        """
+        params = {'state': state, 'sort': 'updated', 'direction': 'desc',
+                  'per_page': 1}
         if base is not None:
             params['base'] = base
         url = f'{self.API}/repos/{owner}/{repo}/pulls'
-        return self._paginated_json_get(url, params)
+        headers = {'If-None-Match': etag} if etag else {}
+        r = self._request('GET', url, params=params, headers=headers)
+        if r.status_code == 304:
+            return r.status_code, etag
+        r.raise_for_status()
+        return r.status_code, r.headers.get('ETag')
 
     def pr_files(self, owner, repo, number):
         """
@@ -76,7 +345,41 @@ class GitHub:
         repo: repo name
         number: PR number/id
         """
-        return (f['filename'] for f in self.pr_files(owner, repo, number))
+        return (sys.intern(f['filename'])
+                for f in self.pr_files(owner, repo, number))
+
+    def compare(self, owner, repo, base, head):
+        """
+        Compare two commits (GitHub lists at most 300 changed files)
+
+        owner: GtiHub user or org
+        repo: repo name
+        base: base commit SHA
+        head: head commit SHA
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/compare/{base}...{head}'
+        r = self._request('GET', url)
+        r.raise_for_status()
+        return self.json_loads(r.content)
+
+    def contents(self, owner, repo, path, etag=None):
+        """
+        Get file from default branch of repo using conditional request,
+        returns tuple (status, etag, json) where json is None unless
+        status is 200 (304 when not modified, 404 when not found)
+
+        owner: GtiHub user or org
+        repo: repo name
+        path: path of the file in repo
+        etag: optional ETag of previously fetched file
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/contents/{path}'
+        headers = {'If-None-Match': etag} if etag else {}
+        r = self._request('GET', url, headers=headers)
+        if r.status_code in (304, 404):
+            return r.status_code, etag, None
+        r.raise_for_status()
+        return r.status_code, r.headers.get('ETag'), self.json_loads(r.content)
 
     def reset_labels(self, owner, repo, number, labels):
         """
@@ -87,9 +390,95 @@ class GitHub:
         lables: all lables this PR will have
         """
         url = f'{self.API}/repos/{owner}/{repo}/issues/{number}'
-        r = self.session.patch(url, json={'labels': labels})
+        r = self._request('PATCH', url, json={'labels': labels})
+        r.raise_for_status()
+        return self.json_loads(r.content)['labels']
+
+    def add_labels(self, owner, repo, number, labels):
+        """
+        Add labels to Pull Request keeping the other ones,
+        returns all labels it has then
+
+        owner: GtiHub user or org
+        repo: repo name
+        number: PR number/id
+        labels: labels to be added
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/issues/{number}/labels'
+        r = self._request('POST', url, json={'labels': list(labels)})
         r.raise_for_status()
-        return r.json()['labels']
+        return self.json_loads(r.content)
+
+    def remove_label(self, owner, repo, number, label):
+        """
+        Remove label from Pull Request keeping the other ones,
+        returns all labels it has then (None if it did not have it)
+
+        owner: GtiHub user or org
+        repo: repo name
+        number: PR number/id
+        label: label to be removed
+        """
+        name = urllib.parse.quote(label, safe='')
+        url = f'{self.API}/repos/{owner}/{repo}/issues/{number}/labels/{name}'
+        r = self._request('DELETE', url)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return self.json_loads(r.content)
+
+    def issue_labels(self, owner, repo, number):
+        """
+        Get labels of Pull Request
+
+        owner: GtiHub user or org
+        repo: repo name
+        number: PR number/id
+        """
+        url = f'{self.API}/repos/{owner}/{repo}/issues/{number}/labels'
+        return self._paginated_json_get(url, {'per_page': 100})
+
+
+class PullRequest:
+    """
+    Compact record of Pull Request with fields needed for labeling
+    """
+    __slots__ = ('number', 'html_url', 'head_sha', 'base_sha', 'labels',
+                 'changed_files')
+
+    def __init__(self, number, html_url='unknown', head_sha=None,
+                 base_sha=None, labels=(), changed_files=None):
+        """
+        number: PR number
+        html_url: PR URL
+        head_sha: SHA of PR head commit (if known)
+        base_sha: SHA of PR base commit (if known)
+        labels: names of labels the PR has
+        changed_files: number of changed files (if known, lists of PRs
+                       do not include it, webhooks do)
+        """
+        self.number = number
+        self.html_url = html_url
+        self.head_sha = head_sha
+        self.base_sha = base_sha
+        self.labels = labels
+        self.changed_files = changed_files
+
+    @classmethod
+    def from_json(cls, d):
+        """
+        Project PR (or issue from search) from GitHub API to record
+
+        d: PR as dict from GitHub API
+        """
+        return cls(
+            d['number'],
+            d.get('html_url', 'unknown'),
+            d.get('head', {}).get('sha'),
+            d.get('base', {}).get('sha'),
+            tuple(sys.intern(l['name']) for l in d['labels']),
+            d.get('changed_files'),
+        )
 
 
 class Change(enum.Enum):
@@ -101,6 +490,61 @@ class Change(enum.Enum):
     NONE = 3
 
 
+class LabelPlan:
+    """
+    Planned label changes of single PR
+    """
+    __slots__ = ('reposlug', 'number', 'url', 'existing', 'future', 'changes')
+
+    def __init__(self, reposlug, number, url, existing, future, changes):
+        """
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        number: PR number
+        url: PR URL
+        existing: Set of labels that are currently in PR
+        future: Set of labels that PR should have
+        changes: Sorted list of (label, Change) pairs
+        """
+        self.reposlug = reposlug
+        self.number = number
+        self.url = url
+        self.existing = existing
+        self.future = future
+        self.changes = changes
+
+    @property
+    def needs_write(self):
+        """
+        If labels of PR have to be changed
+        """
+        return self.existing != self.future
+
+    def to_dict(self):
+        """
+        Plan as JSON-serializable dict
+        """
+        return {
+            'repo': self.reposlug,
+            'number': self.number,
+            'url': self.url,
+            'existing': sorted(self.existing),
+            'future': sorted(self.future),
+            'changes': [[label, t.name] for label, t in self.changes],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Plan from dict created by to_dict
+
+        d: dict with plan
+        """
+        return cls(
+            d['repo'], d['number'], d['url'], set(d['existing']),
+            set(d['future']), [(label, Change[t]) for label, t in d['changes']]
+        )
+
+
 class Report:
     """
     Simple container for reporting repo-pr label changes
@@ -109,33 +553,149 @@ class Report:
         self.repo = repo
         self.ok = True
         self.prs = {}
+        self.skipped = False
+        self.skipped_prs = []
+        self.unchanged_prs = []
+
+    def to_dict(self):
+        """
+        Report as JSON-serializable dict
+        """
+        return {
+            'repo': self.repo,
+            'ok': self.ok,
+            'skipped': self.skipped,
+            'skipped_prs': self.skipped_prs,
+            'unchanged_prs': self.unchanged_prs,
+            'prs': [
+                [url, None if result is None else
+                 [[label, t.name] for label, t in result]]
+                for url, result in self.prs.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Report from dict created by to_dict
+
+        d: dict with report
+        """
+        report = cls(d['repo'])
+        report.ok = d['ok']
+        report.skipped = d.get('skipped', False)
+        report.skipped_prs = d.get('skipped_prs', [])
+        report.unchanged_prs = d.get('unchanged_prs', [])
+        for url, result in d['prs']:
+            report.prs[url] = None if result is None else [
+                (label, Change[t]) for label, t in result
+            ]
+        return report
 
 
 class Filabel:
     """
     Main login of PR labeler
     """
+    #: GitHub compare API lists at most this number of files
+    COMPARE_FILES_LIMIT = 300
+    #: GitHub search API accepts queries up to this length
+    SEARCH_QUERY_LIMIT = 256
+    #: GitHub search API provides at most this number of results of a query
+    SEARCH_RESULTS_LIMIT = 1000
+    #: Search without start time covers PRs updated since then
+    SEARCH_EPOCH = datetime.datetime(2008, 1, 1,
+                                     tzinfo=datetime.timezone.utc)
+    #: Time windows of searches are not split to shorter ones
+    SEARCH_MIN_WINDOW = datetime.timedelta(seconds=2)
+    #: If labels of PRs are written even if they would not change
+    write_unchanged = True
+
     def __init__(self, token, labels,
-                 state='open', base=None, delete_old=True):
+                 state='open', base=None, delete_old=True, file_cache=None,
+                 repo_config=None, match_processes=0, git_mirrors=None,
+                 events=None, ledger=None, match_min_files=None):
         """
         token: GitHub token
         labels: Configuration of labels with globs
         state: State of PR to be (re)labeled
         base: Base branch of PRs to be (re)labeled
         delete_old: If no longer matching labels should be deleted
+        file_cache: optional LRUCache for incremental updates of PR files
+        repo_config: optional path of in-repo labels configuration
+                     overriding the given one
+        match_processes: number of processes for matching huge PRs
+                         (0 to match in-process only)
+        match_min_files: smallest number of files of PR matched
+                         in the processes (default: MatchPool.MIN_FILES)
+        git_mirrors: optional GitMirrors for listing files of PRs
+                     by git instead of GitHub API
+        events: optional Events to emit events to
+                (default: filabel.events.events)
+        ledger: optional Ledger of written labels, PRs unchanged since
+                are skipped by run_prs (files of PRs are recorded too,
+                a file cache is created for it if none is given)
         """
-        self.github = GitHub(token)
+        self.events = default_events if events is None else events
+        self.github = GitHub(token, events=self.events)
         self.labels = labels
         self.state = state
         self.base = base
         self.delete_old = delete_old
+        if ledger is not None and file_cache is None:
+            file_cache = LRUCache(256)
+        self.file_cache = file_cache
+        self.repo_configs = None
+        if repo_config:
+            self.repo_configs = RepoConfigs(self.github, repo_config)
+        self.pr_estimate = None
+        self.git_mirrors = git_mirrors
+        self.ledger = ledger
+        #: Queries with PRs missing from results of last discover
+        self.incomplete_searches = []
+        self.match_pool = None
+        if match_processes:
+            self.match_pool = MatchPool(
+                self.matcher, match_processes,
+                min_files=match_min_files or MatchPool.MIN_FILES,
+            )
+
+    @property
+    def labels(self):
+        """
+        Configuration of labels with globs
+        """
+        return self.matcher.labels
+
+    @labels.setter
+    def labels(self, labels):
+        self.matcher = Matcher(labels)
 
     @property
     def defined_labels(self):
         """
         Set of labels defined in configuration
         """
-        return set(self.labels.keys())
+        return self.matcher.defined
+
+    def matcher_for(self, owner, repo):
+        """
+        Matcher to be used for given repo
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        """
+        if self.repo_configs is None:
+            return self.matcher
+        return self.repo_configs.matcher(owner, repo, self.matcher)
+
+    def config_hash(self, matcher):
+        """
+        Hash of configuration labels of PRs are computed from
+
+        matcher: Matcher used for matching
+        """
+        return f'{matcher.digest}:{int(self.delete_old)}'
 
     def _matching_labels(self, pr_filenames):
         """
@@ -143,14 +703,220 @@ class Filabel:
 
         pr_filenames: list of filenames as strings
         """
-        labels = set()
-        for filename in pr_filenames:
-            for label, patterns in self.labels.items():
-                for pattern in patterns:
-                    if fnmatch.fnmatch(filename, pattern):
-                        labels.add(label)
-                        break
-        return labels
+        return set(self._count_labels(self.matcher, list(pr_filenames)))
+
+    def _count_labels(self, matcher, filenames):
+        """
+        Count matching files for each label, in worker processes
+        if there is match pool and enough filenames
+
+        matcher: Matcher to be used
+        filenames: list of filenames as strings
+        """
+        if self.match_pool is None:
+            return matcher.count(filenames)
+        return self.match_pool.count(matcher, filenames)
+
+    def _git_pr_files(self, owner, repo, pr):
+        """
+        List all files of PR as dict of filename -> status by git,
+        returns None if there is no suitable mirror
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        """
+        if self.git_mirrors is None or \
+                pr.head_sha is None or pr.base_sha is None:
+            return None
+        path = self.git_mirrors.path(owner, repo, pr.changed_files)
+        if path is None:
+            return None
+        from filabel.gitmirror import GitError  # loaded by git_mirrors
+        try:
+            return self.git_mirrors.pr_files(
+                path, pr.number, pr.base_sha, pr.head_sha
+            )
+        except GitError:
+            return None  # mirror not usable, GitHub API still is
+
+    def _fetch_pr_files(self, owner, repo, pr, matcher):
+        """
+        Fetch all files of PR
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        matcher: Matcher used for counting labels
+        """
+        files = self._git_pr_files(owner, repo, pr)
+        if files is None:
+            files = self.github.pr_files(owner, repo, pr.number)
+        return self._new_pr_files(pr, files, matcher)
+
+    def _new_pr_files(self, pr, files, matcher):
+        """
+        PRFiles of PR with label counts of given files
+
+        pr: PullRequest record
+        files: dict of filename -> status or files from GitHub API
+        matcher: Matcher used for counting labels
+        """
+        pr_files = PRFiles(pr.head_sha, matcher, pr.base_sha)
+        if isinstance(files, dict):
+            pr_files.files = files
+        else:
+            pr_files.files = {sys.intern(f['filename']): f['status']
+                              for f in files}
+        pr_files.label_counts = self._count_labels(
+            matcher, list(pr_files.files)
+        )
+        return pr_files
+
+    def _update_pr_files(self, owner, repo, cached, head_sha, matcher):
+        """
+        Apply changes between cached and new head commit to PR files,
+        returns None if the change cannot be applied incrementally
+
+        Note that a file reverted back to its base content is still
+        considered changed until the PR files are fetched again.
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        cached: PRFiles of previous head commit
+        head_sha: SHA of new PR head commit
+        matcher: Matcher used for counting labels
+        """
+        comparison = self.github.compare(
+            owner, repo, cached.head_sha, head_sha
+        )
+        return self._apply_comparison(cached, comparison, head_sha, matcher)
+
+    def _apply_comparison(self, cached, comparison, head_sha, matcher):
+        """
+        Apply comparison of cached and new head commit to PR files,
+        returns None if the change cannot be applied incrementally
+
+        cached: PRFiles of previous head commit
+        comparison: comparison of the commits from GitHub API
+        head_sha: SHA of new PR head commit
+        matcher: Matcher used for counting labels
+        """
+        delta = comparison.get('files', [])
+        if comparison.get('status') != 'ahead' or \
+                len(delta) >= self.COMPARE_FILES_LIMIT:
+            return None  # force push or truncated list
+        commits = comparison.get('commits', [])
+        if comparison.get('total_commits', len(commits)) > len(commits) or \
+                any(len(c.get('parents', ())) > 1 for c in commits):
+            # merged base brings in files that are not changed by the PR
+            return None
+
+        pr_files = cached.copy(head_sha, matcher)
+        for f in delta:
+            filename, status = f['filename'], f['status']
+            if status == 'renamed':
+                self._remove_pr_file(pr_files, f['previous_filename'], matcher)
+                status = 'added'
+            if status == 'removed':
+                self._remove_pr_file(pr_files, filename, matcher)
+            elif pr_files.files.get(filename) == 'removed':
+                pr_files.add(filename, 'modified', matcher)
+            elif filename not in pr_files.files:
+                pr_files.add(filename, status, matcher)
+        return pr_files
+
+    @staticmethod
+    def _remove_pr_file(pr_files, filename, matcher):
+        """
+        Record removal of file from PR files
+
+        pr_files: PRFiles to be updated
+        filename: name of removed file
+        matcher: Matcher used for counting labels
+        """
+        if pr_files.files.get(filename) == 'added':
+            pr_files.discard(filename, matcher)  # created and removed in PR
+        else:
+            pr_files.add(filename, 'removed', matcher)
+
+    @staticmethod
+    def _updatable(cached, pr, before):
+        """
+        If cached files can be updated by comparing previous and new
+        head commit: the PR was synchronized from the cached head
+        and its base is the one the files were listed against
+
+        cached: PRFiles of previous head commit
+        pr: PullRequest record
+        before: SHA of PR head before synchronization (or None)
+        """
+        return before is not None and cached.head_sha == before and \
+            pr.base_sha is not None and cached.base_sha == pr.base_sha
+
+    def _pr_matching_labels(self, owner, repo, pr, matcher, before=None):
+        """
+        Find matching labels of PR, using and updating file cache
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        matcher: Matcher used for matching
+        before: optional SHA of PR head before synchronization
+        """
+        number = pr.number
+        if self.file_cache is None:
+            filenames = self._git_pr_files(owner, repo, pr)
+            if filenames is None:
+                filenames = self.github.pr_filenames(owner, repo, number)
+            return set(self._count_labels(matcher, list(filenames)))
+
+        pr_files, updatable = self._cached_pr_files(owner, repo, pr, before)
+        if updatable is not None:
+            try:
+                pr_files = self._update_pr_files(
+                    owner, repo, updatable, pr.head_sha, matcher
+                )
+            except Exception:
+                pr_files = None
+        if pr_files is None:
+            pr_files = self._fetch_pr_files(owner, repo, pr, matcher)
+        self._cache_pr_files(owner, repo, pr, pr_files)
+        return pr_files.labels(matcher)
+
+    def _cached_pr_files(self, owner, repo, pr, before):
+        """
+        Look PR up in file cache, returns tuple (pr_files, updatable):
+        cached files of current PR head and cached files of previous
+        head to be updated by comparing the heads (either or both None)
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        before: SHA of PR head before synchronization (or None)
+        """
+        if pr.head_sha is None:
+            return None, None
+        cached = self.file_cache.get((owner, repo, pr.number))
+        if cached is None:
+            return None, None
+        if cached.head_sha == pr.head_sha:
+            return cached, None
+        if self._updatable(cached, pr, before):
+            return None, cached
+        return None, None
+
+    def _cache_pr_files(self, owner, repo, pr, pr_files):
+        """
+        Remember files of PR head in file cache
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        pr_files: PRFiles of the PR head
+        """
+        if pr.head_sha is not None:
+            self.file_cache.put((owner, repo, pr.number), pr_files)
 
     def _compute_labels(self, defined, matching, existing):
         """
@@ -170,53 +936,427 @@ class Filabel:
         future = future | matching
         return added, remained, deleted, future
 
-    def run_pr(self, owner, repo, pr_dict):
+    def plan_pr(self, owner, repo, pr, before=None):
         """
-        Manage labels for single given PR
+        Compute label changes of single given PR without applying them
 
         owner: Owner of GitHub repository
         repo: Name of GitHub repository
-        pr_dict: PR as dict from GitHub API
+        pr: PullRequest record (or PR as dict from GitHub API)
+        before: optional SHA of PR head before synchronization
         """
-        pr_filenames = list(
-            self.github.pr_filenames(owner, repo, pr_dict['number'])
-        )
+        if not isinstance(pr, PullRequest):
+            pr = PullRequest.from_json(pr)
+        matcher = self.matcher_for(owner, repo)
+        start = time.perf_counter()
+        matching = self._pr_matching_labels(owner, repo, pr, matcher, before)
+        return self._plan(owner, repo, pr, matcher, matching, start)
+
+    def _plan(self, owner, repo, pr, matcher, matching, start):
+        """
+        Plan label changes of PR from its matching labels
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record
+        matcher: Matcher used for matching
+        matching: Set of matching labels
+        start: time (perf_counter) the matching started
+        """
+        if self.events.active:
+            self.events.emit(MATCH_DONE, reposlug=f'{owner}/{repo}',
+                             number=pr.number, labels=matching,
+                             duration=time.perf_counter() - start)
+        existing = set(pr.labels)
         added, remained, deleted, future = self._compute_labels(
-            self.defined_labels,
-            self._matching_labels(pr_filenames),
-            set(l['name'] for l in pr_dict['labels'])
+            matcher.defined, matching, existing
         )
-
-        new_labels = self.github.reset_labels(
-            owner, repo, pr_dict['number'], list(future)
+        return LabelPlan(
+            f'{owner}/{repo}', pr.number, pr.html_url, existing, future,
+            sorted(itertools.chain(
+                [(a, Change.ADD) for a in added],
+                [(r, Change.NONE) for r in remained],
+                [(d, Change.DELETE) for d in deleted]
+            ))
         )
 
-        new_label_names = set(l['name'] for l in new_labels)
-        return sorted(itertools.chain(
-            [(a, Change.ADD) for a in added],
-            [(r, Change.NONE) for r in remained],
-            [(d, Change.DELETE) for d in deleted]
-        )) if future == new_label_names else None
+    def apply_plan(self, plan):
+        """
+        Apply planned label changes, returns the changes
+        or None if labels were not set as planned
+
+        plan: LabelPlan to be applied
+        """
+        owner, repo = plan.reposlug.split('/')
+        start = time.perf_counter()
+        new_labels = None
+        try:
+            new_labels = self.github.reset_labels(
+                owner, repo, plan.number, list(plan.future)
+            )
+        finally:
+            result = self._written(plan, new_labels, start)
+        return result
+
+    def _written(self, plan, new_labels, start):
+        """
+        Check labels written by plan, returns the changes or None
+        if labels were not set as planned
+
+        plan: LabelPlan applied
+        new_labels: labels of PR from GitHub API after the write
+                    (None if the write failed)
+        start: time (perf_counter) the write started
+        """
+        names = None
+        if new_labels is not None:
+            names = set(l['name'] for l in new_labels)
+        if self.events.active:
+            self.events.emit(LABEL_WRITE, reposlug=plan.reposlug,
+                             number=plan.number, labels=plan.future,
+                             duration=time.perf_counter() - start,
+                             ok=plan.future == names)
+        return plan.changes if plan.future == names else None
+
+    def apply_changes(self, plan):
+        """
+        Apply only label changes of plan (adding and removing single
+        labels), so labels changed by others since planning are kept;
+        returns the changes or None if they were not applied
+
+        plan: LabelPlan to be applied
+        """
+        owner, repo = plan.reposlug.split('/')
+        added = [l for l, change in plan.changes if change == Change.ADD]
+        deleted = [l for l, change in plan.changes if change == Change.DELETE]
+        start = time.perf_counter()
+        names = None
+        try:
+            labels = None
+            for label in deleted:
+                labels = self.github.remove_label(owner, repo, plan.number,
+                                                  label)
+            if added:
+                labels = self.github.add_labels(owner, repo, plan.number,
+                                                added)
+            if labels is None:
+                labels = self.github.issue_labels(owner, repo, plan.number)
+            names = set(l['name'] for l in labels)
+        finally:
+            ok = names is not None and set(added) <= names and \
+                not names & set(deleted)
+            if self.events.active:
+                self.events.emit(LABEL_WRITE, reposlug=plan.reposlug,
+                                 number=plan.number, labels=names,
+                                 duration=time.perf_counter() - start,
+                                 ok=ok)
+        return plan.changes if ok else None
+
+    def run_pr(self, owner, repo, pr, before=None, deadline=None):
+        """
+        Manage labels for single given PR
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        pr: PullRequest record (or PR as dict from GitHub API)
+        before: optional SHA of PR head before synchronization
+        deadline: optional Deadline limiting requests to GitHub
+        """
+        number = pr.number if isinstance(pr, PullRequest) else pr['number']
+        self._emit_pr_start(owner, repo, number)
+        result = None
+        with self._deadline(deadline):
+            start = time.monotonic()
+            try:
+                result = self.apply_plan(
+                    self.plan_pr(owner, repo, pr, before)
+                )
+            finally:
+                duration = time.monotonic() - start
+                self._emit_pr_end(owner, repo, number, duration, result)
+            self._record_pr_duration(duration)
+            return result
+
+    def _emit_pr_start(self, owner, repo, number):
+        if self.events.active:
+            self.events.emit(PR_START, reposlug=f'{owner}/{repo}',
+                             number=number)
+
+    def _emit_pr_end(self, owner, repo, number, duration, result):
+        if self.events.active:
+            self.events.emit(PR_END, reposlug=f'{owner}/{repo}',
+                             number=number, duration=duration,
+                             ok=result is not None)
 
-    def run_repo(self, reposlug):
+    def _record_pr_duration(self, duration):
+        """
+        Update estimate of time needed for single PR
+
+        duration: seconds the last PR took
+        """
+        if self.pr_estimate is None:
+            self.pr_estimate = duration
+        else:
+            self.pr_estimate = 0.8 * self.pr_estimate + 0.2 * duration
+
+    def _deadline(self, deadline):
+        """
+        Context limiting requests to GitHub by deadline (if any)
+        """
+        if deadline is None:
+            return contextlib.nullcontext()
+        return self.github.deadline(deadline)
+
+    def has_time(self, deadline):
+        """
+        If there is enough time left to manage another PR
+
+        deadline: Deadline or None for no limit
+        """
+        if deadline is None:
+            return True
+        return deadline.remaining() > (self.pr_estimate or 0)
+
+    def run_repo(self, reposlug, plans=None, shard=None, deadline=None):
         """
         Manage labels for all matching PRs in given repo
 
         reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        plans: optional list to collect plans to instead of applying them
+        shard: optional Shard selecting PRs (by number) to be managed
+        deadline: optional Deadline, PRs are not started after it
         """
-        report = Report(reposlug)
         owner, repo = reposlug.split('/')
+        report = Report(reposlug)
+        if not self.has_time(deadline):
+            report.skipped = True
+            return report
         try:
-            prs = self.github.pull_requests(owner, repo, self.state, self.base)
+            with self._deadline(deadline):
+                prs = self.github.pull_requests(
+                    owner, repo, self.state, self.base
+                )
+        except DeadlineExceeded:
+            report.skipped = True
+            return report
         except Exception:
             report.ok = False
             return report
+        if shard is not None:
+            prs = [pr for pr in prs if pr.number in shard]
+        return self.run_prs(reposlug, prs, plans, deadline)
+
+    def run_prs(self, reposlug, prs, plans=None, deadline=None):
+        """
+        Manage labels for given PRs of repo
 
-        for pr_dict in prs:
-            url = pr_dict.get('html_url', 'unknown')
-            report.prs[url] = None
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        prs: PullRequest records
+        plans: optional list to collect plans to instead of applying them
+        deadline: optional Deadline, PRs are not started after it
+        """
+        report = Report(reposlug)
+        owner, repo = reposlug.split('/')
+        config = None
+        if self.ledger is not None and plans is None:
             try:
-                report.prs[url] = self.run_pr(owner, repo, pr_dict)
+                with self._deadline(deadline):
+                    config = self.config_hash(self.matcher_for(owner, repo))
+            except Exception:
+                pass  # PRs are labeled without the ledger
+        for pr in prs:
+            url = pr.html_url
+            if config is not None and \
+                    self.ledger.unchanged(reposlug, pr, config):
+                report.unchanged_prs.append(url)
+                continue
+            if not self.has_time(deadline):
+                report.skipped_prs.append(url)
+                continue
+            result = None
+            self._emit_pr_start(owner, repo, pr.number)
+            start = time.monotonic()
+            try:
+                with self._deadline(deadline):
+                    plan = self.plan_pr(owner, repo, pr)
+                    if plans is None and (plan.needs_write or
+                                          self.write_unchanged):
+                        result = self.apply_plan(plan)
+                    else:
+                        if plans is not None:
+                            plans.append(plan)
+                        result = plan.changes
+                    if config is not None and result is not None:
+                        self.ledger.record(reposlug, pr, config, plan.future,
+                                           self._cached_files(owner, repo, pr))
+            except DeadlineExceeded:
+                report.skipped_prs.append(url)  # ran out of time midway
             except Exception:
                 pass
+            if url not in report.skipped_prs:
+                report.prs[url] = result
+            duration = time.monotonic() - start
+            self._emit_pr_end(owner, repo, pr.number, duration, result)
+            self._record_pr_duration(duration)
+        return report
+
+    def _cached_files(self, owner, repo, pr):
+        """
+        Filenames of PR from file cache (None if not cached)
+        """
+        pr_files = self.file_cache.get((owner, repo, pr.number))
+        if pr_files is None or pr_files.head_sha != pr.head_sha:
+            return None
+        return list(pr_files.files)
+
+    def relabel_prs(self, reposlug, prs, old_labels):
+        """
+        Apply change of labels configuration from old one to the current
+        one: PRs recorded in ledger with old configuration are matched
+        only against changed labels using recorded files and labels are
+        written only if they differ, other PRs are managed as by run_prs
+
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        prs: PullRequest records
+        old_labels: previous configuration of labels with globs
+        """
+        report = Report(reposlug)
+        owner, repo = reposlug.split('/')
+        old_config = self.config_hash(Matcher(old_labels))
+        new_config = self.config_hash(self.matcher)
+        new_labels = self.matcher.labels
+        changed = changed_labels(old_labels, new_labels)
+        # labels dropped from configuration are kept as they are
+        changed_matcher = Matcher({l: new_labels[l]
+                                   for l in changed if l in new_labels})
+        rest = []
+        for pr in prs:
+            url = pr.html_url
+            existing = set(pr.labels)
+            files = None
+            if self.ledger.unchanged(reposlug, pr, old_config):
+                files = self.ledger.files(reposlug, pr)
+            if files is None:
+                rest.append(pr)
+                continue
+            matching = changed_matcher.matching(files)
+            added, remained, deleted, _ = self._compute_labels(
+                changed_matcher.defined, matching, existing
+            )
+            future = (existing | added) - deleted
+            if future == existing:
+                self.ledger.record(reposlug, pr, new_config, future, files)
+                report.unchanged_prs.append(url)
+                continue
+            plan = LabelPlan(reposlug, pr.number, url, existing, future,
+                             sorted(itertools.chain(
+                                 [(a, Change.ADD) for a in added],
+                                 [(r, Change.NONE) for r in remained],
+                                 [(d, Change.DELETE) for d in deleted]
+                             )))
+            try:
+                report.prs[url] = self.apply_plan(plan)
+            except Exception:
+                report.prs[url] = None
+            if report.prs[url] is not None:
+                self.ledger.record(reposlug, pr, new_config, future, files)
+        if rest:
+            rest_report = self.run_prs(reposlug, rest)
+            report.prs.update(rest_report.prs)
+            report.unchanged_prs += rest_report.unchanged_prs
         return report
+
+    def search_qualifiers(self, since=None, until=None):
+        """
+        Search qualifiers selecting PRs to be (re)labeled
+
+        since: optional datetime of oldest PR update
+        until: optional datetime of newest PR update
+        """
+        qualifiers = ['archived:false']
+        if self.state != 'all':
+            qualifiers.append(f'is:{self.state}')
+        if self.base is not None:
+            qualifiers.append(f'base:{self.base}')
+        since, until = (t.strftime('%Y-%m-%dT%H:%M:%SZ') if t else None
+                        for t in (since, until))
+        if since is not None and until is not None:
+            qualifiers.append(f'updated:{since}..{until}')
+        elif since is not None:
+            qualifiers.append(f'updated:>={since}')
+        elif until is not None:
+            qualifiers.append(f'updated:<={until}')
+        return qualifiers
+
+    def discover(self, targets, since=None):
+        """
+        Find PRs updated since given time using search API, targets are
+        grouped to as few queries as query length allows. A generator
+        of (reposlug, PullRequest) pairs.
+
+        Queries with more results than search API provides are split
+        to fewer targets or shorter time windows. Queries that could
+        not be searched completely are listed in incomplete_searches
+        once the generator is exhausted.
+
+        targets: iterable of search qualifiers "repo:owner/name" or
+                 "org:name"
+        since: optional datetime of oldest PR update
+        """
+        self.incomplete_searches = []
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # time window of split query is longer than the open one
+        base_length = len(' '.join(
+            ['is:pr'] + self.search_qualifiers(self.SEARCH_EPOCH, now)
+        ))
+        seen = set()
+        batch = []
+        for target in itertools.chain(targets, [None]):
+            length = base_length + sum(len(t) + 1 for t in batch)
+            if batch and (target is None or
+                          length + len(target) + 1 > self.SEARCH_QUERY_LIMIT):
+                for reposlug, pr in self._search(batch, since, None, now):
+                    if (reposlug, pr.number) not in seen:
+                        seen.add((reposlug, pr.number))
+                        yield reposlug, pr
+                batch = []
+            if target is not None:
+                batch.append(target)
+
+    def _search(self, batch, since, until, now):
+        """
+        Search PRs of targets updated in time window, splitting the
+        query if it has too many results. A generator of
+        (reposlug, PullRequest) pairs, PRs on window boundaries may
+        be found twice.
+
+        batch: list of targets
+        since: datetime of oldest PR update or None
+        until: datetime of newest PR update or None
+        now: datetime of search start (end of open time window)
+        """
+        qualifiers = self.search_qualifiers(since, until) + batch
+        total, incomplete, items = self.github.search_pull_requests(
+            qualifiers
+        )
+        if total > self.SEARCH_RESULTS_LIMIT:
+            start = since or self.SEARCH_EPOCH
+            if start.tzinfo is None:
+                start = start.replace(tzinfo=datetime.timezone.utc)
+            end = until or now
+            if len(batch) > 1:
+                half = len(batch) // 2
+                yield from self._search(batch[:half], since, until, now)
+                yield from self._search(batch[half:], since, until, now)
+                return
+            if end - start >= self.SEARCH_MIN_WINDOW:
+                middle = start + (end - start) / 2
+                yield from self._search(batch, start, middle, now)
+                yield from self._search(batch, middle, end, now)
+                return
+            incomplete = True
+        if incomplete:
+            self.incomplete_searches.append(' '.join(['is:pr'] + qualifiers))
+        for item in items:
+            reposlug = '/'.join(item['repository_url'].split('/')[-2:])
+            yield reposlug, PullRequest.from_json(item)
@@ -0,0 +1,199 @@
+import collections
+import fnmatch
+import hashlib
+import itertools
+import os
+import re
+import threading
+
+
+class Matcher:
+    """
+    Labels configuration compiled for matching filenames
+    """
+    def __init__(self, labels):
+        """
+        labels: Configuration of labels with globs
+        """
+        self.labels = labels
+        self.digest = labels_digest(labels)
+        self._matchers = [
+            (label, re.compile('|'.join(
+                fnmatch.translate(os.path.normcase(p)) for p in patterns
+            )).match)
+            for label, patterns in labels.items() if patterns
+        ]
+
+    @property
+    def defined(self):
+        """
+        Set of labels defined in configuration
+        """
+        return set(self.labels.keys())
+
+    def file_labels(self, filename):
+        """
+        Find labels matching single filename
+
+        filename: filename as string
+        """
+        filename = os.path.normcase(filename)
+        return [label for label, match in self._matchers if match(filename)]
+
+    def count(self, filenames):
+        """
+        Count matching files for each label
+
+        filenames: iterable of filenames as strings
+        """
+        counts = collections.Counter()
+        for filename in filenames:
+            counts.update(self.file_labels(filename))
+        return counts
+
+    def matching(self, filenames):
+        """
+        Find labels matching any of given filenames
+
+        filenames: iterable of filenames as strings
+        """
+        return set(self.count(filenames))
+
+
+def labels_digest(labels):
+    """
+    Compute hash identifying labels configuration
+
+    labels: Configuration of labels with globs
+    """
+    h = hashlib.sha1()
+    for label in sorted(labels):
+        h.update(label.encode('utf-8') + b'\0')
+        for pattern in labels[label]:
+            h.update(pattern.encode('utf-8') + b'\1')
+        h.update(b'\2')
+    return h.hexdigest()
+
+
+def changed_labels(old, new):
+    """
+    Labels added, removed or with changed patterns between two
+    labels configurations
+
+    old: Configuration of labels with globs
+    new: Configuration of labels with globs
+    """
+    return {
+        label for label in set(old) | set(new)
+        if label not in old or label not in new or
+        set(old[label]) != set(new[label])
+    }
+
+
+#: Matcher built in worker process in advance
+_worker_matcher = None
+#: Other matchers built in worker process, by digest
+_worker_matchers = {}
+
+
+def _init_worker(labels):
+    """
+    Build matcher in worker process before any batch arrives
+    """
+    global _worker_matcher
+    _worker_matcher = Matcher(labels)
+
+
+def _count_batch(digest, labels, batch):
+    """
+    Count matching files of batch in worker process
+
+    digest: digest of labels configuration
+    labels: labels configuration or None for matcher built in advance
+    batch: NUL-separated filenames
+    """
+    if labels is None:
+        return dict(_worker_matcher.count(batch.split('\0')))
+    matcher = _worker_matchers.get(digest)
+    if matcher is None:
+        matcher = Matcher(labels)
+        if len(_worker_matchers) >= 16:
+            _worker_matchers.clear()
+        _worker_matchers[digest] = matcher
+    return dict(matcher.count(batch.split('\0')))
+
+
+class MatchPool:
+    """
+    Matches large sets of filenames in worker processes, so matching
+    does not hold GIL of the main process, small sets are matched
+    in-process where sending them would cost more than matching
+    """
+    #: Smallest number of filenames matched in workers by default
+    #: (GitHub API lists at most 3000 files of PR)
+    MIN_FILES = 1000
+
+    def __init__(self, matcher, processes=None, batch_size=500,
+                 min_files=MIN_FILES):
+        """
+        matcher: Matcher prepared in workers in advance
+        processes: number of worker processes (default: CPU count)
+        batch_size: number of filenames sent to worker at once
+        min_files: smallest number of filenames matched in workers
+        """
+        self.digest = matcher.digest
+        self.labels = matcher.labels
+        self.processes = processes
+        self.batch_size = batch_size
+        self.min_files = min_files
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """
+        Pool of worker processes, started on first use
+        """
+        # imported here, most runs never start worker processes
+        import concurrent.futures
+        import multiprocessing
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking multi-threaded process is not safe
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.labels,),
+                )
+            return self._executor
+
+    def count(self, matcher, filenames):
+        """
+        Count matching files for each label
+
+        matcher: Matcher to be used
+        filenames: list of filenames as strings
+        """
+        if len(filenames) < self.min_files:
+            return matcher.count(filenames)
+        labels = None if matcher.digest == self.digest else matcher.labels
+        batches = [
+            '\0'.join(filenames[i:i + self.batch_size])
+            for i in range(0, len(filenames), self.batch_size)
+        ]
+        counts = collections.Counter()
+        for result in self.executor.map(
+                _count_batch, itertools.repeat(matcher.digest),
+                itertools.repeat(labels), batches):
+            counts.update(result)
+        return counts
+
+    def shutdown(self):
+        """
+        Stop worker processes
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from filabel.logic import LabelPlan, Report
+
+
+class PlanWriter:
+    """
+    Writes label plans to file as JSON lines as they are planned
+    """
+    def __init__(self, file):
+        """
+        file: text file opened for writing
+        """
+        self.file = file
+
+    def append(self, plan):
+        """
+        Write single plan
+
+        plan: LabelPlan to be written
+        """
+        self.file.write(json.dumps(plan.to_dict(), separators=(',', ':')))
+        self.file.write('\n')
+
+
+def read_plans(file):
+    """
+    Read label plans written by PlanWriter. A generator.
+
+    file: text file opened for reading
+    """
+    for line in file:
+        if line.strip():
+            yield LabelPlan.from_dict(json.loads(line))
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing operations evenly in time
+    """
+    def __init__(self, rate=None):
+        """
+        rate: maximal number of operations per second (None for no limit)
+        """
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until next operation is allowed
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def apply_plans(filabel, plans, workers=4, rate=None, deadline=None):
+    """
+    Apply label plans in parallel with limited rate of writes,
+    plans that do not change labels are not written at all.
+    Only planned changes are written, labels changed by others since
+    planning are kept. Returns reports per repo in order of plans.
+
+    filabel: Filabel to apply plans with
+    plans: iterable of LabelPlans
+    workers: number of parallel writers
+    rate: maximal number of writes per second (None for no limit)
+    deadline: optional Deadline, writes are not started after it
+    """
+    import concurrent.futures  # plain CLI runs do not need threads
+    limiter = RateLimiter(rate)
+    skipped = object()
+
+    def apply(plan):
+        if not plan.needs_write:
+            return plan.changes
+        limiter.wait()
+        if deadline is not None and deadline.expired:
+            return skipped
+        try:
+            with filabel._deadline(deadline):
+                return filabel.apply_changes(plan)
+        except Exception:
+            return None
+
+    reports = {}
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        plans = list(plans)
+        for plan, result in zip(plans, executor.map(apply, plans)):
+            if plan.reposlug not in reports:
+                reports[plan.reposlug] = Report(plan.reposlug)
+            if result is skipped:
+                reports[plan.reposlug].skipped_prs.append(plan.url)
+            else:
+                reports[plan.reposlug].prs[plan.url] = result
+    return list(reports.values())
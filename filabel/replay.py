@@ -0,0 +1,301 @@
+import concurrent.futures
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+import requests
+import requests.adapters
+import requests.structures
+
+from filabel.plan import RateLimiter
+
+#: Request headers needed to replay webhook delivery
+HEADERS = ('Content-Type', 'X-GitHub-Event', 'X-GitHub-Delivery',
+           'X-Hub-Signature', 'User-Agent')
+
+
+class DeliveryRecorder:
+    """
+    Appends webhook deliveries (headers and raw body) to gzipped
+    JSON lines file, kept open and flushed after every delivery
+    """
+    def __init__(self, path):
+        """
+        path: path of the recording file, "{pid}" is replaced by process
+              ID (so each worker process can write its own file)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def record(self, headers, body):
+        """
+        Append single delivery
+
+        headers: request headers (mapping, names in any case)
+        body: raw request body as bytes
+        """
+        headers = {h.lower(): v for h, v in headers.items()}
+        line = json.dumps({
+            'time': time.time(),
+            'headers': {h: headers[h.lower()] for h in HEADERS
+                        if h.lower() in headers},
+            'body': body.decode('utf-8'),
+        }, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._lock:
+            if self._pid != os.getpid():
+                # file of parent process is left to it after fork;
+                # every opening appends a gzip member, those can be
+                # concatenated
+                self._file = gzip.open(self.path.format(pid=os.getpid()),
+                                       'ab')
+                self._pid = os.getpid()
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """
+        Finish the recording file of current process
+        """
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = self._pid = None
+
+
+def read_deliveries(path):
+    """
+    Read recorded deliveries. A generator of (headers, body) pairs.
+    Recording still being written can be read too.
+
+    path: path of the recording file
+    """
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    delivery = json.loads(line)
+                    yield (delivery['headers'],
+                           delivery['body'].encode('utf-8'))
+        except EOFError:
+            pass  # flushed, but not finished by the recorder yet
+
+
+def repeat_deliveries(path, repeat=1, keep_ids=False):
+    """
+    Read recorded deliveries given number of times. A generator of
+    (headers, body) pairs. Delivery IDs get suffix unique for each
+    pass of each call, so a service skipping duplicate deliveries
+    processes the replayed ones again.
+
+    path: path of the recording file
+    repeat: number of passes over the recording
+    keep_ids: if delivery IDs should be replayed as recorded
+    """
+    run = uuid.uuid4().hex[:8]
+    for n in range(1, repeat + 1):
+        for headers, body in read_deliveries(path):
+            delivery = headers.get('X-GitHub-Delivery')
+            if delivery and not keep_ids:
+                headers = dict(headers)
+                headers['X-GitHub-Delivery'] = f'{delivery}-replay-{run}-{n}'
+            yield headers, body
+
+
+def percentile(values, p):
+    """
+    Percentile of sorted values (nearest rank)
+
+    values: sorted list of numbers
+    p: percentile (0-100)
+    """
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class ReplayResult:
+    """
+    Statistics of replayed deliveries
+    """
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.duration = 0.0
+
+    def add(self, latency, status):
+        """
+        Record single delivery
+
+        latency: seconds the delivery took
+        status: HTTP status code or None if request failed
+        """
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status is None or status >= 400:
+            self.errors += 1
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        """
+        Deliveries per second
+        """
+        return self.count / self.duration if self.duration else 0.0
+
+    def summary(self):
+        """
+        Summary of statistics as dict
+        """
+        latencies = sorted(self.latencies)
+        return {
+            'deliveries': self.count,
+            'errors': self.errors,
+            'statuses': self.statuses,
+            'duration': self.duration,
+            'throughput': self.throughput,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+        }
+
+
+class StubGitHubAdapter(requests.adapters.BaseAdapter):
+    """
+    Transport answering GitHub API requests of in-process replays
+    without network: every PR has the same files, label writes are
+    echoed and other requests are not found; each response takes
+    given latency
+    """
+    def __init__(self, latency=0.05, files=('README.md', 'setup.py',
+                                            'docs/index.rst')):
+        """
+        latency: seconds each response takes
+        files: filenames of every PR
+        """
+        super().__init__()
+        self.latency = latency
+        self.files = files
+        self.requests = 0
+
+    def _answer(self, method, path, body):
+        if method == 'GET' and re.fullmatch(r'/user', path):
+            return 200, {'login': 'filabel-replay',
+                         'html_url': 'https://github.com/filabel-replay'}
+        if method == 'GET' and re.fullmatch(r'/repos/[^/]+/[^/]+/pulls/\d+'
+                                            r'/files', path):
+            return 200, [{'filename': f, 'status': 'modified'}
+                         for f in self.files]
+        if method == 'PATCH' and \
+                re.fullmatch(r'/repos/[^/]+/[^/]+/issues/\d+', path):
+            labels = json.loads(body)['labels']
+            return 200, {'labels': [{'name': l} for l in labels]}
+        if method == 'POST' and \
+                re.fullmatch(r'/repos/[^/]+/[^/]+/issues/\d+/labels', path):
+            labels = json.loads(body)['labels']
+            return 200, [{'name': l} for l in labels]
+        return 404, {'message': 'Not Found'}
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        status, data = self._answer(
+            request.method, urllib.parse.urlsplit(request.url).path,
+            request.body,
+        )
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(data).encode('utf-8')
+        response.headers = requests.structures.CaseInsensitiveDict({
+            'Content-Type': 'application/json; charset=utf-8',
+            'X-RateLimit-Remaining': '5000',
+            'X-RateLimit-Reset': str(int(time.time()) + 3600),
+        })
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def app_sender(app):
+    """
+    Sender delivering to Flask app in-process
+
+    app: Flask app (e.g. from create_app)
+    """
+    local = threading.local()
+
+    def send(headers, body):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client.post('/', data=body, headers=headers).status_code
+    return send
+
+
+def http_sender(url, timeout=30):
+    """
+    Sender delivering to running service over HTTP
+
+    url: URL of webhook listener
+    timeout: seconds to wait for response
+    """
+    local = threading.local()
+
+    def send(headers, body):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session.post(url, data=body, headers=headers,
+                                  timeout=timeout).status_code
+    return send
+
+
+def replay(deliveries, send, rate=None, concurrency=1):
+    """
+    Replay deliveries and measure latency of each
+
+    deliveries: iterable of (headers, body) pairs
+    send: callable delivering single (headers, body), returns status
+    rate: deliveries per second (None for as fast as possible)
+    concurrency: number of deliveries in flight
+    """
+    result = ReplayResult()
+    limiter = RateLimiter(rate)
+    lock = threading.Lock()
+
+    def deliver(delivery):
+        limiter.wait()
+        start = time.perf_counter()
+        try:
+            status = send(*delivery)
+        except Exception:
+            status = None
+        latency = time.perf_counter() - start
+        with lock:
+            result.add(latency, status)
+
+    start = time.perf_counter()
+    pending = set()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        for delivery in deliveries:
+            # deliveries are read only a little ahead of sending them
+            if len(pending) >= 2 * concurrency:
+                _, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+            pending.add(executor.submit(deliver, delivery))
+    result.duration = time.perf_counter() - start
+    return result
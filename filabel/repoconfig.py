@@ -0,0 +1,141 @@
+import base64
+import configparser
+import time
+
+from filabel.cache import LRUCache
+from filabel.matching import Matcher, labels_digest
+from filabel.utils import parse_labels
+
+
+class RepoConfig:
+    """
+    State of labels configuration file in one repo
+    """
+    __slots__ = ('etag', 'sha', 'matcher', 'checked_at')
+
+    def __init__(self, etag, sha, matcher, checked_at):
+        self.etag = etag
+        self.sha = sha
+        self.matcher = matcher
+        self.checked_at = checked_at
+
+
+class RepoConfigs:
+    """
+    Labels configurations stored in repos, fetched with conditional
+    requests and cached by blob SHA, compiled matchers are shared
+    by all repos with the same configuration
+    """
+    def __init__(self, github, path='.github/filabel.cfg', ttl=60,
+                 maxsize=4096, matchers=256):
+        """
+        github: GitHub client to fetch configuration with
+        path: path of configuration file in repo
+        ttl: seconds before cached configuration is checked again
+        maxsize: number of repos and blobs to be cached
+        matchers: number of compiled matchers to be cached
+        """
+        self.github = github
+        self.path = path
+        self.ttl = ttl
+        self._repos = LRUCache(maxsize)
+        self._blobs = LRUCache(maxsize)
+        self._matchers = LRUCache(matchers)
+
+    def _compile(self, content):
+        """
+        Parse configuration file content and compile (or reuse) matcher
+
+        content: content of configuration file
+        """
+        cfg = configparser.ConfigParser()
+        cfg.read_string(content)
+        labels = parse_labels(cfg)
+        digest = labels_digest(labels)
+        matcher = self._matchers.get(digest)
+        if matcher is None:
+            matcher = Matcher(labels)
+            self._matchers.put(digest, matcher)
+        return matcher
+
+    def _matcher_from_blob(self, contents):
+        """
+        Get matcher for file from contents API, each blob is parsed once
+
+        contents: file from GitHub contents API
+        """
+        sha = contents['sha']
+        digest = self._blobs.get(sha)
+        matcher = None if digest is None else self._matchers.get(digest)
+        if matcher is None:
+            content = base64.b64decode(contents['content']).decode('utf-8')
+            matcher = self._compile(content)
+            self._blobs.put(sha, matcher.digest)
+        return matcher
+
+    def check(self, owner, repo):
+        """
+        Look repo up in cache, returns tuple (cached, stale): cached
+        RepoConfig (None if not cached) and if it has to be checked
+        by conditional request for the configuration file
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        """
+        cached = self._repos.get(f'{owner}/{repo}')
+        stale = cached is None or \
+            time.monotonic() - cached.checked_at >= self.ttl
+        return cached, stale
+
+    def update(self, owner, repo, cached, response):
+        """
+        Update cache by response of conditional request for configuration
+        file, returns RepoConfig of repo (None if still unknown)
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        cached: RepoConfig the request was conditioned on (or None)
+        response: tuple (status, etag, json) from contents API,
+                  None if the request failed
+        """
+        now = time.monotonic()
+        status = 304  # failed request: keep using what we have
+        if response is not None:
+            status, etag, contents = response
+        if status == 304:
+            if cached is not None:
+                cached.checked_at = now
+            return cached
+
+        if status == 404:
+            cached = RepoConfig(None, None, None, now)
+        elif cached is not None and cached.sha == contents['sha']:
+            cached = RepoConfig(etag, cached.sha, cached.matcher, now)
+        else:
+            try:
+                matcher = self._matcher_from_blob(contents)
+            except Exception:
+                matcher = None  # broken configuration, use default
+            cached = RepoConfig(etag, contents['sha'], matcher, now)
+        self._repos.put(f'{owner}/{repo}', cached)
+        return cached
+
+    def matcher(self, owner, repo, default):
+        """
+        Get matcher for repo or given default if repo has no (usable)
+        configuration file
+
+        owner: Owner of GitHub repository
+        repo: Name of GitHub repository
+        default: Matcher to be used without in-repo configuration
+        """
+        cached, stale = self.check(owner, repo)
+        if stale:
+            try:
+                response = self.github.contents(
+                    owner, repo, self.path, cached and cached.etag
+                )
+            except Exception:
+                response = None
+            cached = self.update(owner, repo, cached, response)
+        return (cached and cached.matcher) or default
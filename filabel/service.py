@@ -0,0 +1,313 @@
+import configparser
+import os
+import signal
+import threading
+import time
+
+from filabel.matching import Matcher
+from filabel.utils import parse_labels
+
+
+class CachedGitHubUser:
+    """
+    GitHub user authenticated by token, fetched in background
+    and cached for given time to live
+    """
+    def __init__(self, github, ttl=600, retry=30):
+        """
+        github: GitHub client to fetch the user with
+        ttl: seconds after which the cached user is refreshed
+        retry: seconds after which a failed fetch is retried
+        """
+        self.github = github
+        self.ttl = ttl
+        self.retry = retry
+        self.user = None
+        self.error = None
+        self.fetched_at = None
+        self._next_fetch = 0
+        self._reset()
+
+    def _reset(self):
+        """
+        Forget fetch thread, also of parent process (threads are not
+        inherited by forked child, e.g. worker of preloaded app)
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = threading.Event()
+
+    @property
+    def pending(self):
+        """
+        If there is a fetch running in the background
+        """
+        return self._thread is not None
+
+    def _fetch(self):
+        try:
+            user = self.github.user()
+        except Exception as e:
+            with self._lock:
+                self.error = e
+                self._next_fetch = time.monotonic() + self.retry
+                self._thread = None
+        else:
+            with self._lock:
+                self.user = user
+                self.error = None
+                self.fetched_at = time.time()
+                self._next_fetch = time.monotonic() + self.ttl
+                self._thread = None
+        self._done.set()
+
+    def refresh(self, force=False):
+        """
+        Start background fetch of the user if cache is stale
+
+        force: fetch even if the cached user is still fresh
+        """
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._thread is not None:
+                return
+            if not force and time.monotonic() < self._next_fetch:
+                return
+            self._done.clear()
+            self._thread = threading.Thread(
+                target=self._fetch, name='filabel-github-user', daemon=True
+            )
+            self._thread.start()
+
+    def get(self, wait=None):
+        """
+        Get cached user (or None if not fetched yet), never blocks
+        longer than given wait time
+
+        wait: seconds to wait for pending fetch if no user is cached
+        """
+        self.refresh()
+        if self.user is None and wait:
+            self._done.wait(wait)
+        return self.user
+
+
+class LabelsReloader:
+    """
+    Reloads labels configuration of Filabel when configuration files
+    change or when asked to (e.g. by SIGHUP), new configuration is
+    compiled in background thread and then swapped in at once
+    """
+    def __init__(self, filabel, paths, interval=5, logger=None):
+        """
+        filabel: Filabel to be reconfigured
+        paths: configuration files to read
+        interval: seconds between checks of files (0 to check only
+                  when reload is requested)
+        logger: optional logger for reporting reloads
+        """
+        self.filabel = filabel
+        self.paths = paths
+        self.interval = interval
+        self.logger = logger
+        self.version = 1
+        self.loaded_at = time.time()
+        self.duration = 0.0
+        self.error = None
+        self._mtimes = self._stat()
+        self._requested = False
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def reload(self):
+        """
+        Read configuration files and swap new labels in if changed,
+        current configuration is kept if new one is not usable
+        """
+        start = time.perf_counter()
+        self._mtimes = self._stat()
+        try:
+            cfg = configparser.ConfigParser()
+            cfg.read(self.paths)
+            matcher = Matcher(parse_labels(cfg))
+        except Exception as e:
+            self.error = e
+            if self.logger is not None:
+                self.logger.error(f'Labels configuration not reloaded: {e}')
+            return False
+        self.error = None
+        if matcher.digest == self.filabel.matcher.digest:
+            return False
+        self.filabel.matcher = matcher
+        self.duration = time.perf_counter() - start
+        self.loaded_at = time.time()
+        self.version += 1
+        if self.logger is not None:
+            self.logger.info(
+                f'Labels configuration reloaded as version {self.version} '
+                f'in {self.duration * 1000:.1f} ms'
+            )
+        return True
+
+    def request_reload(self, *args):
+        """
+        Ask background thread to reload configuration, safe to be
+        used as signal handler
+        """
+        self._requested = True
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval or None)
+            self._wakeup.clear()
+            if self._requested or self._mtimes != self._stat():
+                self._requested = False
+                self.reload()
+
+    def start(self, sighup=True):
+        """
+        Start watching configuration in background thread
+
+        sighup: reload also on SIGHUP (only possible from main thread)
+        """
+        if self._thread is None:
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='filabel-labels-reloader', daemon=True
+            )
+            self._thread.start()
+        if sighup and hasattr(signal, 'SIGHUP'):
+            try:
+                signal.signal(signal.SIGHUP, self.request_reload)
+            except ValueError:
+                pass  # not in main thread
+
+    def ensure_running(self):
+        """
+        Start watching again in forked child process (e.g. worker
+        of preloaded app), which does not inherit the thread; cheap
+        enough to be called on every request
+        """
+        if self._thread is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = None
+                self._wakeup = threading.Event()
+                self.start(sighup=False)  # signal handler is inherited
+
+
+class Backpressure:
+    """
+    Tracks webhooks in flight and health of GitHub API to tell when
+    the service should not accept more work; webhooks in flight are
+    counted in the current process only
+    """
+    def __init__(self, github, max_in_flight=16, min_rate_remaining=50,
+                 stale_after=300, retry_after=30):
+        """
+        github: GitHub client whose requests are tracked
+        max_in_flight: number of webhooks processed at once above which
+                       new ones are refused (0 for no limit)
+        min_rate_remaining: rate limit headroom below which new webhooks
+                            are refused
+        stale_after: seconds after last successful GitHub request before
+                     failing requests make the service not ready
+        retry_after: seconds clients are asked to wait when refused
+        """
+        self.github = github
+        self.max_in_flight = max_in_flight
+        self.min_rate_remaining = min_rate_remaining
+        self.stale_after = stale_after
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def overload(self):
+        """
+        Reasons why new webhooks should be refused (empty if there
+        are none)
+        """
+        problems = []
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            problems.append(f'{self.in_flight} webhooks in flight')
+        remaining = self.github.rate_remaining
+        if remaining is not None and remaining < self.min_rate_remaining and \
+                (self.github.rate_reset or 0) > time.time():
+            problems.append(f'{remaining} GitHub API requests left')
+        return problems
+
+    def problems(self):
+        """
+        Reasons why the service is not ready (empty if it is), unlike
+        overload also includes failing GitHub API (webhooks are still
+        admitted then, their requests are needed to find out it works)
+        """
+        problems = self.overload()
+        success = self.github.last_success
+        failure = self.github.last_failure
+        if failure is not None and (success is None or failure > success) \
+                and time.time() - (success or 0) > self.stale_after:
+            problems.append('GitHub API not reachable')
+        return problems
+
+    def wait_time(self):
+        """
+        Seconds clients should wait before retrying
+        """
+        reset = self.github.rate_reset
+        remaining = self.github.rate_remaining
+        if remaining is not None and remaining < self.min_rate_remaining \
+                and reset:
+            return max(self.retry_after, int(reset - time.time()) + 1)
+        return self.retry_after
+
+    def enter(self):
+        """
+        Admit webhook for processing, returns False if it should be
+        refused (and then exit must not be called)
+        """
+        with self._lock:
+            if self.overload():
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def exit(self):
+        """
+        Mark admitted webhook as processed
+        """
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        """
+        Readiness and its inputs as dict
+        """
+        problems = self.problems()
+        return {
+            'ready': not problems,
+            'problems': problems,
+            'pid': os.getpid(),  # in_flight and shed are per process
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'shed': self.shed,
+            'rate_remaining': self.github.rate_remaining,
+            'last_success': self.github.last_success,
+        }
@@ -0,0 +1,140 @@
+import os
+import threading
+import weakref
+
+import requests
+
+#: Session managers to be reset in forked child processes
+_managers = weakref.WeakSet()
+
+
+class SessionManager:
+    """
+    Provides separate requests session (and so connection pool)
+    for each thread and each process, sessions inherited by forked
+    child process are dropped and created again on demand, sessions
+    of ended threads are closed
+    """
+    def __init__(self, setup=None, pool_connections=10, pool_maxsize=10,
+                 adapter=None):
+        """
+        setup: optional callable to configure every new session
+        pool_connections: number of per-host pools for each session
+        pool_maxsize: maximum connections kept in each pool
+        adapter: optional transport adapter used by all sessions instead
+                 of network (e.g. for replays)
+        """
+        self.setup = setup
+        self.adapter = adapter
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._reset()
+        _managers.add(self)
+
+    def _reset(self):
+        """
+        Forget all sessions (without closing their connections,
+        those may be shared with parent process after fork)
+        """
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._sessions = weakref.WeakSet()
+        self._created = 0
+        self._requests = 0
+
+    def _count_request(self, response, *args, **kwargs):
+        self._requests += 1
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = self.adapter or requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if self.adapter is None:
+            # connections of thread's session are closed when it ends
+            weakref.finalize(session, _close_adapter, adapter, os.getpid())
+        session.hooks['response'].append(self._count_request)
+        if self.setup is not None:
+            self.setup(session)
+        return session
+
+    @property
+    def session(self):
+        """
+        Session of current thread in current process
+        """
+        if self._pid != os.getpid():
+            # fork without register_at_fork support
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._new_session()
+            self._local.session = session
+            with self._lock:
+                self._sessions.add(session)
+                self._created += 1
+        return session
+
+    def close(self):
+        """
+        Close all sessions of current process
+        """
+        with self._lock:
+            for session in list(self._sessions):
+                session.close()
+            self._reset()
+
+    def stats(self):
+        """
+        Statistics of sessions and connection pools in this process
+        """
+        sessions = list(self._sessions)
+        pools = []
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                manager = getattr(adapter, 'poolmanager', None)
+                if manager is None:
+                    continue
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    if pool is None:
+                        continue
+                    pools.append({
+                        'host': f'{pool.scheme}://{pool.host}',
+                        'connections': pool.num_connections,
+                        'requests': pool.num_requests,
+                        'idle': pool.pool.qsize() if pool.pool else 0,
+                    })
+        return {
+            'pid': self._pid,
+            'sessions': len(sessions),
+            'sessions_created': self._created,
+            'requests': self._requests,
+            'connections': sum(p['connections'] for p in pools),
+            'pools': pools,
+        }
+
+
+def _close_adapter(adapter, pid):
+    """
+    Close connections of adapter of a session no longer used, unless
+    they are inherited from parent process
+    """
+    if os.getpid() == pid:
+        adapter.close()
+
+
+def _reset_after_fork():
+    for manager in list(_managers):
+        manager._lock = threading.Lock()
+        manager._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
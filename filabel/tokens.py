@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+class TokenPool:
+    """
+    GitHub tokens used in turns, each with its own rate limit,
+    requests go to the token with the most requests left
+    """
+    def __init__(self, tokens, clock=time.time):
+        """
+        tokens: list of GitHub tokens
+        clock: function returning current time (epoch)
+        """
+        if not tokens:
+            raise ValueError('At least one GitHub token is needed')
+        self.tokens = list(dict.fromkeys(tokens))
+        self.clock = clock
+        self._remaining = {t: None for t in self.tokens}
+        self._reset = {t: None for t in self.tokens}
+        self._throttled = {t: 0 for t in self.tokens}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def _left(self, token, now):
+        """
+        Requests left for token (None if unknown or window was reset)
+        """
+        reset = self._reset[token]
+        if reset is not None and reset <= now:
+            return None
+        return self._remaining[token]
+
+    def available(self):
+        """
+        Tokens not set aside for being throttled
+        """
+        now = self.clock()
+        return [t for t in self.tokens if self._throttled[t] <= now]
+
+    def choose(self):
+        """
+        Token to be used for next request: the one with the most
+        requests left (tokens never used first), if all tokens are
+        throttled the one released first
+        """
+        now = self.clock()
+        with self._lock:
+            best, best_left = None, -1
+            for token in self.tokens:
+                if self._throttled[token] > now:
+                    continue
+                left = self._left(token, now)
+                left = float('inf') if left is None else left
+                if left > best_left:
+                    best, best_left = token, left
+            if best is None:
+                return min(self.tokens, key=self._throttled.get)
+            if self._remaining[best] is not None:
+                # spread concurrent requests before responses tell more
+                self._remaining[best] -= 1
+            return best
+
+    def update(self, token, remaining, reset=None):
+        """
+        Record rate limit of token reported by GitHub
+
+        token: token used for the request
+        remaining: requests left in current window
+        reset: time (epoch) the window resets
+        """
+        with self._lock:
+            self._remaining[token] = remaining
+            self._reset[token] = reset
+
+    def throttle(self, token, until):
+        """
+        Set token aside until given time
+
+        token: throttled token
+        until: time (epoch) the token can be used again
+        """
+        with self._lock:
+            self._throttled[token] = until
+
+    def headroom(self):
+        """
+        Requests left for the best available token and time its window
+        resets, as tuple (None for unknown)
+        """
+        now = self.clock()
+        best, best_left = None, -1
+        with self._lock:
+            for token in self.available():
+                left = self._left(token, now)
+                if left is None:
+                    return None, None
+                if left > best_left:
+                    best, best_left = token, left
+        if best is None:
+            return 0, min(self._throttled.values())
+        return best_left, self._reset[best]
@@ -1,3 +1,44 @@
+import json
+import time
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_decoder(name=None):
+    """
+    Get function decoding JSON from bytes or str
+
+    name: "orjson", "json" or None for the fastest one available
+    """
+    if name is None:
+        name = 'json' if orjson is None else 'orjson'
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError('JSON decoder orjson is not installed')
+        return orjson.loads
+    if name == 'json':
+        return json.loads
+    raise ValueError(f'Unknown JSON decoder {name}')
+
+
+#: Default JSON decoder
+json_loads = json_decoder()
+
+
+def parse_tokens(value):
+    """
+    Parse GitHub tokens separated by whitespace (e.g. one per line)
+
+    value: token option from configuration
+    """
+    tokens = value.split()
+    if not tokens:
+        raise ValueError('No GitHub token configured')
+    return tokens
 
 
 def parse_labels(cfg):
@@ -11,3 +52,69 @@ def parse_labels(cfg):
         label: list(filter(None, cfg['labels'][label].splitlines()))
         for label in cfg['labels']
     }
+
+
+class Shard:
+    """
+    One of N parts of work, items are assigned by stable hash
+    """
+    def __init__(self, index, count):
+        """
+        index: number of this shard (1 to count)
+        count: number of shards
+        """
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f'Shard {index}/{count} not valid')
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse shard in form "I/N"
+
+        text: shard specification
+        """
+        try:
+            index, count = (int(x) for x in text.split('/'))
+        except ValueError:
+            raise ValueError(f'Shard {text} not valid (use I/N)')
+        return cls(index, count)
+
+    def __contains__(self, key):
+        """
+        If item with given key (e.g. reposlug or PR number) belongs here
+        """
+        digest = zlib.crc32(str(key).lower().encode('utf-8'))
+        return digest % self.count == self.index - 1
+
+    def __str__(self):
+        return f'{self.index}/{self.count}'
+
+
+class DeadlineExceeded(Exception):
+    """
+    There is no time left to do the work
+    """
+
+
+class Deadline:
+    """
+    Point in time by which work has to be done
+    """
+    def __init__(self, seconds):
+        """
+        seconds: time budget from now
+        """
+        self.budget = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        """
+        Seconds left until deadline (0 if passed)
+        """
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
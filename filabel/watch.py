@@ -0,0 +1,126 @@
+import signal
+import threading
+import time
+
+from filabel.logic import Report
+
+
+class WatchedRepo:
+    """
+    Polling state of single watched repo
+    """
+    __slots__ = ('reposlug', 'etag', 'interval', 'due')
+
+    def __init__(self, reposlug, interval, due):
+        """
+        reposlug: Reposlug (full name) of GitHub repo (i.e. "owner/name")
+        interval: current seconds between polls
+        due: monotonic time of next poll
+        """
+        self.reposlug = reposlug
+        self.etag = None
+        self.interval = interval
+        self.due = due
+
+
+class Watcher:
+    """
+    Keeps labels of PRs up to date by polling repos, a repo is labeled
+    only when conditional request tells its PRs changed, repos with no
+    changes are polled less and less often
+    """
+    def __init__(self, filabel, reposlugs, output, interval=60,
+                 max_interval=None, clock=time.monotonic):
+        """
+        filabel: Filabel to be used (kept with its caches for all polls)
+        reposlugs: reposlugs (i.e. "owner/repo") to be watched
+        output: callable receiving Report of each labeled repo
+        interval: shortest seconds between polls of repo
+        max_interval: longest seconds between polls of repo
+                      (default: 10 times interval)
+        clock: function returning monotonic time
+        """
+        self.filabel = filabel
+        self.output = output
+        self.interval = interval
+        self.max_interval = max_interval or 10 * interval
+        self.clock = clock
+        now = clock()
+        self.repos = [WatchedRepo(r, interval, now) for r in reposlugs]
+        self._stop = threading.Event()
+
+    @property
+    def stopped(self):
+        """
+        If the watcher was asked to stop
+        """
+        return self._stop.is_set()
+
+    def stop(self, *args):
+        """
+        Ask watcher to stop after the repo being labeled, safe to be
+        used as signal handler
+        """
+        self._stop.set()
+
+    def poll(self, watched):
+        """
+        Poll single repo, label its PRs if they changed and schedule
+        next poll, returns Report or None if nothing changed
+
+        watched: WatchedRepo to be polled
+        """
+        fl = self.filabel
+        owner, repo = watched.reposlug.split('/')
+        try:
+            status, etag = fl.github.pulls_etag(
+                owner, repo, fl.state, fl.base, watched.etag
+            )
+        except Exception:
+            report = Report(watched.reposlug)
+            report.ok = False
+        else:
+            if status == 304:
+                watched.interval = min(watched.interval * 2,
+                                       self.max_interval)
+                watched.due = self.clock() + watched.interval
+                return None
+            report = fl.run_repo(watched.reposlug)
+            if report.ok and None not in report.prs.values():
+                watched.etag = etag  # failed PRs are retried next poll
+            watched.interval = max(watched.interval / 2, self.interval)
+        watched.due = self.clock() + watched.interval
+        return report
+
+    def run_once(self):
+        """
+        Poll all repos which are due, returns seconds until next poll
+        """
+        for watched in self.repos:
+            if self.stopped:
+                break
+            if watched.due <= self.clock():
+                report = self.poll(watched)
+                if report is not None:
+                    self.output(report)
+        if not self.repos:
+            return self.max_interval
+        return max(0, min(w.due for w in self.repos) - self.clock())
+
+    def run(self, handle_signals=True):
+        """
+        Poll repos until stopped
+
+        handle_signals: stop gracefully on SIGTERM and SIGINT
+                        (only possible from main thread)
+        """
+        previous = {}
+        if handle_signals:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                previous[signum] = signal.signal(signum, self.stop)
+        try:
+            while not self.stopped:
+                self._stop.wait(self.run_once())
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
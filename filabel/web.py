@@ -1,12 +1,19 @@
 import configparser
+import datetime
 import flask
 import hashlib
 import hmac
-import jinja2
+import markupsafe
 import os
 
-from filabel.logic import Filabel
-from filabel.utils import parse_labels
+from filabel.cache import LRUCache
+from filabel.deliveries import DeliveryStore
+from filabel.gitmirror import GitMirrors
+from filabel.logic import Filabel, PullRequest
+from filabel.replay import DeliveryRecorder
+from filabel.service import Backpressure, CachedGitHubUser, LabelsReloader
+from filabel.utils import (Deadline, DeadlineExceeded, json_decoder,
+                           parse_labels, parse_tokens)
 
 
 def webhook_verify_signature(payload, signature, secret, encoding='utf-8'):
@@ -24,64 +31,214 @@ def webhook_verify_signature(payload, signature, secret, encoding='utf-8'):
     return hmac.compare_digest('sha1=' + h.hexdigest(), signature)
 
 
-def process_webhook_pr(payload):
+class HTTPError(Exception):
     """
-    Process webhook event "pull_request"
+    Request answered by error status
+    """
+    def __init__(self, code, message):
+        """
+        code: HTTP status code
+        message: text of the response
+        """
+        super().__init__(message)
+        self.code = code
+        self.message = message
 
-    payload: event payload
+
+class Webhook:
     """
-    filabel = flask.current_app.config['filabel']
-    try:
-        action = payload['action']
-        pull_request = payload['pull_request']
-        pr_number = payload['number']
-        pr_url = pull_request['url'].split('/')  # no repo field in payload!
-        owner = pr_url[-4]
-        repo = pr_url[-3]
-        reposlug = f'{owner}/{repo}'
-
-        if action not in ('opened', 'synchronize'):
-            flask.current_app.logger.info(
-                f'Action {action} from {reposlug}#{pr_number} skipped'
+    Checks and decisions about one webhook delivery shared by the web
+    applications; reading the body, recording, claiming and releasing
+    the delivery and labeling PRs is left to the application
+    """
+    #: Supported events
+    EVENTS = ('pull_request', 'ping')
+    #: Actions of "pull_request" event labels are managed for
+    PR_ACTIONS = ('opened', 'synchronize')
+
+    def __init__(self, config, headers, remote_addr, logger):
+        """
+        config: application config filled by load_config
+        headers: request headers (case-insensitive mapping)
+        remote_addr: IP address of the sender
+        logger: logger of the application
+        """
+        self.config = config
+        self.remote_addr = remote_addr
+        self.logger = logger
+        self.headers = headers
+        self.event = headers.get('X-GitHub-Event', '')
+        delivery = headers.get('X-GitHub-Delivery')
+        #: ID of delivery to be claimed (None if not tracked)
+        self.delivery = delivery or None
+        if config['deliveries'] is None:
+            self.delivery = None
+        self.reposlug, self.number, self.action = 'unknown', None, None
+
+    def check_length(self, length):
+        """
+        Refuse declared body longer than allowed, before reading it
+
+        length: declared length of body (None if not declared)
+        """
+        if length is not None and length > self.config['MAX_CONTENT_LENGTH']:
+            raise HTTPError(413, 'Payload too large')
+
+    def verify(self, data):
+        """
+        Verify signature of body by configured secret
+
+        data: raw body
+        """
+        secret = self.config['secret']
+        signature = self.headers.get('X-Hub-Signature', '')
+        if secret is not None and not webhook_verify_signature(
+                data, signature, secret
+        ):
+            self.logger.warning(
+                f'Attempt with bad secret from IP {self.remote_addr}'
             )
-            return 'Accepted but action not processed', 202
+            raise HTTPError(401, 'Bad webhook secret')
 
-        filabel.run_pr(owner, repo, pull_request)
+    def check_event(self):
+        """
+        Refuse unsupported event
+        """
+        if self.event not in self.EVENTS:
+            supported = ', '.join(self.EVENTS)
+            raise HTTPError(400,
+                            f'Event not supported (supported: {supported})')
 
-        flask.current_app.logger.info(
-            f'Action {action} from {reposlug}#{pr_number} processed'
-        )
+    def duplicate(self):
+        """
+        Response to delivery claimed already
+        """
+        self.logger.info(f'Duplicate delivery {self.delivery} skipped')
+        return 'Duplicate delivery already accepted', 200
+
+    def payload(self, data):
+        """
+        Parse payload of verified delivery
+
+        data: raw body
+        """
+        try:
+            return self.config['json_loads'](data)
+        except ValueError:
+            raise HTTPError(400, 'Payload is not valid JSON')
+
+    def release(self, error):
+        """
+        If claimed delivery is to be released after processing failed
+        with given error, so redelivery is processed
+
+        error: exception raised by processing
+        """
+        return self.delivery is not None and \
+            getattr(error, 'code', 500) >= 500
+
+    def ping(self, payload):
+        """
+        Response to event "ping"
+
+        payload: event payload
+        """
+        try:
+            repo = payload['repository']['full_name']
+            hook_id = payload['hook_id']
+        except KeyError:
+            self.logger.info(
+                f'Incorrect data entity from IP {self.remote_addr}'
+            )
+            raise HTTPError(422, 'Missing payload contents')
+        self.logger.info(f'Accepting PING from {repo}#WH-{hook_id}')
+        return 'PONG', 200
+
+    def pull_request(self, payload):
+        """
+        PR of event "pull_request" to be labeled, as tuple (owner, repo,
+        pr, before, deadline) of arguments of Filabel.run_pr; None if
+        the action is not processed
+
+        payload: event payload
+        """
+        try:
+            self.action = payload['action']
+            pull_request = payload['pull_request']
+            self.number = payload['number']
+            pr_url = pull_request['url'].split('/')  # no repo field!
+            owner, repo = pr_url[-4], pr_url[-3]
+            self.reposlug = f'{owner}/{repo}'
+            if self.action not in self.PR_ACTIONS:
+                self.logger.info(f'Action {self.action} from '
+                                 f'{self.reposlug}#{self.number} skipped')
+                return None
+            pr = PullRequest.from_json(pull_request)
+        except (KeyError, IndexError):
+            self.logger.info(
+                f'Incorrect data entity from IP {self.remote_addr}'
+            )
+            raise HTTPError(422, 'Missing required payload fields')
+        budget = self.config['job_budget']
+        return (owner, repo, pr, payload.get('before'),
+                Deadline(budget) if budget else None)
+
+    def pr_skipped(self):
+        """
+        Response to event "pull_request" with action not processed
+        """
+        return 'Accepted but action not processed', 202
+
+    def pr_processed(self):
+        """
+        Response to event "pull_request" processed
+        """
+        self.logger.info(f'Action {self.action} from '
+                         f'{self.reposlug}#{self.number} processed')
         return 'PR successfully filabeled', 200
-    except (KeyError, IndexError):
-        flask.current_app.logger.info(
-            f'Incorrect data entity from IP {flask.request.remote_addr}'
-        )
-        flask.abort(422, 'Missing required payload fields')
-    except Exception:
-        flask.current_app.logger.error(
-            f'Error occurred while processing {repo}#{pr_number}'
+
+    def pr_failed(self, error):
+        """
+        HTTPError to answer "pull_request" event processing of which
+        failed with given error
+
+        error: exception raised by labeling
+        """
+        if isinstance(error, DeadlineExceeded):
+            self.logger.warning('Time budget exceeded while processing '
+                                f'{self.reposlug}#{self.number}')
+            return HTTPError(503, 'Processing PR took too long')
+        self.logger.error(
+            f'Error occurred while processing {self.reposlug}#{self.number}'
         )
-        flask.abort(500, 'Processing PR error')
+        return HTTPError(500, 'Processing PR error')
 
 
-def process_webhook_ping(payload):
+def process_webhook_pr(webhook, payload):
     """
-    Process webhook event "ping"
+    Process webhook event "pull_request"
 
+    webhook: Webhook of the delivery
     payload: event payload
     """
+    args = webhook.pull_request(payload)
+    if args is None:
+        return webhook.pr_skipped()
     try:
-        repo = payload['repository']['full_name']
-        hook_id = payload['hook_id']
-        flask.current_app.logger.info(
-            f'Accepting PING from {repo}#WH-{hook_id}'
-        )
-        return 'PONG', 200
-    except KeyError:
-        flask.current_app.logger.info(
-            f'Incorrect data entity from IP {flask.request.remote_addr}'
-        )
-        flask.abort(422, 'Missing payload contents')
+        flask.current_app.config['filabel'].run_pr(*args)
+    except Exception as e:
+        raise webhook.pr_failed(e)
+    return webhook.pr_processed()
+
+
+def process_webhook_ping(webhook, payload):
+    """
+    Process webhook event "ping"
+
+    webhook: Webhook of the delivery
+    payload: event payload
+    """
+    return webhook.ping(payload)
 
 
 webhook_processors = {
@@ -90,60 +247,223 @@ webhook_processors = {
 }
 
 
-def create_app(*args, **kwargs):
+def handle_webhook():
     """
-    Prepare Filabel Flask application listening to GitHub webhooks
+    Verify webhook delivery and pass it to its event processor
+    """
+    config = flask.current_app.config
+    webhook = Webhook(config, flask.request.headers,
+                      flask.request.remote_addr, flask.current_app.logger)
+    webhook.check_length(flask.request.content_length)
+    data = flask.request.get_data()
+    webhook.verify(data)
+
+    if config['recorder'] is not None:
+        config['recorder'].record(flask.request.headers, data)
+
+    webhook.check_event()
+    deliveries = config['deliveries']
+    if webhook.delivery is not None and \
+            not deliveries.claim(webhook.delivery):
+        return webhook.duplicate()
+
+    payload = webhook.payload(data)
+    try:
+        return webhook_processors[webhook.event](webhook, payload)
+    except Exception as e:
+        if webhook.release(e):
+            deliveries.release(webhook.delivery)  # let redelivery try again
+        raise
+
+
+def github_user_link_filter(github_user):
+    """
+    Template filter for HTML link to GitHub profile
+
+    github_user: User data from GitHub API
+    """
+    if github_user is None:
+        return markupsafe.Markup('<em>unknown (lookup pending)</em>')
+    url = markupsafe.escape(github_user['html_url'])
+    login = markupsafe.escape(github_user['login'])
+    return markupsafe.Markup(f'<a href="{url}" target="_blank">{login}</a>')
+
+
+def timestamp_filter(timestamp):
+    """
+    Template filter for formatting UNIX timestamp
+
+    timestamp: seconds since epoch
+    """
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(
+        sep=' ', timespec='seconds'
+    )
+
+
+def load_config(config, logger, github_adapter=None):
+    """
+    Read configuration given by envvar FILABEL_CONFIG and set up
+    the service parts shared by web applications, exits on errors;
+    returns the parsed configuration
+
+    config: dict-like application config to be filled
+    logger: logger of the application
+    github_adapter: optional requests transport adapter answering
+                    GitHub API requests instead of network
     """
-    app = flask.Flask(__name__)
     cfg = configparser.ConfigParser()
     if 'FILABEL_CONFIG' not in os.environ:
-        app.logger.critical('Config not supplied by envvar FILABEL_CONFIG')
+        logger.critical('Config not supplied by envvar FILABEL_CONFIG')
         exit(1)
     configs = os.environ['FILABEL_CONFIG'].split(':')
     cfg.read(configs)
 
     try:
-        app.config['labels'] = parse_labels(cfg)
+        config['labels'] = parse_labels(cfg)
     except Exception:
-        app.logger.critical('Labels configuration not usable!', err=True)
+        logger.critical('Labels configuration not usable!')
         exit(1)
 
     try:
-        app.config['github_token'] = cfg.get('github', 'token')
-        app.config['secret'] = cfg.get('github', 'secret', fallback=None)
+        config['github_token'] = parse_tokens(cfg.get('github', 'token'))
+        config['secret'] = cfg.get('github', 'secret', fallback=None)
     except Exception:
-        app.logger.critical('Auth configuration not usable!', err=True)
+        logger.critical('Auth configuration not usable!')
         exit(1)
 
-    filabel = Filabel(app.config['github_token'], app.config['labels'])
-
+    # GitHub limits webhook payloads to 25 MB
+    config['MAX_CONTENT_LENGTH'] = cfg.getint(
+        'web', 'max_payload', fallback=25 * 1024 * 1024
+    )
     try:
-        app.config['github_user'] = filabel.github.user()
-        app.config['filabel'] = filabel
-    except Exception:
-        app.logger.critical('Bad token: could not get GitHub user!', err=True)
+        config['json_loads'] = json_decoder(
+            cfg.get('web', 'json', fallback=None)
+        )
+    except ValueError as e:
+        logger.critical(f'Web configuration not usable: {e}')
         exit(1)
 
-    @app.template_filter('github_user_link')
-    def github_user_link_filter(github_user):
-        """
-        Template filter for HTML link to GitHub profile
+    delivery_ttl = cfg.getint('web', 'delivery_ttl', fallback=3 * 24 * 3600)
+    config['deliveries'] = None
+    if delivery_ttl:
+        config['deliveries'] = DeliveryStore(
+            delivery_ttl,
+            cfg.getint('web', 'delivery_cache_size', fallback=100000),
+            cfg.get('web', 'delivery_db', fallback=None),
+        )
 
-        github_user: User data from GitHub API
+    record = cfg.get('web', 'record', fallback=None)
+    config['recorder'] = DeliveryRecorder(record) if record else None
+
+    git_mirrors = None
+    if cfg.has_section('git-mirrors') or cfg.has_option('web', 'git_mirrors'):
+        git_mirrors = GitMirrors(
+            dict(cfg.items('git-mirrors')) if cfg.has_section('git-mirrors')
+            else None,
+            cfg.get('web', 'git_mirrors', fallback=None),
+            threshold=cfg.getint('web', 'git_threshold', fallback=1000),
+        )
+
+    filabel = Filabel(
+        config['github_token'], config['labels'],
+        file_cache=LRUCache(
+            cfg.getint('web', 'pr_cache_size', fallback=1024)
+        ),
+        repo_config=cfg.get('web', 'repo_config', fallback=None),
+        match_processes=cfg.getint('web', 'match_processes', fallback=0),
+        match_min_files=cfg.getint('web', 'match_min_files', fallback=None),
+        git_mirrors=git_mirrors,
+    )
+    filabel.github.sessions.adapter = github_adapter
+    config['filabel'] = filabel
+
+    config['labels_reloader'] = LabelsReloader(
+        filabel, configs,
+        interval=cfg.getfloat('web', 'reload_interval', fallback=5),
+        logger=logger,
+    )
+    config['labels_reloader'].start(
+        sighup=cfg.getboolean('web', 'reload_on_sighup', fallback=True)
+    )
+    config['github_user_wait'] = cfg.getfloat('web', 'user_wait', fallback=5)
+
+    # PRs taking longer than GitHub waits for delivery are still labeled
+    config['job_budget'] = cfg.getfloat('web', 'job_budget', fallback=0)
+    return cfg
+
+
+def backpressure_for(cfg, github):
+    """
+    Backpressure of GitHub client configured by [web] section
+
+    cfg: parsed configuration
+    github: GitHub client whose requests are tracked
+    """
+    return Backpressure(
+        github,
+        max_in_flight=cfg.getint('web', 'max_in_flight', fallback=16),
+        min_rate_remaining=cfg.getint('web', 'min_rate_remaining',
+                                      fallback=50),
+        stale_after=cfg.getfloat('web', 'stale_after', fallback=300),
+        retry_after=cfg.getint('web', 'retry_after', fallback=30),
+    )
+
+
+def create_app(*args, github_adapter=None, **kwargs):
+    """
+    Prepare Filabel Flask application listening to GitHub webhooks
+
+    github_adapter: optional requests transport adapter answering
+                    GitHub API requests instead of network
+    """
+    app = flask.Flask(__name__)
+    cfg = load_config(app.config, app.logger, github_adapter)
+    filabel = app.config['filabel']
+
+    # GitHub user is needed only for info page, do not block startup on it
+    app.config['github_user'] = CachedGitHubUser(
+        filabel.github,
+        ttl=cfg.getint('web', 'user_ttl', fallback=600),
+        retry=cfg.getint('web', 'user_retry', fallback=30),
+    )
+    app.config['github_user'].refresh()
+    app.config['backpressure'] = backpressure_for(cfg, filabel.github)
+
+    app.register_error_handler(HTTPError, lambda e: (e.message, e.code))
+    app.add_template_filter(github_user_link_filter, 'github_user_link')
+    app.add_template_filter(timestamp_filter, 'timestamp')
+
+    @app.before_request
+    def reloader_running():
         """
-        url = flask.escape(github_user['html_url'])
-        login = flask.escape(github_user['login'])
-        return jinja2.Markup(f'<a href="{url}" target="_blank">{login}</a>')
+        Watch configuration also in workers forked from preloaded app
+        """
+        flask.current_app.config['labels_reloader'].ensure_running()
 
     @app.route('/', methods=['GET'])
     def index():
         """
         Landing info page
         """
+        github_user = flask.current_app.config['github_user']
+        user = github_user.get(
+            wait=flask.current_app.config['github_user_wait']
+        )
+        if user is None and github_user.error is not None:
+            flask.current_app.logger.error(
+                f'Could not get GitHub user: {github_user.error}'
+            )
+        filabel = flask.current_app.config['filabel']
         return flask.render_template(
             'infopage.html',
-            labels=flask.current_app.config['labels'],
-            user=flask.current_app.config['github_user']
+            labels=filabel.labels,
+            reloader=flask.current_app.config['labels_reloader'],
+            digest=filabel.matcher.digest,
+            user=user,
+            http=filabel.github.sessions.stats(),
+            deliveries=(flask.current_app.config['deliveries'].stats()
+                        if flask.current_app.config['deliveries'] else None),
+            load=flask.current_app.config['backpressure'].stats(),
         )
 
     @app.route('/', methods=['POST'])
@@ -151,24 +471,37 @@ def create_app(*args, **kwargs):
         """
         Webhook listener endpoint
         """
-        signature = flask.request.headers.get('X-Hub-Signature', '')
-        event = flask.request.headers.get('X-GitHub-Event', '')
-        payload = flask.request.get_json()
-
-        secret = flask.current_app.config['secret']
-
-        if secret is not None and not webhook_verify_signature(
-                flask.request.data, signature, secret
-        ):
+        backpressure = flask.current_app.config['backpressure']
+        if not backpressure.enter():
             flask.current_app.logger.warning(
-                f'Attempt with bad secret from IP {flask.request.remote_addr}'
+                f'Webhook refused: {", ".join(backpressure.overload())}'
             )
-            flask.abort(401, 'Bad webhook secret')
+            return 'Service overloaded, retry later', 503, {
+                'Retry-After': str(backpressure.wait_time())
+            }
+        try:
+            return handle_webhook()
+        finally:
+            backpressure.exit()
 
-        if event not in webhook_processors:
-            supported = ', '.join(webhook_processors.keys())
-            flask.abort(400, f'Event not supported (supported: {supported})')
+    @app.route('/healthz')
+    def healthz():
+        """
+        Liveness endpoint
+        """
+        return 'OK', 200
 
-        return webhook_processors[event](payload)
+    @app.route('/readyz')
+    def readyz():
+        """
+        Readiness endpoint, 503 when webhooks would be refused
+        """
+        backpressure = flask.current_app.config['backpressure']
+        stats = backpressure.stats()
+        if stats['ready']:
+            return flask.jsonify(stats), 200
+        return flask.jsonify(stats), 503, {
+            'Retry-After': str(backpressure.wait_time())
+        }
 
     return app
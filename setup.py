@@ -32,6 +32,10 @@ setup(
         'jinja2',
         'requests',
     ],
+    extras_require={
+        'fast': ['orjson'],
+        'asgi': ['httpx'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
@@ -0,0 +1,92 @@
+import asyncio
+import json as json_module  # TestClient.open has argument named json
+
+from filabel.asgi import AsyncApp
+
+
+def client_for(app):
+    """
+    Test client of Flask or ASGI application
+    """
+    if isinstance(app, AsyncApp):
+        return TestClient(app)
+    return app.test_client()
+
+
+class TestResponse:
+    """
+    Response received by TestClient
+    """
+    def __init__(self, status_code, headers, data):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+    def get_data(self, as_text=False):
+        return self.data.decode() if as_text else self.data
+
+    def get_json(self):
+        return json_module.loads(self.data)
+
+
+class TestClient:
+    """
+    Sends requests to ASGI application in its own event loop,
+    with interface of Flask test client used by tests
+    """
+    __test__ = False  # not a test class for pytest
+
+    def __init__(self, application):
+        """
+        application: ASGI application
+        """
+        self.application = application
+        self.loop = None
+
+    def open(self, method, path, data=b'', json=None, content_type=None,
+             headers=None):
+        if json is not None:
+            data = json_module.dumps(json, sort_keys=True).encode()
+            content_type = 'application/json'
+        headers = dict(headers or {})
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        headers['Content-Length'] = str(len(data))
+        headers.setdefault('Host', 'localhost')
+        scope = {
+            'type': 'http', 'method': method, 'path': path,
+            'scheme': 'http', 'root_path': '', 'query_string': b'',
+            'client': ('127.0.0.1', 0),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers.items()],
+        }
+        messages = [{'type': 'http.request', 'body': data}]
+        response = {}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {
+                    k.decode('latin-1').title(): v.decode('latin-1')
+                    for k, v in message['headers']
+                }
+            else:
+                response['body'] = response.get('body', b'') + \
+                    message.get('body', b'')
+
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.application(scope, receive, send))
+        return TestResponse(response['status'], response['headers'],
+                            response.get('body', b''))
+
+    def get(self, path, **kwargs):
+        return self.open('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open('POST', path, **kwargs)
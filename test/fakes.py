@@ -0,0 +1,126 @@
+import contextlib
+
+import requests
+
+from filabel.logic import Filabel, PullRequest
+
+
+class FakeGitHub:
+    """
+    Stands in for GitHub API: every PR consists of the same files,
+    requests are recorded in calls and label writes in writes
+    """
+    def __init__(self, files=('README.md',), comparison=None, labels=None):
+        """
+        files: names (or file dicts of GitHub API) of files of every PR
+        comparison: optional response of compare
+        labels: optional dict of PR number -> its current labels
+        """
+        self.files = [{'filename': f, 'status': 'modified'}
+                      if isinstance(f, str) else f for f in files]
+        self.comparison = comparison
+        self.labels = labels if labels is not None else {}
+        self.calls = []
+        self.writes = []
+
+    def deadline(self, deadline):
+        return contextlib.nullcontext()
+
+    def _labels(self, number):
+        return [{'name': label} for label in sorted(self.labels[number])]
+
+    def pr_files(self, owner, repo, number):
+        self.calls.append(('files', number))
+        return self.files
+
+    def pr_filenames(self, owner, repo, number):
+        return [f['filename'] for f in self.pr_files(owner, repo, number)]
+
+    def compare(self, owner, repo, base, head):
+        self.calls.append(('compare', base, head))
+        return self.comparison
+
+    def reset_labels(self, owner, repo, number, labels):
+        self.calls.append(('write', number))
+        self.writes.append((f'{owner}/{repo}', number, '=', sorted(labels)))
+        self.labels[number] = set(labels)
+        return self._labels(number)
+
+    def add_labels(self, owner, repo, number, labels):
+        self.calls.append(('write', number))
+        self.writes.append((f'{owner}/{repo}', number, '+', sorted(labels)))
+        self.labels.setdefault(number, set()).update(labels)
+        return self._labels(number)
+
+    def remove_label(self, owner, repo, number, label):
+        self.calls.append(('write', number))
+        self.writes.append((f'{owner}/{repo}', number, '-', [label]))
+        if label not in self.labels.get(number, ()):
+            return None
+        self.labels[number].discard(label)
+        return self._labels(number)
+
+    def issue_labels(self, owner, repo, number):
+        return self._labels(number)
+
+    def user(self):
+        self.calls.append(('user',))
+        return {'login': 'someone'}
+
+
+class FakeSession:
+    """
+    Stands in for requests session of GitHub API: requests authorized
+    by throttled tokens hit the rate limit, others succeed, tokens of
+    requests are recorded in tokens
+    """
+    def __init__(self, content=b'{"login": "me"}', throttled=(),
+                 resource=None):
+        """
+        content: body of successful responses
+        throttled: tokens with no requests left
+        resource: optional rate limit resource reported by responses
+        """
+        self.content = content
+        self.throttled = throttled
+        self.resource = resource
+        self.tokens = []
+
+    def request(self, method, url, timeout=None, headers=None, **kwargs):
+        token = headers['Authorization'].split()[1]
+        self.tokens.append(token)
+        r = requests.Response()
+        r.headers['X-RateLimit-Reset'] = '9999999999'
+        if self.resource is not None:
+            r.headers['X-RateLimit-Resource'] = self.resource
+        if token in self.throttled:
+            r.status_code = 403
+            r._content = b'{"message": "API rate limit exceeded"}'
+            r.headers['X-RateLimit-Remaining'] = '0'
+        else:
+            r.status_code = 200
+            r._content = self.content
+            r.headers['X-RateLimit-Remaining'] = '4000'
+        return r
+
+
+def make_filabel(labels=None, github=None, **kwargs):
+    """
+    Filabel talking to FakeGitHub
+
+    labels: optional labels configuration (default: docs for *.md)
+    github: optional FakeGitHub to be used
+    kwargs: other arguments of Filabel
+    """
+    filabel = Filabel('token', {'docs': ['*.md']} if labels is None
+                      else labels, **kwargs)
+    filabel.github = FakeGitHub() if github is None else github
+    return filabel
+
+
+def make_pr(number=1, head='h1', base='b1', labels=()):
+    """
+    PullRequest of repository o/r
+    """
+    return PullRequest(number, f'https://github.com/o/r/{number}', head,
+                       base, tuple(labels))
@@ -0,0 +1,125 @@
+import asyncio
+import base64
+
+import pytest
+
+from fakes import FakeGitHub, make_filabel, make_pr
+from filabel.aio import AsyncCachedGitHubUser, AsyncFilabel, AsyncGitHub
+from filabel.cache import LRUCache
+from filabel.logic import Change
+from filabel.repoconfig import RepoConfigs
+from filabel.utils import Deadline, DeadlineExceeded
+
+
+class FakeAsyncGitHub(FakeGitHub):
+    def __init__(self):
+        added = {'filename': 'doc/x.rst', 'status': 'added'}
+        super().__init__(
+            files=['README.md', {'filename': 'setup.py', 'status': 'added'}],
+            comparison={'status': 'ahead', 'files': [added]},
+        )
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _wait(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+    async def pr_files(self, owner, repo, number):
+        await self._wait()
+        return super().pr_files(owner, repo, number)
+
+    async def compare(self, owner, repo, base, head):
+        await self._wait()
+        return super().compare(owner, repo, base, head)
+
+    async def reset_labels(self, owner, repo, number, labels):
+        await self._wait()
+        return super().reset_labels(owner, repo, number, labels)
+
+    async def user(self):
+        await self._wait()
+        return super().user()
+
+    async def contents(self, owner, repo, path, etag=None):
+        await self._wait()
+        self.calls.append(('contents', path, etag))
+        content = base64.b64encode(b'[labels]\npy=\n    *.py\n').decode()
+        return 200, 'e1', {'sha': 's1', 'content': content}
+
+
+LABELS = {'docs': ['*.md', 'doc/*'], 'py': ['*.py'], 'ci': ['.travis.yml']}
+
+#: Labels of PRs before labeling
+EXISTING = ('ci', 'other')
+
+
+def test_run_pr():
+    filabel = AsyncFilabel(make_filabel(LABELS), FakeAsyncGitHub())
+    pr = make_pr(1, labels=EXISTING)
+    changes = asyncio.run(filabel.run_pr('o', 'r', pr))
+    assert changes == [('ci', Change.DELETE), ('docs', Change.ADD),
+                       ('py', Change.ADD)]
+    assert filabel.github.calls == [('files', 1), ('write', 1)]
+
+
+def test_concurrent_prs():
+    filabel = AsyncFilabel(make_filabel(LABELS), FakeAsyncGitHub())
+
+    async def run():
+        return await asyncio.gather(*(
+            filabel.run_pr('o', 'r', make_pr(number, labels=EXISTING))
+            for number in range(50)
+        ))
+
+    assert all(asyncio.run(run()))
+    assert filabel.github.max_in_flight == 50
+
+
+def test_synchronize_updates_cached_files():
+    filabel = AsyncFilabel(make_filabel(LABELS, file_cache=LRUCache(16)),
+                           FakeAsyncGitHub())
+    asyncio.run(filabel.run_pr('o', 'r', make_pr(1, labels=EXISTING)))
+    pr = make_pr(1, 'h2', labels=EXISTING)
+    plan = asyncio.run(filabel.plan_pr('o', 'r', pr, 'h1'))
+    assert plan.future == {'docs', 'py', 'other'}
+    assert filabel.github.calls == [('files', 1), ('write', 1),
+                                    ('compare', 'h1', 'h2')]
+
+
+def test_repo_config_fetched_asynchronously():
+    filabel = AsyncFilabel(make_filabel(LABELS), FakeAsyncGitHub())
+    # the synchronous client cannot fetch contents at all
+    filabel.filabel.repo_configs = RepoConfigs(FakeGitHub(), ttl=0)
+    pr = make_pr(1, labels=EXISTING)
+    changes = asyncio.run(filabel.run_pr('o', 'r', pr))
+    assert changes == [('py', Change.ADD)]
+    assert filabel.github.calls[0] == ('contents', '.github/filabel.cfg',
+                                       None)
+
+
+def test_no_request_after_deadline():
+    github = AsyncGitHub('token')
+
+    async def run():
+        with github.deadline(Deadline(0)):
+            await github.user()
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert github.requests == 0
+
+
+def test_cached_user_waits_for_fetch():
+    github = FakeAsyncGitHub()
+    user = AsyncCachedGitHubUser(github, ttl=600)
+
+    async def run():
+        first = await user.get(wait=1)
+        second = await user.get(wait=1)
+        return first, second
+
+    assert asyncio.run(run()) == ({'login': 'someone'}, {'login': 'someone'})
+    assert github.calls == [('user',)]
@@ -0,0 +1,73 @@
+import configparser
+import io
+
+import pytest
+
+from filabel.analyze import (LabelsAnalysis, glob_includes, glob_tokens,
+                             write_labels)
+from filabel.matching import Matcher
+from filabel.utils import parse_labels
+
+
+@pytest.mark.parametrize(('outer', 'inner', 'included'), [
+    ('docs/*', 'docs/api/*', True),
+    ('*.md', 'README.md', True),
+    ('*', '**', True),
+    ('**', '*', True),
+    ('d?cs/*', 'docs/*', True),
+    ('docs/*', 'd?cs/*', False),
+    ('*.md', '[!x]*.md', True),
+    ('src/[ab]/*', 'src/a/*', True),
+    ('src/[ab]/*', 'src/[abc]/*', False),
+    ('src/[!c]/*', 'src/[ab]/*', True),
+    ('*/templates/*', 'web/templates/*.html', True),
+    ('*.md', '*.mdx', False),
+    ('a[', 'a[', True),
+])
+def test_glob_includes(outer, inner, included):
+    assert glob_includes(glob_tokens(outer), glob_tokens(inner)) == included
+
+
+LABELS = {
+    'docs': ['docs/*', 'docs/api/*', '*.md', 'README.md', '*.md', 'd?cs/*'],
+    'backend': ['logic/*', 'nothing/*', 'logic/**'],
+    'empty': [],
+}
+
+
+def test_analysis():
+    analysis = LabelsAnalysis(LABELS, [['docs/a', 'README.md'],
+                                       ['logic/x.py']])
+    assert analysis.duplicates == [('docs', '*.md')]
+    assert analysis.subsumed == [
+        ('docs', 'docs/*', 'd?cs/*'),
+        ('docs', 'docs/api/*', 'docs/*'),
+        ('docs', 'README.md', '*.md'),
+        ('backend', 'logic/**', 'logic/*'),
+    ]
+    assert analysis.unmatched == [('backend', 'nothing/*')]
+    assert analysis.minimized == {
+        'docs': ['*.md', 'd?cs/*'],
+        'backend': ['logic/*', 'nothing/*'],
+        'empty': [],
+    }
+
+
+def test_minimized_is_equivalent():
+    analysis = LabelsAnalysis(LABELS)
+    filenames = ['docs/a', 'dOcs/b', 'docs/api/x', 'README.md', 'a/b.md',
+                 'logic/x.py', 'logic/a/b', 'nothing/z', 'other']
+    original = Matcher(LABELS)
+    minimized = Matcher(analysis.minimized)
+    for filename in filenames:
+        assert original.file_labels(filename) == \
+            minimized.file_labels(filename)
+
+
+def test_write_labels_roundtrip():
+    labels = {'docs': ['*.md', '100%/*'], 'empty': []}
+    out = io.StringIO()
+    write_labels(labels, out)
+    cfg = configparser.ConfigParser()
+    cfg.read_string(out.getvalue())
+    assert parse_labels(cfg) == labels
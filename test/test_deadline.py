@@ -0,0 +1,71 @@
+import pytest
+
+from fakes import FakeGitHub, make_filabel, make_pr
+from filabel.cli import print_report
+from filabel.logic import GitHub
+from filabel.utils import Deadline, DeadlineExceeded
+
+
+def test_deadline_remaining():
+    deadline = Deadline(60)
+    assert 0 < deadline.remaining() <= 60
+    assert not deadline.expired
+    assert Deadline(0).expired
+
+
+def test_expired_deadline_skips_prs():
+    filabel = make_filabel()
+    report = filabel.run_prs('o/r', [make_pr(1), make_pr(2)],
+                             deadline=Deadline(0))
+    assert filabel.github.writes == []
+    assert report.prs == {}
+    assert report.skipped_prs == ['https://github.com/o/r/1',
+                                  'https://github.com/o/r/2']
+
+
+def test_no_deadline_runs_all_prs():
+    filabel = make_filabel()
+    report = filabel.run_prs('o/r', [make_pr(1), make_pr(2)])
+    assert filabel.github.writes == [('o/r', 1, '=', ['docs']),
+                                     ('o/r', 2, '=', ['docs'])]
+    assert report.skipped_prs == []
+
+
+def test_pr_out_of_time_midway_skipped(capsys):
+    filabel = make_filabel()
+    matching_labels = filabel._pr_matching_labels
+
+    def expiring(owner, repo, pr, *args):
+        if pr.number == 1:
+            raise DeadlineExceeded('No time left')
+        return matching_labels(owner, repo, pr, *args)
+
+    filabel._pr_matching_labels = expiring
+    report = filabel.run_prs('o/r', [make_pr(1), make_pr(2)],
+                             deadline=Deadline(60))
+    assert report.skipped_prs == ['https://github.com/o/r/1']
+    assert list(report.prs) == ['https://github.com/o/r/2']
+    print_report(report)
+    out = capsys.readouterr().out
+    assert 'PR https://github.com/o/r/1 - SKIPPED (no time left)' in out
+    assert 'FAIL' not in out
+
+
+class SlowListGitHub(FakeGitHub):
+    def pull_requests(self, owner, repo, state, base):
+        raise DeadlineExceeded('No time left')
+
+
+def test_repo_listing_out_of_time_skipped(capsys):
+    filabel = make_filabel(github=SlowListGitHub())
+    report = filabel.run_repo('o/r', deadline=Deadline(60))
+    assert report.skipped and report.ok
+    print_report(report)
+    assert 'SKIPPED (no time left)' in capsys.readouterr().out
+
+
+def test_request_after_deadline_is_not_sent():
+    github = GitHub('token')
+    with pytest.raises(DeadlineExceeded):
+        with github.deadline(Deadline(0)):
+            github.user()
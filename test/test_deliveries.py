@@ -0,0 +1,48 @@
+from filabel.deliveries import DeliveryStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_duplicates_within_ttl():
+    clock = Clock()
+    store = DeliveryStore(ttl=60, clock=clock)
+    assert store.claim('a')
+    assert not store.claim('a')
+    clock.now += 61
+    assert store.claim('a')
+    assert store.stats() == {'processed': 2, 'duplicates': 1}
+
+
+def test_memory_is_bounded():
+    store = DeliveryStore(maxsize=2)
+    for delivery in 'abc':
+        assert store.claim(delivery)
+    assert len(store._seen) == 2
+    assert store.claim('a')  # forgotten as the oldest one
+
+
+def test_release():
+    store = DeliveryStore()
+    assert store.claim('a')
+    store.release('a')
+    assert store.claim('a')
+
+
+def test_sqlite_shared(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / 'deliveries.sqlite')
+    first = DeliveryStore(ttl=60, path=path, clock=clock)
+    second = DeliveryStore(ttl=60, path=path, clock=clock)
+    assert first.claim('a')
+    assert not second.claim('a')
+    second.release('b')
+    first.release('a')
+    assert second.claim('a')
+    clock.now += 61
+    assert first.claim('a')
@@ -0,0 +1,74 @@
+import pytest
+
+from fakes import FakeSession, make_filabel, make_pr
+from filabel.events import (LABEL_WRITE, MATCH_DONE, PR_END, PR_START,
+                            REQUEST_END, REQUEST_START, Events,
+                            endpoint_template)
+from filabel.logic import GitHub
+
+
+@pytest.mark.parametrize(('url', 'endpoint'), [
+    ('https://api.github.com/repos/o/r/pulls/12/files?page=2',
+     '/repos/{owner}/{repo}/pulls/{number}/files'),
+    ('https://api.github.com/repos/o/r/issues/3',
+     '/repos/{owner}/{repo}/issues/{number}'),
+    ('https://api.github.com/repos/o/r/compare/a...b',
+     '/repos/{owner}/{repo}/compare/{basehead}'),
+    ('https://api.github.com/repos/o/r/contents/.github/filabel.cfg',
+     '/repos/{owner}/{repo}/contents/{path}'),
+    ('https://api.github.com/orgs/cvut/repos', '/orgs/{org}/repos'),
+    ('https://api.github.com/user', '/user'),
+])
+def test_endpoint_template(url, endpoint):
+    assert endpoint_template(url) == endpoint
+
+
+def test_subscribe_unsubscribe():
+    events = Events()
+    seen = []
+
+    def callback(name, **fields):
+        seen.append((name, fields))
+
+    assert not events.active
+    events.subscribe(PR_START, callback)
+    assert events.active
+    events.emit(PR_START, number=1)
+    events.emit(PR_END, number=1)
+    events.unsubscribe(PR_START, callback)
+    assert not events.active
+    events.emit(PR_START, number=2)
+    assert seen == [(PR_START, {'number': 1})]
+
+
+def test_failing_subscriber_ignored():
+    events = Events()
+    events.subscribe(None, lambda name, **fields: 1 / 0)
+    events.emit(PR_START, number=1)
+
+
+def test_request_events():
+    events = Events()
+    seen = []
+    events.subscribe(None, lambda name, **fields: seen.append((name, fields)))
+    github = GitHub('token', session=FakeSession(), events=events)
+    assert github.user() == {'login': 'me'}
+    assert [name for name, _ in seen] == [REQUEST_START, REQUEST_END]
+    fields = seen[1][1]
+    assert fields['endpoint'] == '/user'
+    assert fields['status'] == 200
+    assert fields['bytes'] == 15
+    assert fields['duration'] >= 0
+
+
+def test_pr_events():
+    events = Events()
+    seen = []
+    events.subscribe(None, lambda name, **fields: seen.append((name, fields)))
+    filabel = make_filabel(events=events)
+    filabel.run_pr('o', 'r', make_pr())
+    assert [name for name, _ in seen] == [PR_START, MATCH_DONE, LABEL_WRITE,
+                                          PR_END]
+    assert seen[1][1]['labels'] == {'docs'}
+    assert seen[2][1]['ok']
+    assert seen[3][1]['ok'] and seen[3][1]['reposlug'] == 'o/r'
@@ -0,0 +1,117 @@
+import shutil
+import subprocess
+
+import pytest
+
+from fakes import make_filabel, make_pr
+from filabel.cache import LRUCache
+from filabel.gitmirror import GitError, GitMirrors
+from filabel.logic import PullRequest
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None,
+                                reason='git not available')
+
+
+def _git(path, *args):
+    return subprocess.run(
+        ['git', '-C', str(path), '-c', 'user.name=t', '-c', 'user.email=t@t',
+         *args], check=True, stdout=subprocess.PIPE,
+    ).stdout.decode().strip()
+
+
+def _commit(path, message):
+    _git(path, 'add', '-A')
+    _git(path, 'commit', '-q', '-m', message)
+    return _git(path, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / 'owner' / 'repo'
+    path.mkdir(parents=True)
+    _git(path, 'init', '-q')
+    (path / 'README.md').write_text('readme\n')
+    (path / 'old.py').write_text('print("hello world")\n' * 10)
+    (path / 'gone.txt').write_text('gone\n')
+    base = _commit(path, 'base')
+    _git(path, 'checkout', '-q', '-b', 'pr')
+    (path / 'README.md').write_text('changed\n')
+    (path / 'old.py').rename(path / 'new.py')
+    (path / 'gone.txt').unlink()
+    (path / 'docs').mkdir()
+    (path / 'docs' / 'index.md').write_text('docs\n')
+    head = _commit(path, 'pr')
+    _git(path, 'checkout', '-q', base)
+    (path / 'other.txt').write_text('not in PR\n')
+    base = _commit(path, 'base moved on')
+    return tmp_path, path, base, head
+
+
+def test_diff_lists_pr_files(repo):
+    root, path, base, head = repo
+    assert GitMirrors().diff(str(path), base, head) == {
+        'README.md': 'modified',
+        'new.py': 'renamed',
+        'gone.txt': 'removed',
+        'docs/index.md': 'added',
+    }
+
+
+def test_diff_unknown_commit(repo):
+    root, path, base, head = repo
+    with pytest.raises(GitError):
+        GitMirrors().diff(str(path), base, '0' * 40)
+
+
+def test_path_selection(repo):
+    root, path, base, head = repo
+    mirrors = GitMirrors({'Other/Repo': '/somewhere'}, str(root),
+                         threshold=100)
+    assert mirrors.path('other', 'repo') == '/somewhere'
+    assert mirrors.path('owner', 'repo', 100) == str(path)
+    assert mirrors.path('owner', 'repo', 99) is None
+    assert mirrors.path('owner', 'repo') is None
+    assert mirrors.path('owner', 'missing', 100) is None
+    assert GitMirrors(root=str(root), threshold=0).path('owner', 'repo') == \
+        str(path)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_filabel_lists_files_by_git(repo, cached):
+    root, path, base, head = repo
+    mirrors = GitMirrors(root=str(root), threshold=10)
+    filabel = make_filabel({'docs': ['docs/*'], 'py': ['*.py']},
+                           git_mirrors=mirrors,
+                           file_cache=LRUCache() if cached else None)
+    big = PullRequest(1, head_sha=head, base_sha=base, changed_files=4000)
+    small = PullRequest(2, head_sha=head, base_sha=base, changed_files=4)
+    assert filabel.plan_pr('owner', 'repo', big).future == {'docs', 'py'}
+    assert filabel.plan_pr('owner', 'repo', small).future == set()
+
+
+@pytest.mark.parametrize('base_sha, number', [
+    ('--upload-pack=touch {pwned}; git-upload-pack', 1),
+    ('-o{pwned}', 1),
+    ('HEAD', 1),
+    (None, 1),
+    ('0' * 40, '1 --upload-pack=touch {pwned}'),
+])
+def test_untrusted_arguments_rejected(repo, tmp_path, base_sha, number):
+    root, path, base, head = repo
+    clone = tmp_path / 'clone'
+    _git(tmp_path, 'clone', '-q', '--bare', str(path), str(clone))
+    pwned = tmp_path / 'PWNED'
+    if base_sha is not None:
+        base_sha = base_sha.format(pwned=pwned)
+    if isinstance(number, str):
+        number = number.format(pwned=pwned)
+    with pytest.raises(GitError):
+        GitMirrors().pr_files(str(clone), number, base_sha, head)
+    assert not pwned.exists()
+
+    filabel = make_filabel(
+        git_mirrors=GitMirrors({'owner/repo': str(clone)})
+    )
+    pr = make_pr(head=head, base=base_sha)
+    assert filabel.plan_pr('owner', 'repo', pr).future == {'docs'}
+    assert not pwned.exists()
@@ -0,0 +1,45 @@
+import os
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1] / 'benchmarks'))
+
+from importtime import importtime  # noqa: E402
+
+#: Import time of filabel's own modules relative to import time
+#: of its dependencies (click and requests), those dominate
+BUDGET = float(os.getenv('FILABEL_IMPORT_BUDGET', 0.5))
+
+#: Modules needed only by subcommands, options or the web app
+HEAVY = ('filabel.web', 'flask', 'jinja2', 'werkzeug', 'sqlite3',
+         'multiprocessing', 'concurrent.futures', 'subprocess', 'gzip')
+
+
+def _fastest(module, runs=3):
+    """
+    Import times of the fastest of several imports of module
+    """
+    return min((importtime(module) for _ in range(runs)),
+               key=lambda times: times[module.split(',')[0]][1])
+
+
+def test_cli_does_not_import_heavy_modules():
+    times = importtime('filabel')
+    for module in HEAVY:
+        assert module not in times
+
+
+def test_cli_import_budget():
+    # measured against dependencies on the same machine, machines
+    # running tests differ a lot
+    deps = _fastest('click, requests')
+    baseline = deps['click'][1] + deps['requests'][1]
+    times = _fastest('filabel')
+    own = times['filabel'][1] - times['click'][1] - times['requests'][1]
+    assert own < BUDGET * baseline
+
+
+def test_create_app_still_importable():
+    import filabel
+    from filabel.web import create_app
+    assert filabel.create_app is create_app
@@ -0,0 +1,101 @@
+import pytest
+
+from fakes import FakeGitHub, make_filabel, make_pr
+from filabel.ledger import Ledger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return str(tmp_path / 'ledger.sqlite')
+
+
+def test_unchanged_prs_skipped(ledger):
+    filabel = make_filabel(ledger=Ledger(ledger))
+    report = filabel.run_prs('o/r', [make_pr(1), make_pr(2, labels=['docs'])])
+    assert len(report.prs) == 2
+    assert filabel.github.calls == [('files', 1), ('write', 1),
+                                    ('files', 2), ('write', 2)]
+
+    filabel = make_filabel(ledger=Ledger(ledger))
+    report = filabel.run_prs('o/r', [make_pr(n, labels=['docs'])
+                                     for n in (1, 2)])
+    assert report.prs == {}
+    assert report.unchanged_prs == ['https://github.com/o/r/1',
+                                    'https://github.com/o/r/2']
+    assert filabel.github.calls == []
+
+
+def test_changed_prs_labeled_again(ledger):
+    filabel = make_filabel(ledger=Ledger(ledger))
+    filabel.run_prs('o/r', [make_pr(n, labels=['docs']) for n in (1, 2, 3)])
+    filabel.github.calls = []
+    report = filabel.run_prs('o/r', [
+        make_pr(1, 'h2', labels=['docs']),  # new commits
+        make_pr(2),  # labels removed by someone
+        make_pr(3, labels=['docs']),
+    ])
+    assert list(report.prs) == ['https://github.com/o/r/1',
+                                'https://github.com/o/r/2']
+    assert report.unchanged_prs == ['https://github.com/o/r/3']
+
+
+def test_config_change_labels_again(ledger):
+    filabel = make_filabel(ledger=Ledger(ledger))
+    filabel.run_prs('o/r', [make_pr(1, labels=['docs'])])
+    filabel = make_filabel({'docs': ['*.md', 'docs/*']}, ledger=Ledger(ledger))
+    report = filabel.run_prs('o/r', [make_pr(1, labels=['docs'])])
+    assert report.unchanged_prs == []
+    assert ('files', 1) in filabel.github.calls
+
+
+def test_plans_do_not_use_ledger(ledger):
+    filabel = make_filabel(ledger=Ledger(ledger))
+    filabel.run_prs('o/r', [make_pr(1, labels=['docs'])])
+    plans = []
+    report = filabel.run_prs('o/r', [make_pr(1, labels=['docs'])], plans)
+    assert len(plans) == 1 and report.unchanged_prs == []
+
+
+class FilesGitHub(FakeGitHub):
+    FILES = {1: ['README.md'], 2: ['src/a.py'], 3: ['a.py', 'README.md']}
+
+    def pr_files(self, owner, repo, number):
+        super().pr_files(owner, repo, number)
+        return [{'filename': f, 'status': 'modified'}
+                for f in self.FILES[number]]
+
+
+def test_relabel_changed_labels_only(ledger):
+    old = {'docs': ['*.md'], 'py': ['*.py']}
+    filabel = make_filabel(old, FilesGitHub(), ledger=Ledger(ledger))
+    report = filabel.run_prs('o/r', [make_pr(n) for n in (1, 2, 3)])
+    written = {int(url.rsplit('/', 1)[1]): {l for l, _ in changes}
+               for url, changes in report.prs.items()}
+    assert written == {1: {'docs'}, 2: {'py'}, 3: {'docs', 'py'}}
+
+    new = {'docs': ['*.md'], 'py': ['src/*.py']}
+    filabel = make_filabel(new, FilesGitHub(), ledger=Ledger(ledger))
+    prs = [make_pr(n, labels=written[n]) for n in (1, 2, 3)]
+    report = filabel.relabel_prs('o/r', prs, old)
+    assert filabel.github.calls == [('write', 3)]
+    assert report.unchanged_prs == ['https://github.com/o/r/1',
+                                    'https://github.com/o/r/2']
+
+    # new configuration recorded, next sweep does nothing
+    filabel.github.calls = []
+    prs[2] = make_pr(3, labels=['docs'])
+    report = filabel.run_prs('o/r', prs)
+    assert filabel.github.calls == []
+    assert len(report.unchanged_prs) == 3
+
+
+def test_relabel_falls_back_for_changed_prs(ledger):
+    old = {'docs': ['*.md']}
+    filabel = make_filabel(old, FilesGitHub(), ledger=Ledger(ledger))
+    filabel.run_prs('o/r', [make_pr(1)])
+    filabel = make_filabel({'docs': ['*.md', '*.txt']}, FilesGitHub(),
+                           ledger=Ledger(ledger))
+    report = filabel.relabel_prs('o/r', [make_pr(1, 'h2', labels=['docs'])],
+                                 old)
+    assert ('files', 1) in filabel.github.calls
+    assert list(report.prs) == ['https://github.com/o/r/1']
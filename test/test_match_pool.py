@@ -0,0 +1,44 @@
+from fakes import FakeGitHub, make_filabel, make_pr
+from filabel.cache import LRUCache
+from filabel.logic import Filabel
+from filabel.matching import MatchPool, Matcher
+
+LABELS = {'docs': ['*.md', 'docs/*'], 'code': ['*.py']}
+FILENAMES = [f'dir{n}/file{n}.{ext}'
+             for n in range(300) for ext in ('md', 'py', 'txt')]
+
+
+def test_pool_counts_like_matcher():
+    matcher = Matcher(LABELS)
+    pool = MatchPool(matcher, processes=2, batch_size=100, min_files=10)
+    try:
+        assert pool.count(matcher, FILENAMES) == matcher.count(FILENAMES)
+        other = Matcher({'text': ['*.txt']})
+        assert pool.count(other, FILENAMES) == {'text': 300}
+    finally:
+        pool.shutdown()
+
+
+def test_small_batches_in_process():
+    matcher = Matcher(LABELS)
+    pool = MatchPool(matcher, processes=2)
+    assert pool.count(matcher, FILENAMES[:30]) == {'docs': 10, 'code': 10}
+    assert pool._executor is None
+
+
+def test_api_listed_pr_matched_in_workers():
+    # GitHub API lists at most 3000 files of PR
+    github = FakeGitHub([f'docs/file{n}.md' for n in range(3000)])
+    filabel = make_filabel(LABELS, github, match_processes=2,
+                           file_cache=LRUCache())
+    try:
+        assert filabel.plan_pr('o', 'r', make_pr()).future == {'docs'}
+        assert filabel.match_pool._executor is not None
+    finally:
+        filabel.match_pool.shutdown()
+
+
+def test_min_files_configurable():
+    filabel = Filabel('token', LABELS, match_processes=2,
+                      match_min_files=5000)
+    assert filabel.match_pool.min_files == 5000
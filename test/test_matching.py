@@ -0,0 +1,118 @@
+import fnmatch
+
+from fakes import FakeGitHub, make_filabel, make_pr
+from filabel.cache import LRUCache
+from filabel.logic import Change
+from filabel.matching import Matcher
+
+LABELS = {
+    'frontend': ['*/templates/*', 'static/*'],
+    'docs': ['*.md', 'docs/*'],
+    'empty': [],
+}
+
+
+def test_matcher_like_fnmatch():
+    filenames = ['a/templates/x.html', 'static/a.css', 'README.md',
+                 'docs/a/b.rst', 'setup.py', 'templates/x.html']
+    matcher = Matcher(LABELS)
+    for filename in filenames:
+        expected = [label for label, patterns in LABELS.items()
+                    if any(fnmatch.fnmatch(filename, p) for p in patterns)]
+        assert matcher.file_labels(filename) == expected
+
+
+def test_matcher_count():
+    counts = Matcher(LABELS).count(['README.md', 'docs/x', 'static/y'])
+    assert counts == {'docs': 2, 'frontend': 1}
+
+
+def test_digest():
+    assert Matcher(LABELS).digest == Matcher(dict(LABELS)).digest
+    assert Matcher(LABELS).digest != Matcher({'docs': ['*.md']}).digest
+
+
+#: GitHub requests of PR 1: listing files, writing labels, comparing heads
+FILES, WRITE, COMPARE = ('files', 1), ('write', 1), ('compare', 'a', 'b')
+
+
+def test_synchronize_uses_compare():
+    github = FakeGitHub([{'filename': 'README.md', 'status': 'added'}])
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='a'))
+    github.comparison = {'status': 'ahead', 'files': [
+        {'filename': 'README.md', 'status': 'removed'},
+        {'filename': 'static/x', 'status': 'modified'},
+    ]}
+    result = filabel.run_pr('o', 'r', make_pr(head='b'), before='a')
+    assert github.calls == [FILES, WRITE, COMPARE, WRITE]
+    assert result == [('frontend', Change.ADD)]
+
+
+def test_synchronize_without_cache_fetches_all():
+    github = FakeGitHub([{'filename': 'README.md', 'status': 'added'}])
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='b'), before='a')
+    assert github.calls == [FILES, WRITE]
+
+
+def test_force_push_fetches_all():
+    github = FakeGitHub([{'filename': 'README.md', 'status': 'added'}],
+                        {'status': 'diverged', 'files': []})
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='a'))
+    filabel.run_pr('o', 'r', make_pr(head='b'), before='a')
+    assert github.calls == [FILES, WRITE, COMPARE, FILES, WRITE]
+
+
+def test_base_file_removal_still_matches():
+    github = FakeGitHub([{'filename': 'docs/x', 'status': 'modified'}])
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='a'))
+    github.comparison = {'status': 'ahead', 'files': [
+        {'filename': 'docs/x', 'status': 'removed'},
+    ]}
+    filabel.run_pr('o', 'r', make_pr(head='b'), before='a')
+    cached = filabel.file_cache.get(('o', 'r', 1))
+    assert cached.files == {'docs/x': 'removed'}
+    assert cached.labels(filabel.matcher) == {'docs'}
+
+
+def test_merged_base_fetches_all():
+    github = FakeGitHub([{'filename': 'README.md', 'status': 'added'}])
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='a'))
+    # "Update branch" merges base, its files are not changed by the PR
+    github.comparison = {'status': 'ahead', 'total_commits': 1, 'commits': [
+        {'sha': 'b', 'parents': [{'sha': 'a'}, {'sha': 'base2'}]},
+    ], 'files': [{'filename': 'static/x', 'status': 'modified'}]}
+    result = filabel.run_pr('o', 'r', make_pr(head='b', base='base2'),
+                            before='a')
+    assert github.calls == [FILES, WRITE, FILES, WRITE]
+    assert result == [('docs', Change.ADD)]
+
+
+def test_merge_commit_fetches_all():
+    github = FakeGitHub([{'filename': 'README.md', 'status': 'added'}])
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='a'))
+    github.comparison = {'status': 'ahead', 'total_commits': 2, 'commits': [
+        {'sha': 'm', 'parents': [{'sha': 'a'}, {'sha': 'b1'}]},
+        {'sha': 'b', 'parents': [{'sha': 'm'}]},
+    ], 'files': [{'filename': 'static/x', 'status': 'modified'}]}
+    result = filabel.run_pr('o', 'r', make_pr(head='b'), before='a')
+    assert github.calls == [FILES, WRITE, COMPARE, FILES, WRITE]
+    assert result == [('docs', Change.ADD)]
+    assert filabel.file_cache.get(('o', 'r', 1)).files == \
+        {'README.md': 'added'}
+
+
+def test_truncated_commits_fetch_all():
+    github = FakeGitHub([{'filename': 'README.md', 'status': 'added'}])
+    filabel = make_filabel(LABELS, github, file_cache=LRUCache())
+    filabel.run_pr('o', 'r', make_pr(head='a'))
+    github.comparison = {'status': 'ahead', 'total_commits': 300,
+                         'commits': [{'sha': 'b', 'parents': [{'sha': 'a'}]}],
+                         'files': []}
+    filabel.run_pr('o', 'r', make_pr(head='b'), before='a')
+    assert github.calls == [FILES, WRITE, COMPARE, FILES, WRITE]
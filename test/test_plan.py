@@ -0,0 +1,75 @@
+import io
+
+from click.testing import CliRunner
+
+from fakes import make_filabel, make_pr
+from filabel.cli import cli
+from filabel.logic import Change, LabelPlan
+from filabel.plan import PlanWriter, apply_plans, read_plans
+
+
+LABELS = {'docs': ['*.md'], 'code': ['*.py']}
+
+
+def test_plan_does_not_write():
+    filabel = make_filabel(LABELS)
+    out = io.StringIO()
+    prs = [make_pr(1, labels=['code']), make_pr(2, labels=['docs'])]
+    report = filabel.run_prs('o/r', prs, PlanWriter(out))
+    assert filabel.github.writes == []
+    assert report.prs['https://github.com/o/r/1'] == [
+        ('code', Change.DELETE), ('docs', Change.ADD)
+    ]
+    plans = list(read_plans(io.StringIO(out.getvalue())))
+    assert [p.number for p in plans] == [1, 2]
+    assert plans[0].future == {'docs'}
+    assert plans[0].existing == {'code'}
+
+
+def test_apply_writes_only_changes():
+    filabel = make_filabel(LABELS)
+    plans = [
+        LabelPlan('o/r', 1, 'u1', {'code'}, {'docs'},
+                  [('code', Change.DELETE), ('docs', Change.ADD)]),
+        LabelPlan('o/r', 2, 'u2', {'docs'}, {'docs'},
+                  [('docs', Change.NONE)]),
+        LabelPlan('o/s', 3, 'u3', set(), {'docs'}, [('docs', Change.ADD)]),
+    ]
+    filabel.github.labels = {1: {'code'}, 2: {'docs'}, 3: set()}
+    reports = apply_plans(filabel, plans, workers=2)
+    assert sorted(filabel.github.writes) == [
+        ('o/r', 1, '+', ['docs']), ('o/r', 1, '-', ['code']),
+        ('o/s', 3, '+', ['docs']),
+    ]
+    assert [r.repo for r in reports] == ['o/r', 'o/s']
+    assert reports[0].prs == {'u1': plans[0].changes, 'u2': plans[1].changes}
+
+
+def test_apply_keeps_labels_changed_since_planning():
+    filabel = make_filabel(LABELS)
+    plan = LabelPlan('o/r', 1, 'u1', {'code', 'wip'}, {'docs', 'wip'},
+                     [('code', Change.DELETE), ('docs', Change.ADD)])
+    # someone removed "wip" and added "urgent" after planning
+    filabel.github.labels = {1: {'code', 'urgent'}}
+    reports = apply_plans(filabel, [plan])
+    assert filabel.github.labels == {1: {'docs', 'urgent'}}
+    assert reports[0].prs == {'u1': plan.changes}
+
+
+def test_apply_deleted_label_already_gone():
+    filabel = make_filabel(LABELS)
+    plan = LabelPlan('o/r', 1, 'u1', {'code'}, set(),
+                     [('code', Change.DELETE)])
+    filabel.github.labels = {1: {'other'}}
+    reports = apply_plans(filabel, [plan])
+    assert reports[0].prs == {'u1': plan.changes}
+    assert filabel.github.labels == {1: {'other'}}
+
+
+def test_plan_and_apply_not_combined(tmp_path):
+    plans = tmp_path / 'plans.jsonl'
+    plans.write_text('')
+    result = CliRunner().invoke(cli, ['--plan', str(tmp_path / 'new.jsonl'),
+                                      '--apply', str(plans)])
+    assert result.exit_code == 2
+    assert '--plan cannot be combined with --apply' in result.output
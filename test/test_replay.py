@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import json
+
+import filabel
+from filabel.replay import (DeliveryRecorder, StubGitHubAdapter, app_sender,
+                            percentile, read_deliveries, repeat_deliveries,
+                            replay)
+
+SECRET = 'sekrit'
+
+
+def _app(tmp_path, monkeypatch, **kwargs):
+    cfg = tmp_path / 'filabel.cfg'
+    record = tmp_path / 'deliveries-{pid}.jsonl.gz'
+    cfg.write_text(f'[github]\ntoken={40 * "f"}\nsecret={SECRET}\n'
+                   f'[labels]\ndocs=*.md\n[web]\nrecord={record}\n')
+    monkeypatch.setenv('FILABEL_CONFIG', str(cfg))
+    app = filabel.create_app(None, **kwargs)
+    app.config['TESTING'] = True
+    return app
+
+
+def _ping(n):
+    data = json.dumps({'repository': {'full_name': 'a/b'},
+                       'hook_id': n}).encode()
+    signature = hmac.new(SECRET.encode(), data, hashlib.sha1).hexdigest()
+    return {'X-Hub-Signature': f'sha1={signature}',
+            'X-GitHub-Event': 'ping',
+            'X-GitHub-Delivery': f'delivery-{n}',
+            'Content-Type': 'application/json'}, data
+
+
+def test_record_and_replay(tmp_path, monkeypatch):
+    app = _app(tmp_path, monkeypatch)
+    client = app.test_client()
+    for n in range(5):
+        headers, data = _ping(n)
+        assert client.post('/', data=data, headers=headers).status_code == 200
+    client.post('/', data=b'{}', headers={'X-Hub-Signature': 'sha1=bad',
+                                          'X-GitHub-Event': 'ping'})
+
+    recording, = tmp_path.glob('deliveries-*.jsonl.gz')
+    deliveries = list(read_deliveries(str(recording)))
+    for (headers, data), (expected_headers, expected_data) in zip(
+            deliveries, [_ping(n) for n in range(5)]):
+        assert data == expected_data
+        assert expected_headers.items() <= headers.items()
+    assert len(deliveries) == 5
+
+    result = replay(deliveries, app_sender(app), concurrency=2)
+    summary = result.summary()
+    assert summary['deliveries'] == 5
+    assert summary['errors'] == 0
+    assert summary['statuses'] == {200: 5}
+    assert 0 < summary['p50'] <= summary['p99']
+
+
+def test_repeated_replay_not_skipped_as_duplicates(tmp_path, monkeypatch):
+    app = _app(tmp_path, monkeypatch)
+    client = app.test_client()
+    for n in range(5):
+        headers, data = _ping(n)
+        client.post('/', data=data, headers=headers)
+    recording, = tmp_path.glob('deliveries-*.jsonl.gz')
+    app.config['recorder'] = None  # keep the recording as it is
+    deliveries = app.config['deliveries']
+
+    result = replay(repeat_deliveries(str(recording), 2), app_sender(app))
+    assert result.summary()['statuses'] == {200: 10}
+    assert deliveries.stats() == {'processed': 15, 'duplicates': 0}
+
+    replay(repeat_deliveries(str(recording), 2, keep_ids=True),
+           app_sender(app))
+    assert deliveries.stats() == {'processed': 15, 'duplicates': 10}
+
+
+def _pull_request(n):
+    data = json.dumps({
+        'action': 'opened', 'number': n,
+        'pull_request': {
+            'url': f'https://api.github.com/repos/o/r/pulls/{n}',
+            'number': n, 'labels': [],
+            'head': {'sha': 'h'}, 'base': {'sha': 'b'},
+        },
+    }).encode()
+    signature = hmac.new(SECRET.encode(), data, hashlib.sha1).hexdigest()
+    return {'X-Hub-Signature': f'sha1={signature}',
+            'X-GitHub-Event': 'pull_request',
+            'X-GitHub-Delivery': f'pr-{n}',
+            'Content-Type': 'application/json'}, data
+
+
+def test_in_process_replay_uses_stubbed_github(tmp_path, monkeypatch):
+    adapter = StubGitHubAdapter(latency=0.01)
+    app = _app(tmp_path, monkeypatch, github_adapter=adapter)
+    assert app.config['github_user'].get(wait=5)['login'] == \
+        'filabel-replay'
+    result = replay([_pull_request(n) for n in range(3)], app_sender(app),
+                    concurrency=3)
+    assert result.summary()['statuses'] == {200: 3}
+    assert result.summary()['p50'] >= 0.02  # files and label write
+    assert adapter.requests == 1 + 3 * 2
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+
+def test_replay_reads_deliveries_lazily():
+    read = []
+    lags = []
+
+    def deliveries():
+        for n in range(50):
+            read.append(n)
+            yield _ping(n)
+
+    def send(headers, body):
+        lags.append(len(read) - len(lags))
+        return 200
+
+    assert replay(deliveries(), send, concurrency=2).count == 50
+    assert max(lags) <= 6
+
+
+def test_recording_readable_while_open(tmp_path):
+    path = str(tmp_path / 'deliveries.jsonl.gz')
+    recorder = DeliveryRecorder(path)
+    for n in range(3):
+        recorder.record(*_ping(n))
+        assert len(list(read_deliveries(path))) == n + 1
+    recorder.close()
+    recorder.record(*_ping(3))
+    assert [data for _, data in read_deliveries(path)] == [
+        _ping(n)[1] for n in range(4)
+    ]
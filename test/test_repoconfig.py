@@ -0,0 +1,62 @@
+import base64
+
+from fakes import FakeGitHub
+from filabel.matching import Matcher
+from filabel.repoconfig import RepoConfigs
+
+DEFAULT = Matcher({'default': ['*']})
+
+
+class ContentsGitHub(FakeGitHub):
+    def __init__(self, configs):
+        """
+        configs: dict of reposlug -> content of its configuration file
+        """
+        super().__init__()
+        self.configs = configs
+
+    def contents(self, owner, repo, path, etag=None):
+        self.calls.append((f'{owner}/{repo}', etag))
+        content = self.configs.get(f'{owner}/{repo}')
+        if content is None:
+            return 404, None, None
+        sha = f'sha-{hash(content)}'
+        if etag == sha:
+            return 304, etag, None
+        return 200, sha, {
+            'sha': sha,
+            'content': base64.b64encode(content.encode()).decode(),
+        }
+
+
+CFG = '[labels]\ndocs=\n    *.md\n'
+
+
+def test_repo_config_overrides_default():
+    configs = RepoConfigs(ContentsGitHub({'a/b': CFG}), ttl=0)
+    assert configs.matcher('a', 'b', DEFAULT).labels == {'docs': ['*.md']}
+    assert configs.matcher('a', 'c', DEFAULT) is DEFAULT
+
+
+def test_conditional_request_and_shared_matcher():
+    github = ContentsGitHub({'a/b': CFG, 'a/c': CFG})
+    configs = RepoConfigs(github, ttl=0)
+    first = configs.matcher('a', 'b', DEFAULT)
+    assert configs.matcher('a', 'b', DEFAULT) is first
+    assert configs.matcher('a', 'c', DEFAULT) is first
+    etag = github.calls[0][1]
+    assert github.calls[1] == ('a/b', f'sha-{hash(CFG)}')
+    assert etag is None
+
+
+def test_ttl_avoids_requests():
+    github = ContentsGitHub({'a/b': CFG})
+    configs = RepoConfigs(github, ttl=60)
+    configs.matcher('a', 'b', DEFAULT)
+    configs.matcher('a', 'b', DEFAULT)
+    assert len(github.calls) == 1
+
+
+def test_broken_config_uses_default():
+    configs = RepoConfigs(ContentsGitHub({'a/b': 'nonsense'}), ttl=0)
+    assert configs.matcher('a', 'b', DEFAULT) is DEFAULT
@@ -0,0 +1,44 @@
+import io
+
+from fakes import FakeGitHub
+from filabel.cli import iter_reposlugs
+
+
+class OrgGitHub(FakeGitHub):
+    def __init__(self, repos):
+        super().__init__()
+        self.repos = repos
+        self.consumed = 0
+
+    def org_repos(self, org):
+        for repo in self.repos:
+            self.consumed += 1
+            yield repo
+
+
+REPOS = [
+    {'full_name': 'org/a', 'archived': False, 'open_issues_count': 1},
+    {'full_name': 'org/b', 'archived': True, 'open_issues_count': 1},
+    {'full_name': 'org/c', 'archived': False, 'open_issues_count': 0},
+]
+
+
+def test_org_repos_filtered():
+    slugs = list(iter_reposlugs([], None, 'org', OrgGitHub(REPOS), 'open'))
+    assert slugs == ['org/a']
+
+
+def test_org_repos_closed_keeps_no_issues():
+    slugs = list(iter_reposlugs([], None, 'org', OrgGitHub(REPOS), 'all'))
+    assert slugs == ['org/a', 'org/c']
+
+
+def test_repos_streamed_lazily():
+    github = OrgGitHub(REPOS)
+    slugs = iter_reposlugs(['x/y'], io.StringIO('# c\n\na/b\nbad\n'),
+                           'org', github, 'all')
+    assert next(slugs) == 'x/y'
+    assert next(slugs) == 'a/b'
+    assert github.consumed == 0
+    assert next(slugs) == 'org/a'
+    assert github.consumed == 1
@@ -0,0 +1,107 @@
+import datetime
+import re
+
+from click.testing import CliRunner
+
+from fakes import FakeGitHub, make_filabel
+from filabel.cli import cli
+from filabel.logic import Filabel
+
+UTC = datetime.timezone.utc
+
+
+class SearchGitHub(FakeGitHub):
+    def __init__(self, updated=None, incomplete=False):
+        """
+        updated: optional dict of reposlug -> list of PR update times
+        """
+        super().__init__()
+        self.queries = []
+        self.updated = updated
+        self.incomplete = incomplete
+
+    def _found(self, qualifiers):
+        since, until = None, None
+        for q in qualifiers:
+            m = re.fullmatch(r'updated:(>=)?([^.]+)(?:\.\.(.+))?', q)
+            if m:
+                since = m.group(2)
+                until = m.group(3)
+        repos = [q[len('repo:'):] for q in qualifiers
+                 if q.startswith('repo:')]
+        for reposlug in repos:
+            if self.updated is None:
+                yield reposlug, 1
+                continue
+            for number, time in enumerate(self.updated[reposlug]):
+                time = time.strftime('%Y-%m-%dT%H:%M:%SZ')
+                if (since is None or time >= since) and \
+                        (until is None or time <= until):
+                    yield reposlug, number
+
+    def search_pull_requests(self, qualifiers):
+        self.queries.append(' '.join(['is:pr'] + qualifiers))
+        found = list(self._found(qualifiers))
+        items = [{'number': number, 'labels': [],
+                  'repository_url': 'https://api.github.com/repos/' + r}
+                 for r, number in found]
+        return len(items), self.incomplete, iter(items[:1000])
+
+
+def test_search_qualifiers():
+    filabel = make_filabel({}, SearchGitHub(), state='open', base='master')
+    since = datetime.datetime(2018, 10, 1, 12, 30)
+    assert filabel.search_qualifiers(since) == [
+        'archived:false', 'is:open', 'base:master',
+        'updated:>=2018-10-01T12:30:00Z',
+    ]
+    until = datetime.datetime(2018, 10, 2)
+    assert filabel.search_qualifiers(since, until)[-1] == \
+        'updated:2018-10-01T12:30:00Z..2018-10-02T00:00:00Z'
+
+
+def test_discover_batches_targets():
+    filabel = make_filabel({}, SearchGitHub(), state='all')
+    targets = [f'repo:owner/repository-{n}' for n in range(30)]
+    found = list(filabel.discover(targets))
+    assert [r for r, _ in found] == [t[len('repo:'):] for t in targets]
+    queries = filabel.github.queries
+    assert 1 < len(queries) < 10
+    assert all(len(q) <= Filabel.SEARCH_QUERY_LIMIT for q in queries)
+    assert filabel.incomplete_searches == []
+
+
+def test_discover_splits_queries_over_results_limit():
+    start = datetime.datetime(2020, 1, 1, tzinfo=UTC)
+    updated = {
+        'o/big': [start + datetime.timedelta(minutes=n) for n in range(2500)],
+        'o/small': [start],
+    }
+    filabel = make_filabel({}, SearchGitHub(updated), state='all')
+    # first run without cursor searches all time
+    found = list(filabel.discover(['repo:o/big', 'repo:o/small']))
+    assert sorted((r, pr.number) for r, pr in found) == \
+        [('o/big', n) for n in range(2500)] + [('o/small', 0)]
+    assert filabel.incomplete_searches == []
+
+
+def test_discover_reports_unsplittable_queries():
+    moment = datetime.datetime(2020, 1, 1, tzinfo=UTC)
+    github = SearchGitHub({'o/r': [moment] * 1500})
+    filabel = make_filabel({}, github, state='all')
+    found = list(filabel.discover(['repo:o/r'], since=moment))
+    assert len(found) == 1000
+    assert len(filabel.incomplete_searches) == 1
+
+
+def test_discover_reports_incomplete_results():
+    filabel = make_filabel({}, SearchGitHub(incomplete=True), state='all')
+    assert len(list(filabel.discover(['repo:o/r']))) == 1
+    assert filabel.incomplete_searches == \
+        ['is:pr archived:false repo:o/r']
+
+
+def test_cursor_requires_search(tmp_path):
+    result = CliRunner().invoke(cli, ['--cursor', str(tmp_path / 'cursor')])
+    assert result.exit_code == 2
+    assert '--cursor requires --search' in result.output
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+import pytest
+
+from filabel.logic import Filabel, GitHub
+from filabel.service import Backpressure, CachedGitHubUser, LabelsReloader
+
+
+def _reloader(tmp_path, labels):
+    path = tmp_path / 'labels.cfg'
+    path.write_text(labels)
+    filabel = Filabel('token', {'a': ['a*']})
+    return path, filabel, LabelsReloader(filabel, [str(path)], interval=0)
+
+
+def test_reload_swaps_matcher(tmp_path):
+    path, filabel, reloader = _reloader(tmp_path, '[labels]\na=\n    a*\n')
+    assert not reloader.reload()
+    assert reloader.version == 1
+    old = filabel.matcher
+    path.write_text('[labels]\nb=\n    b*\n')
+    assert reloader.reload()
+    assert reloader.version == 2
+    assert old.labels == {'a': ['a*']}
+    assert filabel.labels == {'b': ['b*']}
+
+
+def test_reload_keeps_config_if_broken(tmp_path):
+    path, filabel, reloader = _reloader(tmp_path, '[nolabels]\n')
+    assert not reloader.reload()
+    assert reloader.error is not None
+    assert reloader.version == 1
+    assert filabel.labels == {'a': ['a*']}
+
+
+def _in_child(function):
+    """
+    Run function in forked child, returns its exit code
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(function())
+        finally:
+            os._exit(2)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+class SlowGitHub:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def user(self):
+        self.release.wait()
+        return {'login': 'someone'}
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_cached_user_fetched_in_forked_child():
+    github = SlowGitHub()
+    user = CachedGitHubUser(github)
+    user.refresh()  # thread of parent is not inherited by child
+    assert user.pending
+
+    def child():
+        github.release.set()
+        return 0 if user.get(wait=5) == {'login': 'someone'} else 1
+
+    try:
+        assert _in_child(child) == 0
+    finally:
+        github.release.set()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_reloader_watches_in_forked_child(tmp_path):
+    path, filabel, reloader = _reloader(tmp_path, '[labels]\na=\n    a*\n')
+    reloader.interval = 0.05
+    reloader.start(sighup=False)
+
+    def child():
+        reloader.ensure_running()
+        time.sleep(0.1)
+        path.write_text('[labels]\nb=\n    b*\n')
+        os.utime(path, ns=(0, 0))  # mtime surely differs
+        for _ in range(100):
+            if filabel.labels == {'b': ['b*']}:
+                return 0
+            time.sleep(0.05)
+        return 1
+
+    assert _in_child(child) == 0
+
+
+def test_backpressure_limits_in_flight():
+    backpressure = Backpressure(GitHub('token'), max_in_flight=2)
+    assert backpressure.enter()
+    assert backpressure.enter()
+    assert not backpressure.enter()
+    assert backpressure.problems()
+    backpressure.exit()
+    assert backpressure.enter()
+    assert backpressure.stats()['shed'] == 1
+    assert backpressure.stats()['pid'] == os.getpid()
+
+
+def test_backpressure_rate_limit():
+    github = GitHub('token')
+    backpressure = Backpressure(github, min_rate_remaining=10,
+                                retry_after=30)
+    github.rate_remaining = 5
+    github.rate_reset = time.time() + 600
+    assert not backpressure.enter()
+    assert backpressure.wait_time() > 500
+    github.rate_reset = time.time() - 1  # window already reset
+    assert backpressure.enter()
+
+
+def test_failing_github_is_not_ready_but_admitted():
+    github = GitHub('token')
+    backpressure = Backpressure(github, stale_after=60)
+    assert backpressure.stats()['ready']
+    github.last_success = time.time() - 120
+    github.last_failure = time.time()
+    assert not backpressure.stats()['ready']
+    assert backpressure.enter()
+    github.last_success = time.time()
+    assert backpressure.stats()['ready']
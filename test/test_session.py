@@ -0,0 +1,58 @@
+import gc
+import os
+import threading
+
+from filabel.logic import GitHub
+
+
+def test_session_per_thread():
+    github = GitHub('token')
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(github.session))
+    thread.start()
+    thread.join()
+    assert github.session is github.session
+    assert github.session is not sessions[0]
+    assert sessions[0].headers['User-Agent'] == 'filabel'
+
+
+def test_session_recreated_after_fork():
+    github = GitHub('token')
+    parent_session = github.session
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        fresh = github.session is not parent_session
+        os.write(write, b'1' if fresh else b'0')
+        os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'1'
+    assert github.session is parent_session
+
+
+def test_session_stats():
+    github = GitHub('token')
+    github.session
+    stats = github.sessions.stats()
+    assert stats['pid'] == os.getpid()
+    assert stats['sessions'] == 1
+    assert stats['requests'] == 0
+
+
+def test_session_closed_when_thread_ends():
+    github = GitHub('token')
+    adapters = []
+
+    def use():
+        adapter = github.session.get_adapter('https://api.github.com')
+        adapter.poolmanager.connection_from_url('https://api.github.com')
+        adapters.append(adapter)
+
+    thread = threading.Thread(target=use)
+    thread.start()
+    thread.join()
+    gc.collect()
+    assert len(adapters[0].poolmanager.pools) == 0
+    assert github.sessions.stats()['sessions'] == 0
@@ -0,0 +1,54 @@
+import io
+
+from click.testing import CliRunner
+
+from filabel.cli import ReportOutput, cli, merge_reports, read_reports
+from filabel.logic import Change, Report
+from filabel.utils import Shard
+
+
+def test_shards_partition():
+    shards = [Shard(i, 4) for i in range(1, 5)]
+    repos = [f'owner/repo{n}' for n in range(200)]
+    for repo in repos:
+        assert sum(repo in shard for shard in shards) == 1
+    assert all(20 < sum(r in shard for r in repos) < 80 for shard in shards)
+
+
+def test_shard_stable_and_case_insensitive():
+    assert ('Owner/Repo' in Shard(2, 3)) == ('owner/repo' in Shard(2, 3))
+
+
+def _report(repo, *numbers, ok=True):
+    report = Report(repo)
+    report.ok = ok
+    for n in numbers:
+        report.prs[f'https://github.com/{repo}/pull/{n}'] = [('a', Change.ADD)]
+    return report
+
+
+def test_merge_reports_roundtrip():
+    files = []
+    for reports in ([_report('o/a', 5, 2), _report('o/b', 1)],
+                    [_report('o/a', 4, 1), _report('o/c', ok=False)]):
+        out = io.StringIO()
+        output = ReportOutput(out)
+        for report in reports:
+            output(report)
+        files.append(io.StringIO(out.getvalue()))
+    merged = merge_reports(r for f in files for r in read_reports(f))
+    assert [r.repo for r in merged] == ['o/a', 'o/b', 'o/c']
+    assert [url[-1] for url in merged[0].prs] == ['5', '4', '2', '1']
+    assert merged[0].prs['https://github.com/o/a/pull/4'] == [
+        ('a', Change.ADD)
+    ]
+    assert not merged[2].ok
+
+
+def test_merge_reports_subcommand(tmp_path):
+    path = tmp_path / 'shard.jsonl'
+    with open(path, 'w') as f:
+        ReportOutput(f)(_report('o/a', 1))
+    result = CliRunner().invoke(cli, ['merge-reports', str(path)])
+    assert result.exit_code == 0
+    assert result.output.startswith('REPO o/a - OK\n')
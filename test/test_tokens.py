@@ -0,0 +1,123 @@
+import requests
+
+from fakes import FakeSession
+from filabel.logic import GitHub
+from filabel.tokens import TokenPool
+from filabel.utils import parse_tokens
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_tokens():
+    assert parse_tokens('\na\n  b\n') == ['a', 'b']
+    assert parse_tokens('a') == ['a']
+
+
+def test_choose_most_remaining():
+    pool = TokenPool(['a', 'b', 'c'], clock=Clock())
+    assert pool.choose() == 'a'  # unknown ones first
+    pool.update('a', 100, 2000)
+    assert pool.choose() == 'b'
+    pool.update('b', 300, 2000)
+    pool.update('c', 200, 2000)
+    assert pool.choose() == 'b'
+    assert pool.headroom() == (299, 2000)
+
+
+def test_throttled_token_set_aside():
+    clock = Clock()
+    pool = TokenPool(['a', 'b'], clock=clock)
+    pool.update('a', 500, 2000)
+    pool.update('b', 10, 2000)
+    pool.throttle('a', 1500)
+    assert pool.choose() == 'b'
+    pool.throttle('b', 1200)
+    assert pool.available() == []
+    assert pool.choose() == 'b'  # released first
+    clock.now = 1600
+    assert pool.choose() == 'a'
+
+
+def test_window_reset_makes_token_fresh():
+    clock = Clock()
+    pool = TokenPool(['a', 'b'], clock=clock)
+    pool.update('a', 0, 1100)
+    pool.update('b', 50, 5000)
+    assert pool.choose() == 'b'
+    clock.now = 1200
+    assert pool.choose() == 'a'
+
+
+def test_throttled_request_retried_with_other_token():
+    session = FakeSession(throttled=('a',))
+    github = GitHub(['a', 'b'], session=session)
+    assert github.user() == {'login': 'me'}
+    assert session.tokens == ['a', 'b']
+    assert github.user() == {'login': 'me'}
+    assert session.tokens == ['a', 'b', 'b']
+    assert github.rate_remaining == 4000
+
+
+class SearchLimitedSession:
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, timeout=None, headers=None, **kwargs):
+        token = headers['Authorization'].split()[1]
+        search = '/search/' in url
+        self.requests.append(('search' if search else 'core', token))
+        r = requests.Response()
+        r.headers['X-RateLimit-Resource'] = 'search' if search else 'core'
+        r.headers['X-RateLimit-Reset'] = '9999999999'
+        if search and token == 'a':
+            r.status_code = 403
+            r._content = b'{"message": "secondary rate limit"}'
+            r.headers['X-RateLimit-Remaining'] = '29'
+            r.headers['Retry-After'] = '60'
+        else:
+            r.status_code = 200
+            r._content = b'{"login": "me", "items": []}'
+            r.headers['X-RateLimit-Remaining'] = '29' if search else '4000'
+        return r
+
+
+def test_search_limit_throttles_token_for_search_only():
+    session = SearchLimitedSession()
+    github = GitHub(['a', 'b'], session=session)
+    r = github._request('GET', github.API + '/search/issues')
+    assert r.status_code == 200
+    assert session.requests == [('search', 'a'), ('search', 'b')]
+    assert github.pools['search'].available() == ['b']
+    assert github.tokens.available() == ['a', 'b']
+    assert github.rate_remaining is None  # search limit is not core headroom
+    assert github.user() == {'login': 'me', 'items': []}
+    assert session.requests[-1] == ('core', 'a')  # not set aside for core
+
+
+def test_headroom_of_best_token_in_current_window():
+    clock = Clock()
+    pool = TokenPool(['a', 'b'], clock=clock)
+    pool.update('a', 10, 5000)
+    pool.update('b', 300, 1100)
+    assert pool.headroom() == (300, 1100)
+    clock.now = 1200  # window of b was reset, its requests are unknown
+    assert pool.headroom() == (None, None)
+
+
+def test_endpoint_routed_by_reported_resource():
+    session = FakeSession(b'{}', throttled=('a',), resource='code_search')
+    github = GitHub(['a', 'b'], session=session)
+    url = github.API + '/repos/o/r/contents/x'
+    github._request('GET', url)
+    assert session.tokens == ['a', 'b']
+    assert github.pools['code_search'].available() == ['b']
+    github._request('GET', github.API + '/repos/o/r/contents/y')
+    assert session.tokens == ['a', 'b', 'b']  # a is throttled for it
+    assert github.tokens.available() == ['a', 'b']
+    assert github.rate_remaining is None
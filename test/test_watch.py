@@ -0,0 +1,71 @@
+from fakes import FakeGitHub, make_filabel, make_pr
+from filabel.watch import Watcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class PullsGitHub(FakeGitHub):
+    def __init__(self):
+        super().__init__()
+        self.etag = 'v1'
+        self.probes = []
+
+    def pulls_etag(self, owner, repo, state, base, etag):
+        self.probes.append(etag)
+        if etag == self.etag:
+            return 304, etag
+        return 200, self.etag
+
+    def pull_requests(self, owner, repo, state, base):
+        return [make_pr(head='head', labels=self.labels.get(1, ()))]
+
+    def reset_labels(self, owner, repo, number, labels):
+        self.etag += '+'  # label change updates the PR
+        return super().reset_labels(owner, repo, number, labels)
+
+
+def _watcher():
+    filabel = make_filabel(github=PullsGitHub())
+    filabel.write_unchanged = False
+    reports = []
+    clock = Clock()
+    watcher = Watcher(filabel, ['o/r'], reports.append, interval=10,
+                      max_interval=40, clock=clock)
+    return watcher, filabel.github, reports, clock
+
+
+def test_unchanged_repo_is_polled_less_often():
+    watcher, github, reports, clock = _watcher()
+    assert watcher.run_once() == 10
+    assert len(reports) == 1 and github.writes == [('o/r', 1, '=', ['docs'])]
+    intervals = []
+    for _ in range(5):
+        clock.now += watcher.run_once()
+        intervals.append(watcher.repos[0].interval)
+    # own label write is seen once, then nothing changes
+    assert intervals == [10, 10, 20, 40, 40]
+    assert len(reports) == 2 and github.writes == [('o/r', 1, '=', ['docs'])]
+
+
+def test_change_shortens_interval():
+    watcher, github, reports, clock = _watcher()
+    for _ in range(4):
+        clock.now += watcher.run_once()
+    assert watcher.repos[0].interval == 40
+    github.etag = 'v2'
+    clock.now += watcher.run_once()
+    assert watcher.repos[0].interval == 20
+    assert len(reports) == 3
+
+
+def test_stop():
+    watcher, github, reports, clock = _watcher()
+    watcher.stop()
+    watcher.run(handle_signals=False)
+    assert github.probes == []
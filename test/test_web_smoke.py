@@ -1,12 +1,18 @@
 import flask
+import pytest
 
+from asgi_client import client_for
 from helper import env, config, user
 
 config_env = f'{config("auth.real.cfg")}:{config("labels.empty.cfg")}'
 
+apps = pytest.mark.parametrize('kind', ['wsgi', 'asgi'])
 
-def _import_app():
+
+def _import_app(kind='wsgi'):
     import filabel
+    if kind == 'asgi':
+        return filabel.create_asgi_app(None)
     if hasattr(filabel, 'app'):
         return filabel.app
     elif hasattr(filabel, 'create_app'):
@@ -21,10 +27,10 @@ def _import_app():
         )
 
 
-def _test_app():
-    app = _import_app()
+def _test_app(kind='wsgi'):
+    app = _import_app(kind)
     app.config['TESTING'] = True
-    return app.test_client()
+    return client_for(app)
 
 
 def test_app_imports():
@@ -33,9 +39,16 @@ def test_app_imports():
         assert isinstance(app, flask.Flask)
 
 
-def test_app_get_has_username():
+def test_asgi_app_imports():
+    from filabel.asgi import AsyncApp
+    with env(FILABEL_CONFIG=config_env):
+        assert isinstance(_import_app('asgi'), AsyncApp)
+
+
+@apps
+def test_app_get_has_username(kind):
     with env(FILABEL_CONFIG=config_env):
-        app = _test_app()
+        app = _test_app(kind)
         assert user in app.get('/').get_data(as_text=True)
 
 
@@ -69,18 +82,20 @@ PING = {
 }
 
 
-def test_ping_pongs():
+@apps
+def test_ping_pongs(kind):
     with env(FILABEL_CONFIG=config_env):
-        app = _test_app()
+        app = _test_app(kind)
         rv = app.post('/', json=PING, headers={
             'X-Hub-Signature': 'sha1=7528bd9a5b9d6546b0c221cacacc4207bdd4a51a',
             'X-GitHub-Event': 'ping'})
         assert rv.status_code == 200
 
 
-def test_bad_secret():
+@apps
+def test_bad_secret(kind):
     with env(FILABEL_CONFIG=config_env):
-        app = _test_app()
+        app = _test_app(kind)
         rv = app.post('/', json=PING, headers={
             'X-Hub-Signature': 'sha1=1cacacc4207bdd4a51a7528bd9a5b9d6546b0c22',
             'X-GitHub-Event': 'ping'})
@@ -0,0 +1,106 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+
+import filabel
+from asgi_client import client_for
+from filabel.replay import DeliveryRecorder, read_deliveries
+
+SECRET = 'sekrit'
+
+
+@pytest.fixture(params=['create_app', 'create_asgi_app'])
+def client(request, tmp_path, monkeypatch):
+    cfg = tmp_path / 'filabel.cfg'
+    cfg.write_text(f'[github]\ntoken={40 * "f"}\nsecret={SECRET}\n'
+                   '[labels]\n[web]\nmax_payload=1024\n')
+    monkeypatch.setenv('FILABEL_CONFIG', str(cfg))
+    app = getattr(filabel, request.param)(None)
+    app.config['TESTING'] = True
+    return client_for(app)
+
+
+def _post(client, data, event='ping', secret=SECRET, delivery=None):
+    signature = 'sha1=' + hmac.new(secret.encode(), data,
+                                   hashlib.sha1).hexdigest()
+    headers = {'X-Hub-Signature': signature, 'X-GitHub-Event': event}
+    if delivery is not None:
+        headers['X-GitHub-Delivery'] = delivery
+    return client.post('/', data=data, content_type='application/json',
+                       headers=headers)
+
+
+def test_ping(client):
+    data = json.dumps({'repository': {'full_name': 'a/b'},
+                       'hook_id': 1}).encode()
+    assert _post(client, data).status_code == 200
+
+
+def test_bad_signature_not_parsed(client):
+    rv = _post(client, b'{not json', secret='other')
+    assert rv.status_code == 401
+
+
+def test_too_large_rejected_before_signature(client):
+    rv = _post(client, b'{"zen": "' + 2048 * b'x' + b'"}', secret='other')
+    assert rv.status_code == 413
+
+
+def test_invalid_json(client):
+    assert _post(client, b'{not json').status_code == 400
+
+
+def test_duplicate_delivery_skipped(client):
+    data = json.dumps({'repository': {'full_name': 'a/b'},
+                       'hook_id': 1}).encode()
+    assert _post(client, data, delivery='d1').data == b'PONG'
+    rv = _post(client, data, delivery='d1')
+    assert rv.status_code == 200
+    assert rv.data != b'PONG'
+    assert _post(client, data, delivery='d2').data == b'PONG'
+    stats = client.application.config['deliveries'].stats()
+    assert stats == {'processed': 2, 'duplicates': 1}
+
+
+def test_healthz(client):
+    assert client.get('/healthz').status_code == 200
+
+
+def test_overloaded_refused_with_retry_after(client):
+    backpressure = client.application.config['backpressure']
+    backpressure.in_flight = backpressure.max_in_flight
+    data = json.dumps({'repository': {'full_name': 'a/b'},
+                       'hook_id': 1}).encode()
+    rv = _post(client, data)
+    assert rv.status_code == 503
+    assert int(rv.headers['Retry-After']) > 0
+    rv = client.get('/readyz')
+    assert rv.status_code == 503
+    assert not rv.get_json()['ready']
+    backpressure.in_flight = 0
+    assert _post(client, data).status_code == 200
+
+
+def test_no_job_budget_by_default(client):
+    # GitHub does not redeliver, PRs aborted by budget would stay unlabeled
+    assert client.application.config['job_budget'] == 0
+
+
+def test_delivery_recorded_with_headers(client, tmp_path):
+    path = tmp_path / 'deliveries.jsonl.gz'
+    client.application.config['recorder'] = DeliveryRecorder(str(path))
+    data = json.dumps({'repository': {'full_name': 'a/b'},
+                       'hook_id': 1}).encode()
+    assert _post(client, data, delivery='d1').status_code == 200
+    [(headers, body)] = read_deliveries(str(path))
+    assert headers['X-GitHub-Event'] == 'ping'
+    assert headers['X-GitHub-Delivery'] == 'd1'
+    assert body == data
+
+
+def test_static_content_type(client):
+    rv = client.get('/static/style.css')
+    assert rv.status_code == 200
+    assert rv.headers['Content-Type'].startswith('text/css')